@@ -0,0 +1,199 @@
+"""
+Admission control for local inference, shared by every router process.
+
+Each concurrent local generation needs one of MAX_CONCURRENCY slots: slot files in
+ADMISSION_DIR held with an exclusive flock, so a crashed holder frees its slot
+automatically. Waiters queue as ticket files named <priority rank>-<time>-<pid>-<n>;
+only the first MAX_CONCURRENCY live tickets may try for a slot, so interactive
+requests go ahead of batch ones and equal priorities are served in arrival order.
+A waiter whose estimated or actual wait exceeds its deadline gives up, and the
+router sends the prompt to the cloud instead.
+
+With a backend pool every node gets its own queue (a subdirectory named after the
+node) with the node's capacity as its slot count.
+"""
+import os
+import time
+import fcntl
+import itertools
+import threading
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+ADMISSION_DIR = os.path.join(GLOBAL_CONFIG_DIR, "admission")
+
+MAX_CONCURRENCY = max(1, (os.cpu_count() or 2) // 2)
+PRIORITIES = ("interactive", "batch") # Served in this order
+MAX_WAIT_SECONDS = {"interactive": 10, "batch": 300}
+POLL_INTERVAL = 0.05
+
+_tickets = itertools.count()
+_tickets_lock = threading.Lock()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _queue_dir(node):
+    return os.path.join(ADMISSION_DIR, node) if node else ADMISSION_DIR
+
+def _slot_path(directory, index):
+    return os.path.join(directory, f"slot-{index}.lock")
+
+class Slot:
+    """A held local-inference slot. The holder's pid and start time are in the file for snapshot()."""
+    def __init__(self, index, fd, waited):
+        self.index = index
+        self.fd = fd
+        self.waited = waited
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            os.ftruncate(self.fd, 0)
+        except OSError:
+            pass
+        os.close(self.fd) # Closing drops the flock
+        self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def _try_slot(directory, capacity, waited):
+    for index in range(capacity):
+        fd = os.open(_slot_path(directory, index), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()} {time.time()}".encode())
+        return Slot(index, fd, waited)
+    return None
+
+def _live_tickets(directory):
+    """Queued tickets in service order; tickets of dead processes are removed."""
+    tickets = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return tickets
+    for name in names:
+        if not name.endswith(".ticket"):
+            continue
+        try:
+            pid = int(name.split("-")[2])
+        except (IndexError, ValueError):
+            continue
+        if _pid_alive(pid):
+            tickets.append(name)
+        else:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
+    return tickets
+
+def _busy_slots(directory, capacity):
+    busy = []
+    for index in range(capacity):
+        try:
+            with open(_slot_path(directory, index), "r") as f:
+                pid, started = f.read().split()
+        except (OSError, ValueError):
+            continue
+        if _pid_alive(int(pid)):
+            busy.append(float(started))
+    return busy
+
+def estimate_wait(position, service_time, capacity=None):
+    """Expected queueing delay with `position` requests ahead, each taking service_time seconds."""
+    capacity = capacity or MAX_CONCURRENCY
+    if service_time is None or position < capacity:
+        return 0
+    return (position - capacity) // capacity * service_time + service_time
+
+def acquire(priority="interactive", max_wait=None, service_time=None, node=None, capacity=None):
+    """
+    Waits for a local slot (on `node`'s queue with `capacity` slots, for a backend pool).
+    Returns (slot, waited, None) or (None, waited, reason) when the estimated wait
+    (service_time per request ahead) or the actual wait exceeds max_wait.
+    """
+    max_wait = MAX_WAIT_SECONDS.get(priority, MAX_WAIT_SECONDS["interactive"]) if max_wait is None else max_wait
+    directory = _queue_dir(node)
+    capacity = capacity or MAX_CONCURRENCY
+    os.makedirs(directory, exist_ok=True)
+    start = time.time()
+
+    # Fast path: nobody queued and a slot free
+    if not _live_tickets(directory):
+        slot = _try_slot(directory, capacity, 0)
+        if slot is not None:
+            return slot, 0, None
+
+    rank = PRIORITIES.index(priority) if priority in PRIORITIES else len(PRIORITIES)
+    with _tickets_lock:
+        ticket = f"{rank}-{time.time_ns():020d}-{os.getpid()}-{next(_tickets)}.ticket"
+    ticket_path = os.path.join(directory, ticket)
+    open(ticket_path, "w").close()
+    try:
+        checked_estimate = False
+        while True:
+            tickets = _live_tickets(directory)
+            position = tickets.index(ticket) if ticket in tickets else 0
+            if not checked_estimate:
+                checked_estimate = True
+                ahead = position + len(_busy_slots(directory, capacity))
+                expected = estimate_wait(ahead, service_time, capacity)
+                if expected > max_wait:
+                    return None, 0, f"expected queue wait {expected:.0f}s exceeds {max_wait}s ({ahead} ahead)"
+            waited = time.time() - start
+            if position < capacity:
+                slot = _try_slot(directory, capacity, waited)
+                if slot is not None:
+                    return slot, waited, None
+            if waited >= max_wait:
+                return None, waited, f"waited {waited:.0f}s for a local slot"
+            time.sleep(POLL_INTERVAL)
+    finally:
+        try:
+            os.unlink(ticket_path)
+        except OSError:
+            pass
+
+def outstanding(node=None, capacity=None):
+    """Requests running or queued on a queue, for least-loaded balancing."""
+    directory = _queue_dir(node)
+    return len(_busy_slots(directory, capacity or MAX_CONCURRENCY)) + len(_live_tickets(directory))
+
+def snapshot(now=None, node=None, capacity=None):
+    """Live queue state for the dashboard: slots, busy slots, waiting tickets by priority, oldest wait."""
+    now = time.time() if now is None else now
+    directory = _queue_dir(node)
+    capacity = capacity or MAX_CONCURRENCY
+    waiting = {p: 0 for p in PRIORITIES}
+    oldest = None
+    for name in _live_tickets(directory):
+        rank, ns = name.split("-")[:2]
+        priority = PRIORITIES[int(rank)] if int(rank) < len(PRIORITIES) else "other"
+        waiting[priority] = waiting.get(priority, 0) + 1
+        queued_at = int(ns) / 1e9
+        oldest = queued_at if oldest is None else min(oldest, queued_at)
+    busy = _busy_slots(directory, capacity)
+    return {
+        "slots": capacity,
+        "busy": len(busy),
+        "waiting": waiting,
+        "oldest_wait": round(now - oldest, 3) if oldest is not None else 0,
+        "longest_running": round(now - min(busy), 3) if busy else 0,
+    }
@@ -1,19 +1,42 @@
 import sys
+
+if __name__ == "__main__" and "--log-only" in sys.argv[1:]:
+    # Logging a finished task needs none of the routing machinery below (see fast_log.py)
+    import fast_log
+    _code = fast_log.main(sys.argv[1:])
+    if _code is not None:
+        sys.exit(_code)
+
 import json
-import requests
-import re
 import datetime
 import os
 import time
+import socket
 import subprocess
+import io
+import copy
 import argparse
-import fcntl
+import threading
+
+import stats_journal
+import response_cache
+import health_state
+import task_classifier
+import model_warmup
+import host_load
+import admission
+import pipeline
+import backend_pool
+import session_store
+import tracing
+import fast_log
 
 # Configuration Loader - Globalized
 HOME_DIR = os.path.expanduser("~")
 GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
 CONFIG_FILE = os.path.join(GLOBAL_CONFIG_DIR, "antigravity_config.json")
 STATS_FILE = os.path.join(GLOBAL_CONFIG_DIR, "usage_stats.json")
+DAEMON_SOCKET = os.path.join(GLOBAL_CONFIG_DIR, "router.sock")
 
 if not os.path.exists(GLOBAL_CONFIG_DIR):
     os.makedirs(GLOBAL_CONFIG_DIR)
@@ -23,143 +46,341 @@ def load_config():
         with open(CONFIG_FILE, "r") as f:
             return json.load(f)
     except Exception as e:
-        print(f"[!] Error loading config: {e}. Using defaults.")
+        print(f"[!] Error loading config: {e}. Using defaults.", file=sys.stderr)
         return {}
 
+_config_t0 = time.perf_counter()
 CONFIG = load_config()
+# The first traced request of a CLI process shows the config load it paid for
+_startup = {"config_load": (_config_t0, time.perf_counter())}
+SERVED_BY = "cli" # "daemon" once serve_daemon() runs; recorded on every trace
 INFERENCE = CONFIG.get("inference", {})
 RELIABILITY = CONFIG.get("reliability", {})
 RULES = CONFIG.get("routing_rules", {})
+DAEMON = CONFIG.get("daemon", {})
+STATS = CONFIG.get("stats", {})
+CACHE = CONFIG.get("cache", {})
+BATCH = CONFIG.get("batch", {})
+LOAD = CONFIG.get("load_routing", {})
+HEDGING = CONFIG.get("hedging", {})
+ADMISSION = CONFIG.get("admission", {})
+PIPELINE = CONFIG.get("pipeline", {})
+SESSIONS = CONFIG.get("sessions", {})
+TRACING = CONFIG.get("tracing", {})
 
 LOCAL_API_URL = INFERENCE.get("local_endpoint", "http://localhost:11434/api/generate")
 HEALTH_API_URL = INFERENCE.get("health_endpoint", "http://localhost:11434/api/tags")
 LOCAL_MODEL = INFERENCE.get("local_model", "gemma3:1b")
+CLOUD_MODEL = INFERENCE.get("cloud_model", "gemini-1.5-pro")
 LOCAL_TIMEOUT = INFERENCE.get("timeout_seconds", 25)
 NUM_THREAD = INFERENCE.get("num_thread", 2)
+STREAM_BY_DEFAULT = INFERENCE.get("stream", False)
+FIRST_TOKEN_TIMEOUT = INFERENCE.get("first_token_timeout_seconds", LOCAL_TIMEOUT)
+STALL_TIMEOUT = INFERENCE.get("stall_timeout_seconds", 15)
+KEEP_ALIVE = INFERENCE.get("keep_alive", model_warmup.KEEP_ALIVE) # How long Ollama keeps the model loaded; -1 = forever
+model_warmup.PRELOAD_TIMEOUT = INFERENCE.get("preload_timeout_seconds", model_warmup.PRELOAD_TIMEOUT)
+# A CLI process exits right after its request, taking a background preload with it: without a
+# running watchdog to hand the preload to, self-healing waits this long for the preload.
+PRELOAD_CLI_WAIT = INFERENCE.get("preload_cli_wait_seconds", 5)
+
+# Load-aware routing: skip local when the host is thrashing or the predicted latency
+# exceeds the budget, and size local timeouts from the prediction (see host_load.py)
+LOAD_ROUTING = LOAD.get("enabled", True)
+LATENCY_BUDGET = LOAD.get("latency_budget_seconds", LOCAL_TIMEOUT)
+host_load.MIN_MEM_AVAILABLE_RATIO = LOAD.get("min_mem_available_ratio", host_load.MIN_MEM_AVAILABLE_RATIO)
+host_load.MAX_SWAP_PAGES_PER_SECOND = LOAD.get("max_swap_pages_per_second", host_load.MAX_SWAP_PAGES_PER_SECOND)
+host_load.TIMEOUT_MARGIN = LOAD.get("timeout_margin", host_load.TIMEOUT_MARGIN)
+host_load.MIN_TIMEOUT_SECONDS = LOAD.get("min_timeout_seconds", host_load.MIN_TIMEOUT_SECONDS)
+
+# Hedged requests (opt-in): if the local first token is later than HEDGE_PERCENTILE of
+# recent first-token times, race the cloud against it and take whichever answers first
+HEDGE_BY_DEFAULT = HEDGING.get("enabled", False)
+HEDGE_PERCENTILE = HEDGING.get("percentile", 0.9)
+HEDGE_MIN_SAMPLES = HEDGING.get("min_samples", 5)
+HEDGE_DEFAULT_DELAY = HEDGING.get("default_delay_seconds", 2.0)
+HEDGE_MIN_DELAY = HEDGING.get("min_delay_seconds", 0.5)
+
+# Cross-process cap on concurrent local generations (see admission.py)
+admission.MAX_CONCURRENCY = ADMISSION.get("max_local_concurrency", admission.MAX_CONCURRENCY)
+admission.MAX_WAIT_SECONDS = dict(admission.MAX_WAIT_SECONDS, **ADMISSION.get("max_wait_seconds", {}))
+
+# Local backend pool (inference.pool): several Ollama endpoints/models, balanced by load,
+# each with its own admission queue and circuit breaker (see backend_pool.py). Without
+# one, local_endpoint/local_model is the only node and behaves as before.
+POOL = backend_pool.load_pool(INFERENCE, LOCAL_API_URL, LOCAL_MODEL)
+backend_pool.SATURATION = INFERENCE.get("pool_saturation", backend_pool.SATURATION)
+
+# Multi-turn sessions (--session ID) keep Ollama's context between calls (see session_store.py)
+session_store.IDLE_SECONDS = SESSIONS.get("idle_seconds", session_store.IDLE_SECONDS)
+session_store.MAX_SESSIONS = SESSIONS.get("max_sessions", session_store.MAX_SESSIONS)
+session_store.MAX_BYTES = SESSIONS.get("max_bytes", session_store.MAX_BYTES)
+
+# Map-reduce pipeline for long files (--pipeline). Chunk summaries are cached by content
+# hash (even with the response cache off, since they can't go stale); by default they
+# never expire (the cache's max_bytes LRU bound still applies).
+pipeline.CHUNK_TOKENS = PIPELINE.get("chunk_tokens", pipeline.CHUNK_TOKENS)
+PIPELINE_CACHE = PIPELINE.get("cache", True)
+PIPELINE_CACHE_TTL = PIPELINE.get("cache_ttl_seconds", 0)
+# The map instruction doesn't name the task, so chunk summaries are reused whatever is asked
+MAP_PROMPT = ("Summarize the following excerpt. Keep names, numbers, error messages, identifiers "
+              "and other specifics.")
+REDUCE_PROMPT = ("Combine these partial summaries (they are in order) into one summary. Keep names, numbers, "
+                 "error messages and anything needed for this task: {task}")
 
 CIRCUIT_BREAKER_FAIL_THRESHOLD = RELIABILITY.get("circuit_breaker_threshold", 2)
 CIRCUIT_BREAKER_COOLDOWN = RELIABILITY.get("circuit_breaker_cooldown", 300)
+health_state.MAX_AGE_SECONDS = RELIABILITY.get("health_max_age_seconds", health_state.MAX_AGE_SECONDS)
 
-# Moved to Configuration Loader section
+stats_journal.FSYNC = STATS.get("journal_fsync", stats_journal.FSYNC)
+stats_journal.COMPACT_THRESHOLD_BYTES = STATS.get("compact_threshold_bytes", stats_journal.COMPACT_THRESHOLD_BYTES)
+stats_journal.METRICS = STATS.get("long_term_metrics", stats_journal.METRICS)
+
+tracing.ENABLED = TRACING.get("enabled", tracing.ENABLED)
+tracing.MAX_BYTES = TRACING.get("max_bytes", tracing.MAX_BYTES)
+
+response_cache.ENABLED = CACHE.get("enabled", response_cache.ENABLED)
+response_cache.TTL_SECONDS = CACHE.get("ttl_seconds", response_cache.TTL_SECONDS)
+response_cache.MAX_BYTES = CACHE.get("max_bytes", response_cache.MAX_BYTES)
+
+DAEMON_SOCKET = DAEMON.get("socket_path", DAEMON_SOCKET)
+DAEMON_CONNECT_TIMEOUT = DAEMON.get("connect_timeout", 0.25)
+
+# Shared HTTP session (connection pool). `requests` is imported lazily so the
+# thin daemon client never pays for it.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
 
 def estimate_tokens(text):
     return len(text) // 4
 
-# File Locking Helper
+# Stats Journal Helpers
 def update_stats(modifier_func):
     """
-    Safely updates the stats file using an exclusive lock.
+    Read-modify-write of the full stats snapshot under the journal's exclusive lock.
     modifier_func: A function that takes the current stats dict and modifies it in-place.
+    Hot paths should append journal records instead (see log_usage / log_event).
     """
-    if not os.path.exists(GLOBAL_CONFIG_DIR):
-        os.makedirs(GLOBAL_CONFIG_DIR)
-        
-    # Safe default in case file doesn't exist
-    stats = {
-        "total_local_tokens": 0, 
-        "total_cloud_tokens": 0, 
-        "history": [],
-        "health": "Healthy",
-        "fail_count": 0,
-        "last_fail_time": 0,
-        "events": []
-    }
+    try:
+        with tracing.span("stats_update"): # Includes the wait for the journal lock
+            stats_journal.compact(modifier=modifier_func)
+    except Exception as e:
+        print(f"[!] Error updating stats file: {e}")
+    # The rewrite bypasses the journal, so the in-memory circuit view can't see it
+    invalidate_circuit_state()
+
+# Batch workers collect usage/event records here and commit them in one grouped write
+_stats_local = threading.local()
+
+class StatsBuffer:
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
 
+    def commit(self):
+        with self.lock:
+            records, self.records = self.records, []
+        try:
+            stats_journal.append_records(records)
+        except Exception as e:
+            print(f"[!] Error updating stats file: {e}")
+        return len(records)
+
+def _resets_open_circuit(record):
+    """Whether a success record would reset a breaker that currently has failures on it."""
+    if not record.get("resets_circuit"):
+        return False
+    state = get_circuit_state()
+    target = backend_pool.node_state(state, record["node"]) if record.get("node") else state
+    return bool(target.get("fail_count")) or target.get("health", "Healthy") != "Healthy"
+
+def append_stats_record(record):
+    buffer = getattr(_stats_local, "buffer", None)
+    if buffer is not None and record.get("type") in ("usage", "event"):
+        # Failure/health records still go straight to the journal: the circuit breaker needs them now.
+        # So does a success that resets a breaker with failures on it; any other success has nothing
+        # to reset, and its flag is dropped so the late commit can't clear newer failures.
+        if not _resets_open_circuit(record):
+            buffer.add({k: v for k, v in record.items() if k != "resets_circuit"})
+            return
     try:
-        # Open with r+ (read/write) or w+ (create if not exists)
-        mode = "r+" if os.path.exists(STATS_FILE) else "w+"
-        with open(STATS_FILE, mode) as f:
-            # ACQUIRE EXCLUSIVE LOCK
-            fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                # Read content
-                try:
-                    f.seek(0)
-                    content = f.read()
-                    if content.strip():
-                        file_stats = json.loads(content)
-                        # Merge defaults
-                        for k, v in stats.items():
-                            if k not in file_stats:
-                                file_stats[k] = v
-                        stats = file_stats
-                except ValueError:
-                    # JSON corrupt or empty, use defaults
-                    pass
-                
-                # APPLY MODIFICATIONS
-                modifier_func(stats)
-                
-                # Write back
-                f.seek(0)
-                f.truncate()
-                json.dump(stats, f, indent=4)
-                f.flush()
-                os.fsync(f.fileno()) # Ensure write to disk
-                
-            finally:
-                # RELEASE LOCK
-                fcntl.flock(f, fcntl.LOCK_UN)
-                
+        stats_journal.append_record(record)
     except Exception as e:
         print(f"[!] Error updating stats file: {e}")
 
 def get_stats_readonly():
-    """Reads stats without locking (for classification decisions where strict consistency isn't critical), or with shared lock."""
-    # For speed in classification, we might just read. But to be safe vs partial writes:
+    """Current stats (snapshot + uncompacted journal records). Lock-free."""
     try:
-        if not os.path.exists(STATS_FILE): return {}
-        with open(STATS_FILE, "r") as f:
-             fcntl.flock(f, fcntl.LOCK_SH)
-             stats = json.load(f)
-             fcntl.flock(f, fcntl.LOCK_UN)
-             return stats
-    except:
-        return {"health": "Healthy"}
-
-def log_event(message, level="INFO"):
-    def _modify(stats):
-        stats["events"].append({
-            "timestamp": datetime.datetime.now().isoformat(),
-            "level": level,
-            "message": message
-        })
-        stats["events"] = stats["events"][-50:]
-    
-    update_stats(_modify)
+        return stats_journal.read_stats()
+    except Exception:
+        return stats_journal.default_stats()
 
-def log_usage(prompt, response, route, latency=0, metadata=None):
-    tokens = estimate_tokens(prompt + (response or ""))
-    
-    def _modify(stats):
-        if route == "local" and response:
-            stats["total_local_tokens"] = stats.get("total_local_tokens", 0) + tokens
-            stats["health"] = "Healthy"
-            stats["fail_count"] = 0
-        elif route == "cloud":
-            stats["total_cloud_tokens"] = stats.get("total_cloud_tokens", 0) + tokens
-            
-        entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "route": route,
-            "tokens": tokens,
-            "latency": round(latency, 2),
-            "prompt_preview": prompt[:50] + "..." if len(prompt) > 50 else prompt
-        }
-        if metadata:
-            entry["metadata"] = metadata
-            
-        stats["history"].append(entry)
-        stats["history"] = stats["history"][-100:]
-        
-    update_stats(_modify)
+def log_event(message, level="INFO", kind=None):
+    event = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "level": level,
+        "message": message
+    }
+    if kind:
+        # Machine-readable tag for events the monitor counts (e.g. "self_healing")
+        event["kind"] = kind
+    append_stats_record({"type": "event", "event": event})
 
-def check_ollama_alive():
+def pool_fields(node):
+    """Journal fields that attribute a local result to a pool node (none without a pool)."""
+    if not POOL or node is None:
+        return {}
+    return {"node": node.name, "pool": [n.name for n in POOL]}
+
+def ollama_counts(body):
+    """Ollama's real prompt and response token counts, when it reported both."""
+    if body.get("prompt_eval_count") is None or body.get("eval_count") is None:
+        return {}
+    return {"prompt_eval_count": body["prompt_eval_count"], "eval_count": body["eval_count"]}
+
+def log_usage(prompt, response, route, latency=0, metadata=None, timing=None, model=None, node=None):
+    if timing and "eval_count" in timing:
+        tokens = timing["prompt_eval_count"] + timing["eval_count"]
+    else:
+        tokens = estimate_tokens(prompt + (response or ""))
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "route": route,
+        "tokens": tokens,
+        "latency": round(latency, 2),
+        "prompt_preview": prompt[:50] + "..." if len(prompt) > 50 else prompt
+    }
+    if model:
+        entry["model"] = model
+    if POOL and node is not None:
+        entry["node"] = node.name
+    if timing:
+        # ttft / tps / load_duration from local generations, saved_latency from cache hits
+        entry.update(timing)
+    if metadata:
+        entry["metadata"] = metadata
+
+    record = {
+        "type": "usage",
+        "ok": bool(response),
+        "resets_circuit": route == "local" and bool(response),
+        "entry": entry
+    }
+    if route == "local":
+        record.update(pool_fields(node))
+    trace = tracing.current()
+    if trace is not None:
+        entry["trace"] = trace.id
+        trace.fields.update(route=route, tokens=tokens)
+    with tracing.span("stats_commit"):
+        append_stats_record(record)
+
+def cached_response(route, model, options, prompt):
+    """
+    Serves a prompt from the response cache. A hit is logged as its own 'cache' route
+    carrying the latency it saved; returns None on a miss.
+    """
+    if not response_cache.ENABLED:
+        return None
+    start_time = time.time()
+    with tracing.span("cache_lookup"):
+        entry = response_cache.get(response_cache.cache_key(route, model, options, prompt))
+    if entry is None:
+        return None
+    latency = time.time() - start_time
+    saved = entry.get("latency", 0)
+    print(f"\n[CACHE HIT ({route}, saved {saved:.1f}s)]:\n{entry['response']}")
+    log_usage(prompt, entry["response"], "cache", latency,
+              metadata={"cached_route": route, "model": model},
+              timing={"saved_latency": round(saved, 2)}, model=model)
+    return entry["response"]
+
+def store_response(route, model, options, prompt, response, latency):
+    if not (response_cache.ENABLED and response):
+        return
     try:
-        requests.get(HEALTH_API_URL, timeout=3)
-        return True
-    except:
-        return False
+        with tracing.span("cache_store"):
+            response_cache.put(response_cache.cache_key(route, model, options, prompt), response,
+                               route=route, model=model, latency=round(latency, 2))
+    except OSError as e:
+        print(f"[!] Error writing response cache: {e}")
+
+def probe_ollama():
+    """
+    Blocking probe of the health endpoint. The result is published for other routers.
+    Only HTTP 200 counts as alive, the same as the watchdog's probe.
+    """
+    try:
+        alive = get_http_session().get(HEALTH_API_URL, timeout=3).status_code == 200
+    except Exception:
+        alive = False
+    try:
+        health_state.write_probe(alive, "router")
+    except OSError:
+        pass
+    return alive
+
+def check_ollama_alive():
+    """
+    Liveness without network I/O on the hot path: uses the watchdog's published probe
+    while it is fresh and only falls back to a real probe when it is stale.
+    """
+    with tracing.span("health_check"):
+        cached = health_state.cached_alive()
+        if cached is not None:
+            return cached
+        return probe_ollama()
+
+# Circuit-breaker view kept in memory (shared across requests in the daemon). A journal
+# tail folds in only the records appended since the last call, so an unchanged journal
+# costs one stat() and the stats file is read in full only on start or when the tail
+# loses track across compactions.
+CIRCUIT_KEYS = ("health", "fail_count", "last_fail_time", "local_perf", "nodes")
+_circuit_cache = {"tail": None, "stats": None, "state": None}
+_circuit_lock = threading.Lock()
+
+def get_circuit_state():
+    with _circuit_lock:
+        tail = _circuit_cache["tail"]
+        records = tail.poll() if tail is not None else None
+        if records is None:
+            if tail is None:
+                tail = _circuit_cache["tail"] = stats_journal.JournalTail()
+            try:
+                _circuit_cache["stats"] = tail.start()
+            except Exception:
+                _circuit_cache["stats"] = stats_journal.default_stats()
+            _circuit_cache["state"] = None
+        for record in records or ():
+            stats_journal.apply_record(_circuit_cache["stats"], record)
+        if records or _circuit_cache["state"] is None:
+            # Readers on other threads keep their own copy while new records are folded in
+            stats = _circuit_cache["stats"]
+            _circuit_cache["state"] = copy.deepcopy({k: stats.get(k) for k in CIRCUIT_KEYS})
+        return _circuit_cache["state"]
+
+def invalidate_circuit_state():
+    """Drops the in-memory view; the next get_circuit_state() reloads it from disk."""
+    with _circuit_lock:
+        if _circuit_cache["tail"] is not None:
+            _circuit_cache["tail"].close()
+        _circuit_cache.update(tail=None, stats=None, state=None)
 
 def attempt_self_healing():
     print("[!!!] SELF-HEALING: Attempting to restart Ollama service...")
@@ -170,135 +391,1110 @@ def attempt_self_healing():
         time.sleep(1)
         # Restarting in background
         subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        log_event("Ollama service restarted via shell execution.", "SUCCESS")
-        print("[*] Recovery command sent. It may take 15-30s for the model to reload.")
+        log_event("Ollama service restarted via shell execution.", "SUCCESS", kind="self_healing")
+        # Load the model now so the first real request after recovery doesn't pay for it
+        print(f"[*] Recovery command sent. {preload_local_model(cli_wait=PRELOAD_CLI_WAIT)}")
     except Exception as e:
-        log_event(f"Self-healing failed: {e}", "ERROR")
+        log_event(f"Self-healing failed: {e}", "ERROR", kind="self_healing")
+
+def preload_local_model(cli_wait=0):
+    """
+    Preloads LOCAL_MODEL (at most one preload per process at a time) and says what happened.
+    The daemon preloads in the background. A CLI process would lose that thread when it exits,
+    so it leaves the preload to the monitor's watchdog when one is probing, else waits up to
+    `cli_wait` seconds for it.
+    """
+    if SERVED_BY == "cli":
+        probe = health_state.cached_probe()
+        if probe is not None and probe.get("source") == "watchdog":
+            return "The monitor's watchdog will preload the model once the service answers."
+    finished = threading.Event()
+    def _done(load):
+        if load is None:
+            log_event(f"Preloading {LOCAL_MODEL} failed.", "WARNING")
+        else:
+            log_event(f"Preloaded {LOCAL_MODEL} in {load:.1f}s.", "INFO")
+        finished.set()
+    if not model_warmup.preload_async(get_http_session(), LOCAL_API_URL, LOCAL_MODEL, KEEP_ALIVE, on_done=_done):
+        return "A preload of the model is already running."
+    if SERVED_BY != "cli":
+        return "Preloading the model in the background."
+    if cli_wait and finished.wait(cli_wait):
+        return "Model preload finished."
+    return f"Model preload did not finish within {cli_wait}s; the next local request will load it."
+
+def local_model_ready():
+    """
+    True once LOCAL_MODEL is resident in Ollama. Uses the watchdog's published probe while
+    fresh, else asks /api/ps. If the service is up but the model isn't loaded, a preload is
+    started. Ollama versions without /api/ps count as ready (the old behaviour).
+    """
+    probe = health_state.cached_probe()
+    if probe is not None and "resident" in probe:
+        resident = probe["resident"] if probe.get("alive") else False
+    else:
+        resident = model_warmup.is_resident(get_http_session(), LOCAL_API_URL, LOCAL_MODEL)
+    if resident is False:
+        preload_local_model()
+    return resident is not False
+
+# Built once per process (the daemon keeps it across requests); the hybrid
+# strategy is retrained from history every CLASSIFIER_RETRAIN_SECONDS.
+_classifier = {"instance": None, "built_at": 0}
+CLASSIFIER_RETRAIN_SECONDS = RULES.get("retrain_seconds", 600)
+
+def get_classifier():
+    now = time.time()
+    learned = RULES.get("classifier", "keyword") != "keyword"
+    stale = learned and now - _classifier["built_at"] > CLASSIFIER_RETRAIN_SECONDS
+    if _classifier["instance"] is None or stale:
+        history = get_stats_readonly().get("history", []) if learned else None
+        _classifier["instance"] = task_classifier.build_classifier(RULES, history)
+        _classifier["built_at"] = now
+    return _classifier["instance"]
 
 def classify_task(prompt):
-    local_keywords = RULES.get("local_keywords", ["summariz", "format", "check", "lint"])
-    cloud_keywords = RULES.get("cloud_keywords", ["reason", "plan", "design"])
+    stats = get_circuit_state()
     
-    prompt_lower = prompt.lower()
-    stats = get_stats_readonly()
-    
-    if stats["health"] == "Degraded":
-        cooldown_elapsed = time.time() - stats["last_fail_time"]
+    if stats.get("health") == "Degraded":
+        cooldown_elapsed = time.time() - stats.get("last_fail_time", 0)
         if cooldown_elapsed < CIRCUIT_BREAKER_COOLDOWN:
             return "cloud"
+        elif POOL:
+            pass # Pool nodes close their own breakers: select_node() tries one once its cooldown expires
+        elif not local_model_ready():
+            # Closing the circuit on a cold model would just time out and trip it again
+            return "cloud"
         else:
             log_event("Circuit breaker cooldown expired. Testing local service.", "INFO")
-            
-            def _reset(stats):
-                stats["health"] = "Healthy"
-            
-            update_stats(_reset)
-
-    for kw in cloud_keywords:
-        if re.search(kw, prompt_lower): return "cloud"
-    for kw in local_keywords:
-        if re.search(kw, prompt_lower): return "local"
-    return "local"
-
-def call_local_ollama(prompt):
-    if not check_ollama_alive():
+            append_stats_record({"type": "health", "expect": ["Degraded"], "set": {"health": "Healthy"}})
+
+    route, _reason = get_classifier().classify(prompt)
+    if route == "local" and LOAD_ROUTING:
+        reason = local_overload_reason(prompt)
+        if reason:
+            print(f"[*] Host under pressure ({reason}). Routing to CLOUD.")
+            return "cloud"
+    return route
+
+def assess_local(prompt):
+    """
+    (predicted local latency or None, host pressure) for this prompt. Uses the pressure the
+    watchdog publishes with its probe (it includes the swap rate) and reads /proc otherwise.
+    """
+    with tracing.span("assess_load"):
+        pressure = (health_state.cached_probe() or {}).get("pressure")
+        if not pressure or time.time() - pressure.get("sampled_at", 0) > health_state.MAX_AGE_SECONDS:
+            pressure = host_load.read_pressure()
+        predicted = host_load.predict(get_circuit_state().get("local_perf"), estimate_tokens(prompt), pressure)
+    return predicted, pressure
+
+def local_overload_reason(prompt):
+    """Why a local generation should be skipped right now, or None."""
+    predicted, pressure = assess_local(prompt)
+    reason = host_load.thrashing(pressure)
+    if reason is None and predicted is not None and predicted > LATENCY_BUDGET:
+        reason = f"predicted {predicted:.0f}s local latency exceeds the {LATENCY_BUDGET}s budget"
+    return reason
+
+def decode_tps(body):
+    """Decode speed from Ollama's final response fields, if present."""
+    eval_count = body.get("eval_count")
+    eval_duration = body.get("eval_duration")
+    if eval_count and eval_duration:
+        return round(eval_count / (eval_duration / 1e9), 2)
+    return None
+
+def abort_response(response):
+    """
+    Tears down a streaming response that another thread may be blocked reading.
+    Shutting the socket down unblocks the reader immediately and tells Ollama to stop generating.
+    """
+    conn = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        # urllib3 2.x hands the socket to http.client once the body is being read
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    threading.Thread(target=response.close, daemon=True).start()
+
+class HedgeCancelled(Exception):
+    """The other leg of a hedged request answered first."""
+
+def _next_chunk(chunks, wait, cancel):
+    """chunks.get(timeout=wait), giving up as soon as `cancel` is set."""
+    import queue
+    if cancel is None:
+        return chunks.get(timeout=wait)
+    deadline = time.time() + wait
+    while not cancel.is_set():
+        try:
+            return chunks.get(timeout=max(0, min(0.05, deadline - time.time())))
+        except queue.Empty:
+            if time.time() >= deadline:
+                raise
+    raise HedgeCancelled()
+
+def stream_local_generation(payload, on_token, first_token_timeout=None, cancel=None, endpoint=None, final=None):
+    """
+    Consumes Ollama's NDJSON stream, calling on_token(text) as chunks arrive.
+    FIRST_TOKEN_TIMEOUT bounds the wait for the first token and STALL_TIMEOUT the gap
+    between tokens, so a long but healthy generation is never cut off.
+    Setting the `cancel` event aborts the generation with HedgeCancelled.
+    Returns (text, timing) where timing has ttft/tps/load_duration; the `final` dict,
+    if given, receives Ollama's closing chunk (context, eval counts).
+    """
+    import queue
+    import requests
+
+    first_token_timeout = first_token_timeout or FIRST_TOKEN_TIMEOUT
+    endpoint = endpoint or LOCAL_API_URL
+    chunks = queue.Queue()
+    holder = {}
+    start_time = time.time()
+
+    def _reader():
+        try:
+            response = get_http_session().post(
+                endpoint, json=dict(payload, stream=True), stream=True,
+                timeout=(3, max(first_token_timeout, STALL_TIMEOUT))
+            )
+            holder["response"] = response
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    chunks.put(json.loads(line))
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+
+    threading.Thread(target=_reader, daemon=True).start()
+
+    parts = []
+    first_token_time = None
+    last = {}
+    finished = False
+    try:
+        while True:
+            wait = STALL_TIMEOUT if first_token_time else first_token_timeout
+            try:
+                chunk = _next_chunk(chunks, wait, cancel)
+            except queue.Empty:
+                phase = "between tokens" if first_token_time else "waiting for first token"
+                raise requests.exceptions.ReadTimeout(f"Local stream stalled {wait}s {phase}")
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            token = chunk.get("response", "")
+            if token:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                parts.append(token)
+                on_token(token)
+            if chunk.get("done"):
+                last = chunk
+                break
+        finished = True
+    finally:
+        # On success the reader drains the body and returns the connection to the pool
+        response = holder.get("response")
+        if response is not None and not finished:
+            abort_response(response)
+
+    end_time = time.time()
+    timing = {}
+    if first_token_time:
+        timing["ttft"] = round(first_token_time - start_time, 3)
+        tps = decode_tps(last)
+        if tps is None and len(parts) > 1 and end_time > first_token_time:
+            tps = round((len(parts) - 1) / (end_time - first_token_time), 2)
+        if tps is not None:
+            timing["tps"] = tps
+    load = model_warmup.load_seconds(last)
+    if load:
+        timing["load_duration"] = load
+    if final is not None:
+        final.update(last)
+    return "".join(parts), timing
+
+def select_node(prompt, prefer=None):
+    """
+    The local backend for a prompt: the configured local_endpoint/local_model, or with a
+    pool the best usable node whose size tier fits the prompt (None if there is none).
+    The `prefer` node (a session's) is kept whenever it is usable and fits.
+    """
+    if not POOL:
+        return backend_pool.Node("local", LOCAL_API_URL, LOCAL_MODEL)
+    with tracing.span("select_node"):
+        ranked = backend_pool.select(POOL, estimate_tokens(prompt), get_circuit_state(),
+                                     lambda node: admission.outstanding(node.name, node.capacity),
+                                     CIRCUIT_BREAKER_COOLDOWN)
+    if not ranked:
+        print("[*] No local backend can take this prompt right now. Routing to CLOUD.")
+        return None
+    for node in ranked:
+        if node.name == prefer:
+            return node
+    return ranked[0]
+
+def admit_local(prompt, priority, predicted, node=None):
+    """
+    Takes a local slot (admission.acquire; on the node's own queue with a pool). Returns the
+    slot, or None after recording the diversion when the queue wait would exceed the
+    deadline for this priority.
+    """
+    with tracing.span("queue_wait"):
+        if POOL and node is not None:
+            slot, waited, reason = admission.acquire(priority, service_time=predicted, node=node.name, capacity=node.capacity)
+        else:
+            slot, waited, reason = admission.acquire(priority, service_time=predicted)
+    if slot is None:
+        print(f"[*] Local queue busy ({reason}). Diverting to CLOUD.")
+        append_stats_record({"type": "admission", "entry": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "priority": priority,
+            "waited": round(waited, 3),
+            "reason": reason,
+            "prompt_preview": prompt[:50],
+        }})
+    elif slot.waited >= 0.1:
+        print(f"[*] Waited {slot.waited:.1f}s for a local slot.")
+    return slot
+
+def abandon_stream(shown):
+    """
+    Marks a local answer that broke off mid-stream as abandoned, so the cloud answer the
+    caller falls back to isn't read as its continuation.
+    """
+    if shown:
+        print(f"\n[LOCAL RESPONSE ABANDONED after {len(shown)} tokens; the partial text above is incomplete]")
+
+def finish_session_turn(session, state, node, prompt, final, timing):
+    """Stores a session turn's new context and notes in timing what the reused context saved."""
+    reused = len(state["context"]) if state else 0
+    timing["session_turn"] = (state or {}).get("turns", 0) + 1
+    if reused:
+        timing["session_reused_tokens"] = reused
+        timing["prefill_saved"] = session_store.prefill_saved(reused, final)
+    if not final.get("context"):
+        return
+    try:
+        session_store.save(session, node.model, node.name, final["context"],
+                           first_prompt=None if state else prompt, previous=state)
+    except OSError as e:
+        print(f"[!] Error saving session {session}: {e}")
+
+def call_local_ollama(prompt, stream=None, on_token=None, use_cache=True, priority="interactive", session=None, node=None):
+    """
+    Generates locally. With stream=True (or inference.stream in the config) tokens
+    are forwarded to on_token (default: stdout) as they arrive.
+    use_cache=False skips the cache lookup (the fresh response still refreshes the cache).
+    With a `session` id the generation continues that session's Ollama context
+    (session turns depend on earlier ones, so they bypass the response cache).
+    `node` is a backend the caller already picked with select_node.
+    Returns None when the local queue for `priority` is too long (callers fall back to cloud).
+    """
+    import requests
+
+    stream = STREAM_BY_DEFAULT if stream is None else stream
+    options = {"num_thread": NUM_THREAD}
+    state = session_store.load(session) if session else None
+    node = node or select_node(prompt, prefer=(state or {}).get("node"))
+    if node is None:
+        return None
+    if state and state.get("model") != node.model:
+        print(f"[*] Session {session} was on {state.get('model')}; starting a new context on {node.model}.")
+        state = None
+
+    if use_cache and not session:
+        cached = cached_response("local", node.model, options, prompt)
+        if cached is not None:
+            return cached
+
+    # A pool has no single liveness probe; each node's breaker trips on its own errors
+    if not POOL and not check_ollama_alive():
         print("[!] Local Service Offline. Starting fallback...")
         handle_local_failure(hard_crash=True)
         return None
 
-    print(f"[*] Routing to LOCAL ({LOCAL_MODEL})...")
+    # Timeouts follow the predicted latency (the configured ones are the ceiling)
+    predicted, pressure = assess_local(prompt) if LOAD_ROUTING else (None, None)
+    load_info = {"prompt_tokens": estimate_tokens(prompt)}
+    if LOAD_ROUTING:
+        load_info["load_factor"] = round(host_load.load_factor(pressure), 3)
+    if predicted is not None:
+        load_info["predicted_latency"] = predicted
+
+    slot = admit_local(prompt, priority, predicted, node)
+    if slot is None:
+        return None
+    load_info["queue_wait"] = round(slot.waited, 3)
+
+    print(f"[*] Routing to LOCAL ({node.model}{' on ' + node.name if POOL else ''})...")
+    payload = {
+        "model": node.model, "prompt": prompt, "stream": False,
+        "options": options, "keep_alive": KEEP_ALIVE
+    }
+    if state:
+        payload["prompt"] = session_store.new_text(state, prompt)
+        payload["context"] = state["context"]
+        print(f"[*] Session {session}: reusing {len(state['context'])} context tokens.")
+    final = {}
+    shown = [] # Tokens already handed to on_token; a failed stream can't take them back
+    trace = tracing.current() or tracing.Trace() # A throwaway trace when none is active
     start_time = time.time()
+    http_start = time.perf_counter()
+    http_end = None
     try:
-        response = requests.post(LOCAL_API_URL, json={
-            "model": LOCAL_MODEL, "prompt": prompt, "stream": False,
-            "options": {"num_thread": NUM_THREAD}
-        }, timeout=LOCAL_TIMEOUT)
-        response.raise_for_status()
-        resp_text = response.json().get('response', '')
-        latency = time.time() - start_time
-        print(f"\n[LOCAL RESPONSE ({latency:.1f}s)]:\n{resp_text}")
-        log_usage(prompt, resp_text, "local", latency)
+        if stream:
+            print(f"\n[LOCAL RESPONSE (streaming)]:")
+            emit = on_token or (lambda token: print(token, end="", flush=True))
+            def on_token(token):
+                shown.append(token)
+                emit(token)
+            resp_text, timing = stream_local_generation(
+                payload, on_token, first_token_timeout=host_load.timeout_for(predicted, FIRST_TOKEN_TIMEOUT),
+                endpoint=node.endpoint, final=final)
+            latency = time.time() - start_time
+            print(f"\n[*] Local generation finished in {latency:.1f}s (TTFT {timing.get('ttft', 0):.2f}s, {timing.get('tps', 0):.1f} tok/s)")
+        else:
+            response = get_http_session().post(node.endpoint, json=payload, timeout=host_load.timeout_for(predicted, LOCAL_TIMEOUT))
+            response.raise_for_status()
+            final = body = response.json()
+            resp_text = body.get('response', '')
+            latency = time.time() - start_time
+            tps = decode_tps(body)
+            timing = {"tps": tps} if tps else {}
+            load = model_warmup.load_seconds(body)
+            if load:
+                timing["load_duration"] = load
+            print(f"\n[LOCAL RESPONSE ({latency:.1f}s)]:\n{resp_text}")
+        http_end = time.perf_counter()
+        trace.add("http", http_start, http_end, node=node.name, model=node.model)
+        trace.add_ollama(final, http_end)
+        if not POOL:
+            health_state.note_result(True, "router")
+        timing.update(load_info)
+        counts = ollama_counts(final)
+        if counts:
+            # Real token counts replace the len/4 estimates
+            timing.update(counts, prompt_tokens=counts["prompt_eval_count"])
+        if session:
+            finish_session_turn(session, state, node, prompt, final, timing)
+        log_usage(prompt, resp_text, "local", latency, timing=timing, model=node.model, node=node)
+        if not session:
+            store_response("local", node.model, options, prompt, resp_text, latency)
         return resp_text
+    except requests.exceptions.ConnectionError as e:
+        # Service is down even though the cached probe said otherwise: publish and trip now
+        latency = time.time() - start_time
+        abandon_stream(shown)
+        print(f"[!] Local Service Offline ({latency:.1f}s): {e}")
+        if not POOL:
+            health_state.note_result(False, "router")
+        handle_local_failure(hard_crash=True, node=node)
+        return None
     except requests.exceptions.Timeout:
         latency = time.time() - start_time
+        abandon_stream(shown)
         print(f"[!] Local Request TIMED OUT ({latency:.1f}s). System may be under heavy load.")
         log_event(f"Local request timed out after {latency:.1f}s (System Load/Swap issue)", "WARNING")
-        handle_local_failure()
+        handle_local_failure(node=node)
         return None
     except Exception as e:
         latency = time.time() - start_time
+        abandon_stream(shown)
         print(f"[!] Local Request Failed ({latency:.1f}s): {e}")
         log_event(f"Local request failed: {type(e).__name__}", "ERROR")
-        handle_local_failure()
+        handle_local_failure(node=node)
         return None
+    finally:
+        if http_end is None:
+            trace.add("http", http_start, time.perf_counter(), node=node.name, model=node.model, failed=True)
+        slot.release()
 
-def handle_local_failure(hard_crash=False):
-    def _modify(stats):
-        stats["fail_count"] = stats.get("fail_count", 0) + 1
-        stats["last_fail_time"] = time.time()
-        
-        if hard_crash or stats["fail_count"] >= CIRCUIT_BREAKER_FAIL_THRESHOLD:
-            stats["health"] = "Degraded"
-            print("[!!!] CIRCUIT BREAKER TRIPPED. Triggering Watchdog...")
-            # We trigger self healing OUTSIDE the lock to avoid blocking
-        else:
-            stats["health"] = "Retrying"
-            
-    update_stats(_modify)
-    
-    # Check if we need to self-heal (reading back safely)
-    stats = get_stats_readonly()
-    if stats.get("health") == "Degraded":
+def handle_local_failure(hard_crash=False, node=None):
+    # The circuit-breaker transition is computed when the record is folded, so
+    # concurrent failures from several routers all count. With a pool the record trips
+    # only the node's breaker; the pool is Degraded once every node is.
+    record = {
+        "type": "failure",
+        "time": time.time(),
+        "model": node.model if node else LOCAL_MODEL,
+        "hard_crash": hard_crash,
+        "threshold": CIRCUIT_BREAKER_FAIL_THRESHOLD
+    }
+    record.update(pool_fields(node))
+    append_stats_record(record)
+    if POOL and node is not None:
+        log_event(f"Local request on pool node {node.name} failed.", "WARNING")
+
+    # Check if we need to self-heal (reading back safely); a remote node can't be restarted from here
+    stats = get_circuit_state()
+    if stats.get("health") == "Degraded" and (not POOL or node is None or node.is_local_host()):
+         print("[!!!] CIRCUIT BREAKER TRIPPED. Triggering Watchdog...")
          attempt_self_healing()
          log_event(f"Local request failed", "WARNING") # This handles its own locking
 
-def call_cloud_gemini(prompt, metadata=None):
+def cloud_generate(prompt):
+    """The cloud backend call itself (no logging or caching)."""
+    return f"processed via Gemini 1.5 Pro" # Mock
+
+def call_cloud_gemini(prompt, metadata=None, use_cache=True):
+    if use_cache:
+        cached = cached_response("cloud", CLOUD_MODEL, None, prompt)
+        if cached is not None:
+            return cached
+
     print(f"[*] Routing to CLOUD (Gemini API)...")
     start_time = time.time()
-    resp_text = f"processed via Gemini 1.5 Pro" # Mock
+    with tracing.span("cloud", model=CLOUD_MODEL):
+        resp_text = cloud_generate(prompt)
     latency = time.time() - start_time
-    log_usage(prompt, resp_text, "cloud", latency, metadata)
+    log_usage(prompt, resp_text, "cloud", latency, metadata, model=CLOUD_MODEL)
+    store_response("cloud", CLOUD_MODEL, None, prompt, resp_text, latency)
     return resp_text
 
-def main():
+def hedge_delay(history):
+    """
+    How long to wait for the first local token before hedging: HEDGE_PERCENTILE of the
+    recent local first-token times (total latency for non-streamed entries when there
+    aren't enough of those), clamped to [HEDGE_MIN_DELAY, FIRST_TOKEN_TIMEOUT].
+    """
+    local = [h for h in history if h.get("route") == "local"]
+    samples = sorted(h["ttft"] for h in local if h.get("ttft"))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        samples = sorted(h["latency"] for h in local if h.get("latency"))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    value = samples[min(len(samples) - 1, int(HEDGE_PERCENTILE * len(samples)))]
+    return min(FIRST_TOKEN_TIMEOUT, max(HEDGE_MIN_DELAY, value))
+
+def call_hedged(prompt, use_cache=True, priority="interactive"):
+    """
+    Local generation that races the cloud once the first local token is overdue (see
+    hedge_delay). The first leg to answer wins and the local leg is aborted if it lost;
+    a cloud call can't be recalled, its late answer is just dropped. Both legs are
+    recorded as a "hedge" journal record. Returns None only if every leg failed.
+    """
+    import queue
+    import requests
+
+    options = {"num_thread": NUM_THREAD}
+    node = select_node(prompt)
+    if node is None:
+        return None
+    if use_cache:
+        cached = cached_response("local", node.model, options, prompt)
+        if cached is not None:
+            return cached
+
+    if not POOL and not check_ollama_alive():
+        print("[!] Local Service Offline. Starting fallback...")
+        handle_local_failure(hard_crash=True)
+        return None
+
+    predicted, pressure = assess_local(prompt) if LOAD_ROUTING else (None, None)
+    slot = admit_local(prompt, priority, predicted, node)
+    if slot is None:
+        return None
+    delay = hedge_delay(get_stats_readonly().get("history", []))
+    payload = {"model": node.model, "prompt": prompt, "options": options, "keep_alive": KEEP_ALIVE}
+    cancel = threading.Event()
+    first_token = threading.Event()
+    results = queue.Queue()
+    trace = tracing.current() or tracing.Trace() # The legs run on their own threads
+    final = {}
+    start_time = time.time()
+
+    def local_leg():
+        leg_start = time.perf_counter()
+        try:
+            text, timing = stream_local_generation(
+                payload, lambda token: first_token.set(),
+                first_token_timeout=host_load.timeout_for(predicted, FIRST_TOKEN_TIMEOUT), cancel=cancel,
+                endpoint=node.endpoint, final=final)
+            trace.add_ollama(final)
+            results.put(("local", text, timing, None))
+        except HedgeCancelled:
+            results.put(("local", None, {}, "cancelled"))
+        except requests.exceptions.ConnectionError:
+            if not POOL:
+                health_state.note_result(False, "router")
+            handle_local_failure(hard_crash=True, node=node)
+            results.put(("local", None, {}, "offline"))
+        except Exception as e:
+            handle_local_failure(node=node)
+            results.put(("local", None, {}, type(e).__name__))
+        finally:
+            trace.add("http", leg_start, time.perf_counter(), node=node.name, model=node.model)
+            slot.release()
+            first_token.set()
+
+    def cloud_leg():
+        try:
+            with trace.span("cloud", model=CLOUD_MODEL):
+                text = cloud_generate(prompt)
+            results.put(("cloud", text, {}, None))
+        except Exception as e:
+            results.put(("cloud", None, {}, type(e).__name__))
+
+    print(f"[*] Routing to LOCAL ({node.model}), hedging with CLOUD after {delay:.1f}s...")
+    threading.Thread(target=local_leg, daemon=True).start()
+    hedged = not first_token.wait(delay)
+    cloud_start = None
+    if hedged:
+        print(f"[*] Hedge: no local token after {delay:.1f}s. Starting CLOUD in parallel...")
+        cloud_start = time.time()
+        threading.Thread(target=cloud_leg, daemon=True).start()
+
+    legs = {}
+    winner = None
+    while len(legs) < (2 if hedged else 1):
+        leg, text, timing, error = results.get()
+        leg_start = cloud_start if leg == "cloud" else start_time
+        legs[leg] = dict(timing, latency=round(time.time() - leg_start, 3), state=error or "answered")
+        if text:
+            winner = (leg, text, timing, time.time() - leg_start)
+            cancel.set()
+            break
+    for leg in ("local", "cloud") if hedged else ("local",):
+        legs.setdefault(leg, {"state": "cancelled" if leg == "local" else "abandoned"})
+
+    append_stats_record({"type": "hedge", "entry": {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "delay": round(delay, 3),
+        "hedged": hedged,
+        "winner": winner[0] if winner else None,
+        "legs": legs,
+    }})
+    if winner is None:
+        return None
+
+    leg, text, timing, latency = winner
+    metadata = {"hedged": hedged}
+    if leg == "local":
+        if not POOL:
+            health_state.note_result(True, "router")
+        timing = dict(timing, prompt_tokens=estimate_tokens(prompt), queue_wait=round(slot.waited, 3))
+        print(f"\n[LOCAL RESPONSE ({latency:.1f}s)]:\n{text}")
+        log_usage(prompt, text, "local", latency, metadata, timing=timing, model=node.model, node=node)
+        store_response("local", node.model, options, prompt, text, latency)
+    else:
+        print(f"[*] Hedge: CLOUD answered first ({latency:.1f}s).")
+        log_usage(prompt, text, "cloud", latency, metadata, model=CLOUD_MODEL)
+        store_response("cloud", CLOUD_MODEL, None, prompt, text, latency)
+    return text
+
+class _ThreadStdio:
+    """
+    Stand-in for sys.stdout/sys.stderr inside the daemon.
+    Each handler thread binds its own stream so concurrent clients only see their own output.
+    """
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def bind(self, stream):
+        self._local.stream = stream
+
+    def current(self):
+        return getattr(self._local, "stream", None) or self._default
+
+    def write(self, text):
+        return self.current().write(text)
+
+    def flush(self):
+        self.current().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+class _FrameStream:
+    """Text stream that forwards every write to the daemon client as a JSON frame."""
+    def __init__(self, wfile, name, lock):
+        self.wfile = wfile
+        self.name = name
+        self.lock = lock
+        self.closed = False
+
+    def write(self, text):
+        if text and not self.closed:
+            frame = json.dumps({"stream": self.name, "data": text}) + "\n"
+            try:
+                with self.lock:
+                    self.wfile.write(frame.encode("utf-8"))
+                    self.wfile.flush()
+            except OSError:
+                # Client went away; finish the request quietly
+                self.closed = True
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+def _pump_stdin(sock, source):
+    """Copies `source` to the daemon line by line, then half-closes the socket to signal EOF."""
+    try:
+        for line in source:
+            sock.sendall(line.encode("utf-8"))
+    except OSError:
+        pass # The daemon finished or went away; its exit frame says which
+    finally:
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+def forward_to_daemon(argv, stdin=None):
+    """
+    Thin client: forwards the CLI arguments to a running router daemon and relays its output.
+    With `stdin` (for `--batch -` / `--bulk -`), its lines are streamed to the daemon after the
+    request while the output is relayed, so neither side holds the whole input.
+    Returns the exit code, or None if no daemon is listening (caller falls back to in-process).
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        sock.connect(DAEMON_SOCKET)
+    except (OSError, socket.timeout):
+        sock.close()
+        return None
+
+    try:
+        sock.settimeout(None)
+        request = {"argv": argv, "cwd": os.getcwd()}
+        if stdin is not None:
+            request["stdin"] = "stream"
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        if stdin is not None:
+            threading.Thread(target=_pump_stdin, args=(sock, stdin), daemon=True).start()
+        with sock.makefile("rb") as rfile:
+            for line in rfile:
+                frame = json.loads(line)
+                if "exit" in frame:
+                    return frame["exit"]
+                out = sys.stderr if frame.get("stream") == "err" else sys.stdout
+                out.write(frame.get("data", ""))
+                out.flush()
+    except (OSError, ValueError) as e:
+        print(f"[!] Router daemon connection lost: {e}", file=sys.stderr)
+        return 1
+    finally:
+        sock.close()
+
+    print("[!] Router daemon closed the connection without an exit status.", file=sys.stderr)
+    return 1
+
+def serve_daemon():
+    """Runs the long-lived router daemon on DAEMON_SOCKET until interrupted."""
+    global SERVED_BY
+    import signal
+    import socketserver
+
+    stdout = _ThreadStdio(sys.stdout)
+    stderr = _ThreadStdio(sys.stderr)
+    sys.stdout, sys.stderr = stdout, stderr
+    SERVED_BY = "daemon"
+    _startup.clear() # Requests don't pay for the daemon's config load
+
+    class DaemonHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lock = threading.Lock()
+            stdout.bind(_FrameStream(self.wfile, "out", lock))
+            stderr.bind(_FrameStream(self.wfile, "err", lock))
+            code = 0
+            try:
+                line = self.rfile.readline()
+                if not line:
+                    return # Liveness probe (daemon_is_running)
+                request = json.loads(line)
+                stdin = None
+                if request.get("stdin") == "stream":
+                    # The client's stdin follows the request line until it half-closes
+                    stdin = io.TextIOWrapper(self.rfile, encoding="utf-8", newline="")
+                try:
+                    code = run_cli(request.get("argv", []), cwd=request.get("cwd"), stdin=stdin)
+                finally:
+                    if stdin is not None:
+                        stdin.detach() # self.rfile belongs to the handler
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                print(f"[!] Router daemon error: {type(e).__name__}: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                stdout.bind(None)
+                stderr.bind(None)
+            try:
+                with lock:
+                    self.wfile.write((json.dumps({"exit": code}) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+
+    class DaemonServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+    if os.path.exists(DAEMON_SOCKET):
+        if daemon_is_running():
+            print(f"[!] Router daemon already running on {DAEMON_SOCKET}", file=sys.__stderr__)
+            return 1
+        os.unlink(DAEMON_SOCKET)
+
+    # systemd stops us with SIGTERM; exit through the normal cleanup path
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    get_http_session() # Warm the connection pool before the first client arrives
+    with DaemonServer(DAEMON_SOCKET, DaemonHandler) as server:
+        os.chmod(DAEMON_SOCKET, 0o600)
+        print(f"[*] Router daemon listening on {DAEMON_SOCKET}", file=sys.__stdout__, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n[*] Stopping router daemon.", file=sys.__stdout__)
+        finally:
+            try:
+                os.unlink(DAEMON_SOCKET)
+            except OSError:
+                pass
+    return 0
+
+def daemon_is_running():
+    """True if something is accepting connections on DAEMON_SOCKET."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        sock.connect(DAEMON_SOCKET)
+        return True
+    except (OSError, socket.timeout):
+        return False
+    finally:
+        sock.close()
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Antigravity Hybrid Router V3")
     parser.add_argument("prompt", nargs="*", help="The prompt to process")
     parser.add_argument("--log-only", action="store_true", help="Just log the usage to the dashboard without processing")
     parser.add_argument("--metadata", help="Optional JSON metadata for the log entry")
+    parser.add_argument("--bulk", metavar="FILE", help="With --log-only: JSONL file of log records ('-' for stdin), committed in one write")
     parser.add_argument("--route", choices=["local", "cloud", "auto"], default="auto", help="Force a specific route (local/cloud) or auto-detect")
-    
-    args = parser.parse_args()
-    prompt = " ".join(args.prompt)
-    if not prompt: 
-        return
+    parser.add_argument("--stream", action="store_true", help="Stream local tokens as they are generated (first-token and stall timeouts instead of a total timeout)")
+    parser.add_argument("--hedge", action="store_true", help="Race the cloud against a local generation whose first token is overdue (see hedging in the config)")
+    parser.add_argument("--priority", choices=list(admission.PRIORITIES), help="Local queue priority (default: interactive for single prompts, batch for --batch)")
+    parser.add_argument("--session", metavar="ID", help="Continue local session ID: reuse Ollama's context from its earlier turns instead of re-evaluating them")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache lookup (the fresh response still refreshes it)")
+    parser.add_argument("--batch", metavar="FILE", help="Process a JSONL file of prompts ('-' for stdin) and write JSONL results")
+    parser.add_argument("--output", metavar="FILE", help="Batch mode: write results to FILE instead of stdout")
+    parser.add_argument("--local-concurrency", type=int, default=BATCH.get("local_concurrency", 1), help="Batch mode: max concurrent local generations")
+    parser.add_argument("--cloud-concurrency", type=int, default=BATCH.get("cloud_concurrency", 4), help="Batch mode: max concurrent cloud calls")
+    parser.add_argument("--unordered", action="store_true", help="Batch mode: emit results in completion order instead of input order")
+    parser.add_argument("--pipeline", metavar="FILE", action="append", help="Map-reduce FILE (repeatable) through local chunk summaries; the prompt is the task")
+    parser.add_argument("--escalate", action="store_true", help="Pipeline mode: send the condensed summary with the prompt to the cloud")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Pipeline mode: token budget per chunk (default: pipeline.chunk_tokens or 2048)")
+    parser.add_argument("--daemon", action="store_true", help="Run the persistent router daemon on a local Unix socket")
+    parser.add_argument("--no-daemon", action="store_true", help="Always process in-process, even if a router daemon is running")
+    return parser
+
+def parse_batch_line(line):
+    """A batch input line is a JSON object with a "prompt" (plus optional id/route/metadata), a JSON string, or plain text."""
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return {"prompt": line}
+    if isinstance(item, str):
+        return {"prompt": item}
+    if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+        raise ValueError("expected an object with a string 'prompt'")
+    return item
+
+def process_batch_item(index, item, use_cache, limits, priority="batch"):
+    """Routes one batch item under the per-route concurrency limits. Returns its result record."""
+    prompt = item["prompt"]
+    priority = item.get("priority") if item.get("priority") in admission.PRIORITIES else priority
+    route = item.get("route") if item.get("route") in ("local", "cloud") else classify_task(prompt)
+    start_time = time.time()
+    response = None
+    if route == "local":
+        with limits["local"]:
+            response = call_local_ollama(prompt, stream=False, use_cache=use_cache, priority=priority)
+        if response is None:
+            print(f"[*] Auto-Fallback: Retrying batch item {index} via Cloud...")
+            route = "cloud"
+    if response is None:
+        with limits["cloud"]:
+            response = call_cloud_gemini(prompt, item.get("metadata"), use_cache=use_cache)
+
+    result = {"index": index, "route": route, "response": response, "latency": round(time.time() - start_time, 2)}
+    if "id" in item:
+        result["id"] = item["id"]
+    return result
+
+def _bind_batch_worker(diagnostics, buffer):
+    # Workers' progress prints go to stderr so they never interleave with JSONL results
+    sys.stdout.bind(diagnostics)
+    _stats_local.buffer = buffer
+
+def run_batch(args, source, out):
+    """
+    Streams prompts from `source`, dispatching local and cloud work concurrently with separate
+    limits, and writes one JSON result per line to `out` as soon as it is ready (in input order
+    unless --unordered). Stats are committed in one grouped write.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    out = out.current() if isinstance(out, _ThreadStdio) else out
+    installed = not isinstance(sys.stdout, _ThreadStdio)
+    if installed:
+        sys.stdout = _ThreadStdio(sys.stdout)
+    diagnostics = sys.stderr.current() if isinstance(sys.stderr, _ThreadStdio) else sys.stderr
+
+    local_limit = max(1, args.local_concurrency)
+    cloud_limit = max(1, args.cloud_concurrency)
+    limits = {"local": threading.Semaphore(local_limit), "cloud": threading.Semaphore(cloud_limit)}
+    # Bounds how far reading runs ahead of the workers
+    in_flight = threading.Semaphore((local_limit + cloud_limit) * 4)
+    buffer = StatsBuffer()
+    use_cache = not args.no_cache
+
+    lock = threading.Lock()
+    done_results = {}
+    next_index = 0
+    count = 0
+    routes = {"local": 0, "cloud": 0}
+    start_time = time.time()
+
+    def emit(result):
+        if result["route"]:
+            routes[result["route"]] += 1
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    def collect(result):
+        nonlocal next_index
+        with lock:
+            if args.unordered:
+                emit(result)
+                return
+            done_results[result["index"]] = result
+            while next_index in done_results:
+                emit(done_results.pop(next_index))
+                next_index += 1
+
+    def finished(index, future):
+        # Runs on the worker that completed the item (or here, if it already had)
+        in_flight.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"index": index, "route": None, "error": f"{type(e).__name__}: {e}"}
+        collect(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=local_limit + cloud_limit,
+                                initializer=_bind_batch_worker, initargs=(diagnostics, buffer)) as executor:
+            for line in source:
+                line = line.strip()
+                if not line:
+                    continue
+                index = count
+                count += 1
+                try:
+                    item = parse_batch_line(line)
+                except ValueError as e:
+                    collect({"index": index, "route": None, "error": f"Invalid batch line: {e}"})
+                    continue
+                in_flight.acquire()
+                future = executor.submit(process_batch_item, index, item, use_cache, limits, args.priority or "batch")
+                future.add_done_callback(lambda future, index=index: finished(index, future))
+    finally:
+        committed = buffer.commit()
+        if installed:
+            sys.stdout = sys.stdout.current()
+
+    print(f"[*] Batch complete: {count} items ({routes.get('local', 0)} local, {routes.get('cloud', 0)} cloud) "
+          f"in {time.time() - start_time:.1f}s; {committed} stats records committed.", file=diagnostics)
+    return 0
+
+def summarize_part(instruction, text, use_cache=True, priority="batch"):
+    """
+    One map or reduce step of the pipeline: the cached summary of `text` under this instruction
+    by the model that would write it now, else a local generation (cloud if there is no usable
+    node or local fails). Returns (summary, source).
+    """
+    prompt = f"{instruction}\n\n{text}"
+    node = select_node(prompt)
+    model = node.model if node else CLOUD_MODEL
+    if use_cache and PIPELINE_CACHE:
+        entry = response_cache.get(pipeline.summary_key(model, instruction, text), ttl_seconds=PIPELINE_CACHE_TTL)
+        if entry is not None:
+            return entry["response"], "cache"
+    source = "local"
+    summary = call_local_ollama(prompt, stream=False, use_cache=False, priority=priority, node=node) if node else None
+    if summary is None:
+        source, model = "cloud", CLOUD_MODEL
+        summary = call_cloud_gemini(prompt, {"source": "pipeline"}, use_cache=False)
+    if summary and PIPELINE_CACHE:
+        try:
+            response_cache.put(pipeline.summary_key(model, instruction, text), summary, route=source, model=model)
+        except OSError as e:
+            print(f"[!] Error writing response cache: {e}")
+    return summary, source
+
+def run_pipeline(args, paths, out):
+    """
+    Map-reduce over long files: every chunk is summarized locally (at most
+    admission.MAX_CONCURRENCY at a time across all routers), the partial summaries are
+    combined level by level until one is left, and that condensed map is written to `out`,
+    or handed with the prompt to the cloud with --escalate. Progress goes to stderr.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    task = " ".join(args.prompt) or "a general overview"
+    use_cache = not args.no_cache
+    priority = args.priority or "batch"
+    out = out.current() if isinstance(out, _ThreadStdio) else out
+    original = sys.stdout
+    installed = not isinstance(sys.stdout, _ThreadStdio)
+    if installed:
+        sys.stdout = _ThreadStdio(sys.stdout)
+    # This thread's print()s go to stderr for the run; its own binding is restored afterwards
+    restore = sys.stdout.current()
+    diagnostics = sys.stderr.current() if isinstance(sys.stderr, _ThreadStdio) else sys.stderr
+    sys.stdout.bind(diagnostics)
+    buffer = StatsBuffer()
+    _stats_local.buffer = buffer
+    sources = {"cache": 0, "local": 0, "cloud": 0}
+    sources_lock = threading.Lock()
+    start_time = time.time()
+
+    def step(instruction, text):
+        summary, source = summarize_part(instruction, text, use_cache, priority)
+        with sources_lock:
+            sources[source] += 1
+        return summary
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, admission.MAX_CONCURRENCY),
+                                initializer=_bind_batch_worker, initargs=(diagnostics, buffer)) as executor:
+            summaries = []
+            for path in paths:
+                with pipeline.ChunkedFile(path, args.chunk_tokens) as chunked:
+                    print(f"[*] Pipeline: {path}: {len(chunked)} chunks", file=diagnostics)
+                    # Workers decode their own chunk, so only chunks in flight are held in memory
+                    parts = executor.map(lambda i: step(MAP_PROMPT, chunked.text(i)), range(len(chunked)))
+                    name = os.path.basename(path)
+                    summaries.extend(f"[{name}] {part}" if len(paths) > 1 else part for part in parts if part)
+
+            level = 0
+            while len(summaries) > 1:
+                groups = pipeline.reduce_groups(summaries, pipeline.CHUNK_TOKENS * pipeline.CHARS_PER_TOKEN)
+                level += 1
+                print(f"[*] Pipeline: reduce level {level}: {len(summaries)} -> {len(groups)} summaries", file=diagnostics)
+                summaries = [s for s in executor.map(
+                    lambda group: step(REDUCE_PROMPT.format(task=task), "\n\n---\n\n".join(group)), groups) if s]
+        final = summaries[0] if summaries else ""
+
+        if args.escalate and final:
+            print("[*] Pipeline: handing the condensed map to CLOUD...", file=diagnostics)
+            final = call_cloud_gemini(f"{task}\n\nCondensed context:\n{final}", {"source": "pipeline"}, use_cache=use_cache)
+    finally:
+        _stats_local.buffer = None
+        buffer.commit()
+        if installed:
+            sys.stdout = original
+        else:
+            sys.stdout.bind(restore)
+
+    out.write((final or "") + "\n")
+    out.flush()
+    print(f"[*] Pipeline complete in {time.time() - start_time:.1f}s: {sources['local']} local, "
+          f"{sources['cloud']} cloud, {sources['cache']} cached summaries.", file=diagnostics)
+    return 0
+
+def run_cli(argv, cwd=None, stdin=None):
+    """
+    In-process CLI execution. Used directly as the fallback and by the daemon for each client
+    (cwd/stdin are the client's, forwarded over the socket).
+    """
+    args = build_parser().parse_args(argv)
 
     if args.log_only:
-        meta = json.loads(args.metadata) if args.metadata else {"source": "antigravity"}
-        
-        # Determine route: Use explicit flag if set, otherwise default to 'cloud' for safety but warn?
-        # Actually, for log-only, we should really default to 'cloud' if not specified to maintain current behavior,
-        # OR use the 'auto' classification if they want.
-        # But usually log-only implies the work is ALREADY DONE.
-        
-        actual_route = args.route
-        if actual_route == "auto":
-             # If they didn't specify, default to cloud for external logs as per previous behavior, 
-             # UNLESS they want us to classify it? 
-             # Let's assume 'cloud' default for legacy compatibility if strict route isn't provided.
-             actual_route = "cloud"
-        
-        print(f"[*] Unified Logging: Recording {actual_route}-only event...")
-        log_usage(prompt, "[External Process]", actual_route, 0, meta)
-        return
+        # Same path as the script's fast path; here for the daemon and in-process callers
+        return fast_log.log(" ".join(args.prompt), args.route, args.metadata, args.bulk, stdin, cwd)
+
+    if args.batch:
+        resolve = lambda path: os.path.join(cwd, path) if cwd else path
+        source = (stdin or sys.stdin) if args.batch == "-" else open(resolve(args.batch), "r")
+        out = open(resolve(args.output), "w") if args.output else sys.stdout
+        try:
+            return run_batch(args, source, out)
+        finally:
+            if source not in (stdin, sys.stdin):
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+
+    if args.pipeline:
+        paths = [os.path.join(cwd, path) if cwd else path for path in args.pipeline]
+        return run_pipeline(args, paths, sys.stdout)
+
+    prompt = " ".join(args.prompt)
+    if not prompt: 
+        return 0
 
     # Normal Processing Mode
-    route = args.route if args.route != "auto" else classify_task(prompt)
-    if route == "local":
-        if call_local_ollama(prompt) is None:
-            print("[*] Auto-Fallback: Retrying via Cloud...")
-            call_cloud_gemini(prompt)
-    else:
-        call_cloud_gemini(prompt)
+    config_load = _startup.pop("config_load", None)
+    trace = tracing.start(config_load[0] if config_load else None)
+    if config_load:
+        trace.add("config_load", *config_load)
+    route = None
+    try:
+        with trace.span("classify"):
+            route = args.route if args.route != "auto" else classify_task(prompt)
+        use_cache = not args.no_cache
+        priority = args.priority or "interactive"
+        if route == "local" and (args.hedge or HEDGE_BY_DEFAULT) and not args.stream and not args.session:
+            if call_hedged(prompt, use_cache=use_cache, priority=priority) is None:
+                print("[*] Auto-Fallback: Retrying via Cloud...")
+                call_cloud_gemini(prompt, use_cache=use_cache)
+        elif route == "local":
+            if call_local_ollama(prompt, stream=args.stream or None, use_cache=use_cache, priority=priority,
+                                 session=args.session) is None:
+                print("[*] Auto-Fallback: Retrying via Cloud...")
+                call_cloud_gemini(prompt, use_cache=use_cache)
+        else:
+            call_cloud_gemini(prompt, use_cache=use_cache)
+    finally:
+        trace.finish(classified=route, prompt_preview=prompt[:50], served_by=SERVED_BY)
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_parser().parse_args(argv)
+
+    if args.daemon:
+        sys.exit(serve_daemon())
+
+    # Only touch stdin for `--batch -` / `--bulk -` once we know a daemon will take it
+    reads_stdin = args.batch == "-" or (args.log_only and args.bulk == "-")
+    if not args.no_daemon and (not reads_stdin or daemon_is_running()):
+        code = forward_to_daemon(argv, sys.stdin if reads_stdin else None)
+        if code is not None:
+            sys.exit(code)
+
+    # No daemon running: fall back to in-process execution
+    sys.exit(run_cli(argv))
 
 if __name__ == "__main__":
     main()
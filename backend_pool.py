@@ -0,0 +1,83 @@
+"""
+Pool of local inference backends (inference.pool in the config).
+
+Each node is one Ollama endpoint serving one model, with its own capacity (its own
+slot queue in admission.py) and its own circuit breaker, folded by stats_journal from
+records that carry the node's name (stats["nodes"]). A failing node is skipped while
+the others keep serving; the pool only counts as Degraded once every node is.
+
+select() ranks the usable nodes for a prompt: nodes whose max_prompt_tokens fits the
+prompt, those with a free slot first, smallest size tier first among them (a 1B model for
+short formatting work, bigger models for longer prompts), then least outstanding requests
+per slot, then latency EWMA. Once every fitting node is saturated, the shortest queue wins
+whatever its tier, so short prompts don't wait on a busy small node while a big one idles.
+"""
+import time
+import urllib.parse
+
+# Outstanding requests per slot at which a node counts as saturated (inference.pool_saturation)
+SATURATION = 1.0
+
+class Node:
+    def __init__(self, name, endpoint, model, capacity=1, max_prompt_tokens=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.model = model
+        self.capacity = max(1, capacity)
+        self.max_prompt_tokens = max_prompt_tokens
+
+    def fits(self, prompt_tokens):
+        return self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens
+
+    def is_local_host(self):
+        return urllib.parse.urlsplit(self.endpoint).hostname in ("localhost", "127.0.0.1", "::1")
+
+    def __repr__(self):
+        return f"Node({self.name!r}, {self.model!r} @ {self.endpoint})"
+
+def load_pool(inference, default_endpoint, default_model):
+    """
+    Nodes from inference["pool"], a list of {name, endpoint, model, capacity, max_prompt_tokens}
+    (missing endpoints/models default to local_endpoint/local_model). Empty without a pool.
+    """
+    nodes = []
+    for i, item in enumerate(inference.get("pool") or []):
+        model = item.get("model", default_model)
+        nodes.append(Node(
+            item.get("name") or f"{model}-{i}",
+            item.get("endpoint", default_endpoint),
+            model,
+            item.get("capacity", 1),
+            item.get("max_prompt_tokens"),
+        ))
+    return nodes
+
+def node_state(stats, name):
+    return (stats.get("nodes") or {}).get(name) or {}
+
+def usable(state, cooldown, now=None):
+    """A node serves unless its breaker is open (Degraded with the cooldown still running)."""
+    if state.get("health", "Healthy") != "Degraded":
+        return True
+    now = time.time() if now is None else now
+    return now - state.get("last_fail_time", 0) >= cooldown
+
+def select(nodes, prompt_tokens, stats, outstanding, cooldown, now=None):
+    """
+    Usable nodes that fit the prompt, best first. outstanding(node) is the number of
+    requests running or queued on it (admission.outstanding).
+    """
+    ranked = []
+    for node in nodes:
+        state = node_state(stats, node.name)
+        if not node.fits(prompt_tokens) or not usable(state, cooldown, now):
+            continue
+        tier = node.max_prompt_tokens if node.max_prompt_tokens is not None else float("inf")
+        load = outstanding(node) / node.capacity
+        latency = state.get("latency_ewma") or 0
+        if load < SATURATION:
+            ranked.append(((0, tier, load, latency), node))
+        else:
+            ranked.append(((1, load, tier, latency), node))
+    ranked.sort(key=lambda item: item[0])
+    return [node for _, node in ranked]
@@ -0,0 +1,310 @@
+"""
+Benchmarks for the router and monitor hot paths, run against mock_ollama.MockOllama.
+
+    python3 bench_router.py                          # everything, JSON on stdout
+    python3 bench_router.py --quick --only classify,dashboard --output bench.json
+
+Runs in a throwaway HOME with its own config, journal and caches, so the real stats
+are never touched. Results are JSON tagged with the commit they were measured at, so
+runs can be compared across commits. Self-healing is disabled: it would restart the
+real Ollama.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+import http.client
+import multiprocessing
+
+import mock_ollama
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SMALL_PROMPT = "Summarize this log file for me."
+LARGE_PROMPT = ("INFO worker heartbeat ok\n" * 4096)[:100 * 1024] + "please summarize"
+DASHBOARD_ENDPOINTS = ("/", "/usage_stats.json", "/api/stats", "/metrics", "/api/metrics", "/api/queue")
+# A kept-alive response whose body waits on the client's delayed ACK (Nagle) takes ~40 ms
+# whatever its size: a tight latency distribution around that means the stall, not real work.
+DELAYED_ACK_MS = (35, 50)
+
+def _summary(samples):
+    """Distribution of a list of durations, in milliseconds."""
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+    return {"n": len(samples), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(samples[-1] * 1000, 3)}
+
+def delayed_ack_stall(summary):
+    """True when an endpoint's latencies sit at the fixed delayed-ACK delay (p50 and p95 both in DELAYED_ACK_MS)."""
+    low, high = DELAYED_ACK_MS
+    return low <= summary["p50_ms"] <= high and low <= summary["p95_ms"] <= high
+
+def setup_home(mock_url):
+    """A fresh HOME whose config points the router at the mock. Must run before the router is imported."""
+    home = tempfile.mkdtemp(prefix="gemma-bench-")
+    config_dir = os.path.join(home, ".config", "gemma-bridge")
+    os.makedirs(config_dir)
+    config = {
+        "inference": {"local_endpoint": mock_url + "/api/generate", "health_endpoint": mock_url + "/api/tags",
+                      "timeout_seconds": 5},
+        "reliability": {"circuit_breaker_cooldown": 1},
+        "cache": {"enabled": False},
+    }
+    with open(os.path.join(config_dir, "antigravity_config.json"), "w") as f:
+        json.dump(config, f)
+    os.environ["HOME"] = home
+    return home
+
+def bench_cli_start(runs):
+    """Wall time of CLI invocations without a daemon, next to a bare interpreter start."""
+    script = os.path.join(HERE, "ag_hybrid_router.py")
+    commands = {
+        "python_baseline": [sys.executable, "-c", "pass"],
+        "help": [sys.executable, script, "--help"],
+        "cloud_prompt": [sys.executable, script, "--no-daemon", "--route", "cloud", "Plan a design."],
+    }
+    results = {}
+    for name, argv in commands.items():
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            samples.append(time.perf_counter() - start)
+        results[name] = _summary(samples)
+    return results
+
+def bench_classify(router, iterations):
+    """classify_task() calls per second on a short prompt and on a 100 KB one."""
+    results = {}
+    for name, prompt in (("small", SMALL_PROMPT), ("100kb", LARGE_PROMPT)):
+        router.classify_task(prompt) # Builds the classifier
+        start = time.perf_counter()
+        for _ in range(iterations):
+            router.classify_task(prompt)
+        elapsed = time.perf_counter() - start
+        results[name] = {"calls": iterations, "per_second": round(iterations / elapsed, 1),
+                         "us_per_call": round(elapsed / iterations * 1e6, 2)}
+    return results
+
+def _append_usage(count):
+    import stats_journal
+    for i in range(count):
+        stats_journal.append_record({"type": "usage", "entry": {
+            "timestamp": datetime.datetime.now().isoformat(), "route": "cloud", "tokens": 1,
+            "latency": 0, "prompt_preview": f"bench {i}"}})
+
+def _update_stats(count):
+    import ag_hybrid_router
+    def bump(stats):
+        stats["bench_updates"] = stats.get("bench_updates", 0) + 1
+    for _ in range(count):
+        ag_hybrid_router.update_stats(bump)
+
+def _run_writers(target, writers, count):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=target, args=(count,)) for _ in range(writers)]
+    start = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    return time.perf_counter() - start
+
+def bench_stats_writers(stats_journal, writers, count):
+    """
+    Stats writes per second with `writers` concurrent processes: journal appends (the hot
+    path) and full update_stats() read-modify-writes. `lost` counts writes that didn't land.
+    """
+    results = {}
+    before = stats_journal.read_stats().get("total_cloud_tokens", 0)
+    elapsed = _run_writers(_append_usage, writers, count)
+    landed = stats_journal.read_stats().get("total_cloud_tokens", 0) - before
+    results["journal_append"] = {"writers": writers, "writes": writers * count,
+                                 "per_second": round(writers * count / elapsed, 1), "lost": writers * count - landed}
+
+    updates = max(1, count // 10)
+    before = stats_journal.read_stats().get("bench_updates", 0)
+    elapsed = _run_writers(_update_stats, writers, updates)
+    landed = stats_journal.read_stats().get("bench_updates", 0) - before
+    results["update_stats"] = {"writers": writers, "writes": writers * updates,
+                               "per_second": round(writers * updates / elapsed, 1), "lost": writers * updates - landed}
+    return results
+
+def bench_end_to_end(router, mock, requests):
+    """
+    Latency of routed local requests (classification included) against the mock, and the
+    router's overhead on top of the mock's own generation time.
+    """
+    mock.mode, mock.latency, mock.tps, mock.response_tokens = "ok", 0.02, 1000.0, 20
+    generation = mock.latency + mock.response_tokens / mock.tps
+    results = {}
+    for name, stream in (("blocking", False), ("streaming", True)):
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            assert router.classify_task(SMALL_PROMPT) == "local"
+            router.call_local_ollama(SMALL_PROMPT, stream=stream, on_token=lambda token: None, use_cache=False)
+            samples.append(time.perf_counter() - start)
+        summary = _summary(samples)
+        summary["overhead_p50_ms"] = round(summary["p50_ms"] - generation * 1000, 3)
+        results[name] = summary
+    return results
+
+def _until(predicate, timeout=30):
+    start = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("benchmark condition not reached")
+        time.sleep(0.005)
+    return time.perf_counter() - start
+
+def bench_breaker(router, mock):
+    """
+    Time to trip the circuit breaker on injected failures (HTTP 500s, then hangs), and
+    to close it again once the mock recovers (includes the configured cooldown).
+    """
+    mock.latency, mock.response_tokens = 0.0, 5
+    results = {"threshold": router.CIRCUIT_BREAKER_FAIL_THRESHOLD, "cooldown_s": router.CIRCUIT_BREAKER_COOLDOWN}
+    state = lambda: router.get_circuit_state().get("health")
+
+    def local_answers():
+        return router.classify_task(SMALL_PROMPT) == "local" and \
+            router.call_local_ollama(SMALL_PROMPT, stream=False, use_cache=False) is not None
+
+    for mode, timeout in (("fail", router.LOCAL_TIMEOUT), ("hang", 0.25)):
+        saved_timeout, router.LOCAL_TIMEOUT = router.LOCAL_TIMEOUT, timeout
+        mock.mode, mock.hang_seconds = mode, 1
+        try:
+            trip = _until(lambda: router.call_local_ollama(SMALL_PROMPT, stream=False, use_cache=False) is None
+                          and state() == "Degraded")
+        finally:
+            router.LOCAL_TIMEOUT = saved_timeout
+        mock.mode = "ok"
+        recovery = _until(local_answers)
+        results[mode] = {"trip_ms": round(trip * 1000, 3), "recovery_ms": round(recovery * 1000, 3)}
+    return results
+
+def bench_dashboard(bridge_monitor, stats_journal, seconds, clients):
+    """
+    Requests per second and latency percentiles per dashboard endpoint, with `clients`
+    keep-alive connections. Endpoints stuck at the delayed-ACK latency are listed under "stalled".
+    """
+    stats_journal.append_records([{"type": "usage", "entry": {
+        "timestamp": datetime.datetime.now().isoformat(), "route": "local", "tokens": 50, "latency": 0.5,
+        "prompt_preview": f"seed {i}"}} for i in range(200)])
+    server = bridge_monitor.MonitorServer(("127.0.0.1", 0), bridge_monitor.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    results = {}
+    try:
+        for path in DASHBOARD_ENDPOINTS:
+            counts = [0] * clients
+            errors = [0] * clients
+            latencies = [[] for _ in range(clients)]
+            deadline = time.perf_counter() + seconds
+
+            def client(i):
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+                    resp = conn.getresponse()
+                    resp.read()
+                    latencies[i].append(time.perf_counter() - start)
+                    if resp.status >= 400:
+                        errors[i] += 1
+                    counts[i] += 1
+                conn.close()
+
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            summary = _summary([sample for samples in latencies for sample in samples])
+            results[path] = dict(summary, requests=sum(counts), per_second=round(sum(counts) / seconds, 1), errors=sum(errors))
+    finally:
+        bridge_monitor.stop_server(server)
+    stalled = [path for path in DASHBOARD_ENDPOINTS if delayed_ack_stall(results[path])]
+    if stalled:
+        print(f"[!] Dashboard: {', '.join(stalled)} sit at the ~40 ms delayed-ACK latency (Nagle on a kept-alive "
+              "connection?)", file=sys.stderr)
+        results["stalled"] = stalled
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                                    capture_output=True, text=True).stdout.strip())
+    except OSError:
+        commit, dirty = None, None
+    return {
+        "commit": commit or None,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+BENCHMARKS = ("cli_start", "classify", "stats_writers", "end_to_end", "breaker", "dashboard")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Router and monitor benchmarks (JSON output)")
+    parser.add_argument("--only", help="Comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations (a smoke run, not for comparisons)")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent processes for stats_writers")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    scale = 0.1 if args.quick else 1
+
+    mock = mock_ollama.MockOllama(seed=0)
+    setup_home(mock.start())
+    # Imported only now: their paths and config come from HOME
+    import stats_journal
+    import ag_hybrid_router as router
+    import bridge_monitor
+    router.attempt_self_healing = lambda: None
+
+    report = {"environment": environment(), "quick": args.quick, "results": {}}
+    runners = {
+        "cli_start": lambda: bench_cli_start(max(2, int(10 * scale))),
+        "classify": lambda: bench_classify(router, max(10, int(2000 * scale))),
+        "stats_writers": lambda: bench_stats_writers(stats_journal, args.writers, max(10, int(500 * scale))),
+        "end_to_end": lambda: bench_end_to_end(router, mock, max(5, int(50 * scale))),
+        "breaker": lambda: bench_breaker(router, mock),
+        "dashboard": lambda: bench_dashboard(bridge_monitor, stats_journal, max(0.5, 3 * scale), 4),
+    }
+    try:
+        for name in selected:
+            print(f"[*] Benchmark: {name}...", file=sys.stderr)
+            # The router prints progress for every request; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    report["results"][name] = runners[name]()
+                except Exception as e:
+                    report["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        mock.stop()
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
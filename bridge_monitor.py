@@ -1,5 +1,4 @@
 import http.server
-import socketserver
 import webbrowser
 import os
 import sys
@@ -8,244 +7,1018 @@ import time
 import json
 import requests
 import datetime
-import fcntl
+import collections
+import urllib.parse
+import gzip
+import socket
+import signal
+import concurrent.futures
+import hashlib
+
+import stats_journal
+import health_state
+import metrics_store
+import model_warmup
+import host_load
+import admission
+import backend_pool
+import tracing
 
 PORT = 8501
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 HOME_DIR = os.path.expanduser("~")
 GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
-STATS_FILE = os.path.join(GLOBAL_CONFIG_DIR, "usage_stats.json")
-HEALTH_API_URL = "http://localhost:11434/api/tags"
-CIRCUIT_BREAKER_COOLDOWN = 300
+STATS_FILE = stats_journal.STATS_FILE
+
+def load_config():
+    """The router's config, so the watchdog probes and preloads the same model and reports the same queue."""
+    try:
+        with open(os.path.join(GLOBAL_CONFIG_DIR, "antigravity_config.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+CONFIG = load_config()
+INFERENCE = CONFIG.get("inference", {})
+RELIABILITY = CONFIG.get("reliability", {})
+admission.MAX_CONCURRENCY = CONFIG.get("admission", {}).get("max_local_concurrency", admission.MAX_CONCURRENCY)
+HEALTH_API_URL = INFERENCE.get("health_endpoint", "http://localhost:11434/api/tags")
+LOCAL_API_URL = INFERENCE.get("local_endpoint", "http://localhost:11434/api/generate")
+LOCAL_MODEL = INFERENCE.get("local_model", "gemma3:1b")
+KEEP_ALIVE = INFERENCE.get("keep_alive", model_warmup.KEEP_ALIVE)
+POOL = backend_pool.load_pool(INFERENCE, LOCAL_API_URL, LOCAL_MODEL)
+CIRCUIT_BREAKER_COOLDOWN = RELIABILITY.get("circuit_breaker_cooldown", 300)
+# Watchdog cadence: probes back off from MIN to MAX while healthy (staying under
+# health_state.MAX_AGE_SECONDS so routers rarely probe themselves) and run every
+# FAST seconds while the circuit is open or recovering.
+WATCHDOG_TICK = 1
+COMPACT_INTERVAL = 5
+PROBE_TIMEOUT = 3
+PROBE_INTERVAL_FAST = 1
+PROBE_INTERVAL_MIN = 2
+PROBE_INTERVAL_MAX = 10
+LEGACY_LOG_FILE = os.path.expanduser("~/gemma_savings.log")
+LEGACY_STATE_FILE = os.path.join(GLOBAL_CONFIG_DIR, "legacy_ingest.json")
+LEGACY_INDEX_LIMIT = 5000
+FEED_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE_SECONDS = 15
+TRACES_LIMIT = 200 # Most traces /api/traces returns at once
+
+# HTTP serving
+MAX_WORKERS = 64 # Connections handled concurrently (open event streams count too)
+KEEPALIVE_TIMEOUT = 5 # Idle keep-alive connections are closed after this many seconds
+STATIC_MAX_AGE = 60
+GZIP_LEVEL = 6
+GZIP_MIN_BYTES = 512
+COMPRESSIBLE_TYPES = {"application/json", "text/html", "text/css", "text/javascript", "application/javascript", "text/plain"}
+
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+DEFAULT_METRICS_WINDOW = "24h"
+
+def parse_window(query, now=None):
+    """(start, end) from ?start=&end= (unix seconds), or ?window=<n>m|h|d ending now."""
+    now = time.time() if now is None else now
+    end = float(query.get("end", [now])[0])
+    if "start" in query:
+        start = float(query["start"][0])
+    else:
+        window = query.get("window", [DEFAULT_METRICS_WINDOW])[0]
+        start = end - float(window[:-1]) * WINDOW_UNITS[window[-1]]
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+def compressible(content_type, content):
+    return content_type.split(";")[0].strip() in COMPRESSIBLE_TYPES and len(content) >= GZIP_MIN_BYTES
+
+# Local generation latency histogram buckets for /metrics (seconds)
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120)
+HEALTH_STATES = ("Healthy", "Retrying", "Degraded")
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+def _resident_gauge(probe):
+    resident = probe.get("resident")
+    return -1 if resident is None else int(bool(resident))
+
+class PromMetrics:
+    """
+    Aggregates behind /metrics. StatsFeed updates them from each journal record it
+    folds in, so a scrape only formats numbers that are already in memory. Like any
+    Prometheus counter they start from zero when the monitor starts (token totals
+    come from the stats themselves).
+    """
+    def __init__(self):
+        self.requests = {} # (route, outcome) -> count
+        self.breaker_trips = 0
+        self.self_healing = {} # result -> count
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.cold_starts = 0
+        self.hedges = {} # winner -> hedged requests
+        self.load_seconds = 0.0
+
+    def observe(self, record, health_before, health_after):
+        kind = record.get("type")
+        if kind == "usage":
+            entry = record.get("entry") or {}
+            route = entry.get("route", "unknown")
+            ok = record.get("ok", True)
+            key = (route, "ok" if ok else "error")
+            self.requests[key] = self.requests.get(key, 0) + 1
+            latency = entry.get("latency") or 0
+            if route == "local" and ok and latency > 0:
+                self.latency_count += 1
+                self.latency_sum += latency
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if latency <= bound:
+                        self.latency_buckets[i] += 1
+            load = entry.get("load_duration") or 0
+            if route == "local" and load > model_warmup.COLD_LOAD_SECONDS:
+                self.cold_starts += 1
+                self.load_seconds += load
+        elif kind == "failure":
+            key = ("local", "error")
+            self.requests[key] = self.requests.get(key, 0) + 1
+        elif kind == "hedge":
+            entry = record.get("entry") or {}
+            if entry.get("hedged"):
+                winner = entry.get("winner") or "none"
+                self.hedges[winner] = self.hedges.get(winner, 0) + 1
+        elif kind == "event":
+            event = record.get("event") or {}
+            if event.get("kind") == "self_healing":
+                result = "restarted" if event.get("level") == "SUCCESS" else "failed"
+                self.self_healing[result] = self.self_healing.get(result, 0) + 1
+
+        if health_after == "Degraded" and health_before != "Degraded":
+            self.breaker_trips += 1
+
+    def render(self, stats, now=None):
+        """Prometheus text exposition format."""
+        now = time.time() if now is None else now
+        health = stats.get("health", "Healthy")
+        cooldown = 0
+        if health != "Healthy":
+            cooldown = max(0, stats.get("last_fail_time", 0) + CIRCUIT_BREAKER_COOLDOWN - now)
+        probe = health_state.read_probe() or {}
+
+        lines = [
+            "# HELP gemma_bridge_tokens_total Tokens processed, by route.",
+            "# TYPE gemma_bridge_tokens_total counter",
+        ]
+        for route, key in (("local", "total_local_tokens"), ("cloud", "total_cloud_tokens"), ("cache", "total_cache_tokens")):
+            lines.append(f"gemma_bridge_tokens_total{_labels(route=route)} {stats.get(key, 0)}")
+
+        lines += [
+            "# HELP gemma_bridge_requests_total Requests, by route and outcome.",
+            "# TYPE gemma_bridge_requests_total counter",
+        ]
+        for (route, outcome), count in sorted(self.requests.items()):
+            lines.append(f"gemma_bridge_requests_total{_labels(route=route, outcome=outcome)} {count}")
+
+        lines += [
+            "# HELP gemma_bridge_circuit_breaker_trips_total Transitions of the circuit breaker into Degraded.",
+            "# TYPE gemma_bridge_circuit_breaker_trips_total counter",
+            f"gemma_bridge_circuit_breaker_trips_total {self.breaker_trips}",
+            "# HELP gemma_bridge_self_healing_restarts_total Self-healing restarts of the local service, by result.",
+            "# TYPE gemma_bridge_self_healing_restarts_total counter",
+        ]
+        for result in ("restarted", "failed"):
+            lines.append(f"gemma_bridge_self_healing_restarts_total{_labels(result=result)} {self.self_healing.get(result, 0)}")
+
+        lines += [
+            "# HELP gemma_bridge_health_state Current circuit breaker state (1 for the active state).",
+            "# TYPE gemma_bridge_health_state gauge",
+        ]
+        for state in HEALTH_STATES:
+            lines.append(f"gemma_bridge_health_state{_labels(state=state)} {1 if health == state else 0}")
+        lines += [
+            "# HELP gemma_bridge_fail_count Consecutive local failures counted by the circuit breaker.",
+            "# TYPE gemma_bridge_fail_count gauge",
+            f"gemma_bridge_fail_count {stats.get('fail_count', 0)}",
+            "# HELP gemma_bridge_cooldown_remaining_seconds Seconds until the circuit breaker cooldown expires.",
+            "# TYPE gemma_bridge_cooldown_remaining_seconds gauge",
+            f"gemma_bridge_cooldown_remaining_seconds {round(cooldown, 3)}",
+            "# HELP gemma_bridge_ollama_up Last published health probe of the local service.",
+            "# TYPE gemma_bridge_ollama_up gauge",
+            f"gemma_bridge_ollama_up {1 if probe.get('alive') else 0}",
+            "# HELP gemma_bridge_model_resident Whether the watchdog last saw the local model loaded (-1 unknown).",
+            "# TYPE gemma_bridge_model_resident gauge",
+            f"gemma_bridge_model_resident {_resident_gauge(probe)}",
+        ]
+        pressure = probe.get("pressure") or {}
+        for name, key, help_text in (
+            ("host_load_per_cpu", "load_per_cpu", "1-minute load average divided by the CPU count."),
+            ("host_memory_available_ratio", "mem_available_ratio", "MemAvailable as a share of MemTotal."),
+            ("host_swap_pages_per_second", "swap_pages_per_second", "Pages swapped in and out per second."),
+        ):
+            if pressure.get(key) is not None:
+                lines += [f"# HELP gemma_bridge_{name} {help_text}", f"# TYPE gemma_bridge_{name} gauge",
+                          f"gemma_bridge_{name} {pressure[key]}"]
+        queue = admission.snapshot(now)
+        totals = stats.get("admission") or {}
+        lines += [
+            "# HELP gemma_bridge_local_slots Concurrent local generations allowed across all routers.",
+            "# TYPE gemma_bridge_local_slots gauge",
+            f"gemma_bridge_local_slots {queue['slots']}",
+            "# HELP gemma_bridge_local_slots_busy Local generations running now.",
+            "# TYPE gemma_bridge_local_slots_busy gauge",
+            f"gemma_bridge_local_slots_busy {queue['busy']}",
+            "# HELP gemma_bridge_local_queue_depth Requests waiting for a local slot, by priority.",
+            "# TYPE gemma_bridge_local_queue_depth gauge",
+        ]
+        for priority, count in sorted(queue["waiting"].items()):
+            lines.append(f"gemma_bridge_local_queue_depth{_labels(priority=priority)} {count}")
+        lines += [
+            "# HELP gemma_bridge_local_queue_oldest_wait_seconds How long the oldest queued request has waited.",
+            "# TYPE gemma_bridge_local_queue_oldest_wait_seconds gauge",
+            f"gemma_bridge_local_queue_oldest_wait_seconds {queue['oldest_wait']}",
+            "# HELP gemma_bridge_local_queue_wait_seconds_total Time admitted local requests spent queued.",
+            "# TYPE gemma_bridge_local_queue_wait_seconds_total counter",
+            f"gemma_bridge_local_queue_wait_seconds_total {totals.get('wait_seconds', 0)}",
+            "# HELP gemma_bridge_local_diverted_total Local requests sent to the cloud because the queue was too long.",
+            "# TYPE gemma_bridge_local_diverted_total counter",
+            f"gemma_bridge_local_diverted_total {totals.get('diverted', 0)}",
+        ]
+        sessions = stats.get("sessions") or {}
+        lines += [
+            "# HELP gemma_bridge_session_turns_total Local generations that continued a --session.",
+            "# TYPE gemma_bridge_session_turns_total counter",
+            f"gemma_bridge_session_turns_total {sessions.get('turns', 0)}",
+            "# HELP gemma_bridge_session_reused_tokens_total Context tokens reused instead of evaluated again.",
+            "# TYPE gemma_bridge_session_reused_tokens_total counter",
+            f"gemma_bridge_session_reused_tokens_total {sessions.get('reused_tokens', 0)}",
+            "# HELP gemma_bridge_session_prefill_saved_seconds_total Estimated prompt evaluation time saved by reused context.",
+            "# TYPE gemma_bridge_session_prefill_saved_seconds_total counter",
+            f"gemma_bridge_session_prefill_saved_seconds_total {sessions.get('prefill_saved_seconds', 0)}",
+        ]
+        if POOL:
+            nodes = stats.get("nodes") or {}
+            lines += [
+                "# HELP gemma_bridge_node_health_state Circuit breaker state of each pool node (1 for the active state).",
+                "# TYPE gemma_bridge_node_health_state gauge",
+            ]
+            for node in POOL:
+                node_health = nodes.get(node.name, {}).get("health", "Healthy")
+                for state in HEALTH_STATES:
+                    lines.append(f"gemma_bridge_node_health_state{_labels(node=node.name, state=state)} {1 if node_health == state else 0}")
+            lines += [
+                "# HELP gemma_bridge_node_outstanding Requests running or queued on each pool node.",
+                "# TYPE gemma_bridge_node_outstanding gauge",
+            ]
+            for node in POOL:
+                lines.append(f"gemma_bridge_node_outstanding{_labels(node=node.name)} {admission.outstanding(node.name, node.capacity)}")
+            probed = probe.get("nodes") or {}
+            lines += [
+                "# HELP gemma_bridge_node_up Last watchdog probe of each pool node.",
+                "# TYPE gemma_bridge_node_up gauge",
+            ]
+            for node in POOL:
+                lines.append(f"gemma_bridge_node_up{_labels(node=node.name)} {1 if (probed.get(node.name) or {}).get('alive') else 0}")
+            lines += [
+                "# HELP gemma_bridge_node_model_resident Whether the watchdog last saw each pool node's model loaded (-1 unknown).",
+                "# TYPE gemma_bridge_node_model_resident gauge",
+            ]
+            for node in POOL:
+                lines.append(f"gemma_bridge_node_model_resident{_labels(node=node.name)} {_resident_gauge(probed.get(node.name) or {})}")
+        lines += [
+            "# HELP gemma_bridge_hedged_requests_total Local requests that also raced the cloud, by winning leg.",
+            "# TYPE gemma_bridge_hedged_requests_total counter",
+        ]
+        for winner, count in sorted(self.hedges.items()):
+            lines.append(f"gemma_bridge_hedged_requests_total{_labels(winner=winner)} {count}")
+        lines += [
+            "# HELP gemma_bridge_local_cold_starts_total Local generations that had to load the model first.",
+            "# TYPE gemma_bridge_local_cold_starts_total counter",
+            f"gemma_bridge_local_cold_starts_total {self.cold_starts}",
+            "# HELP gemma_bridge_local_load_seconds_total Time local generations spent loading the model.",
+            "# TYPE gemma_bridge_local_load_seconds_total counter",
+            f"gemma_bridge_local_load_seconds_total {round(self.load_seconds, 3)}",
+            "# HELP gemma_bridge_local_latency_seconds End-to-end latency of successful local generations.",
+            "# TYPE gemma_bridge_local_latency_seconds histogram",
+        ]
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            lines.append(f"gemma_bridge_local_latency_seconds_bucket{_labels(le=bound)} {count}")
+        lines += [
+            f'gemma_bridge_local_latency_seconds_bucket{{le="+Inf"}} {self.latency_count}',
+            f"gemma_bridge_local_latency_seconds_sum {round(self.latency_sum, 4)}",
+            f"gemma_bridge_local_latency_seconds_count {self.latency_count}",
+        ]
+        return "\n".join(lines) + "\n"
+
+class StatsFeed:
+    """
+    In-memory, versioned view of the usage stats. It tails the journal and numbers
+    every record it folds in, so clients can ask for only what changed since their
+    version ("<instance>:<seq>") instead of re-downloading the whole file.
+    """
+    def __init__(self, max_changes=500):
+        self.instance = os.urandom(4).hex()
+        self.tail = stats_journal.JournalTail()
+        self.cond = threading.Condition()
+        self.stats = None
+        self.seq = 0
+        self.changes = collections.deque(maxlen=max_changes) # (seq, record type, payload)
+        self.bodies = {}
+        self.metrics = PromMetrics()
+
+    def version(self):
+        return f"{self.instance}:{self.seq}"
+
+    def refresh(self):
+        """Folds in new journal records. Returns True if the version changed."""
+        with self.cond:
+            records = self.tail.poll() if self.stats is not None else None
+            if records is None:
+                # First load, or the tail lost track: clients get a full reset
+                self.stats = self.tail.start()
+                self.changes.clear()
+                self.seq += 1
+                records = []
+            elif not records:
+                return False
+            for record in records:
+                health_before = self.stats.get("health")
+                stats_journal.apply_record(self.stats, record)
+                self.metrics.observe(record, health_before, self.stats.get("health"))
+                self.seq += 1
+                kind = record.get("type")
+                self.changes.append((self.seq, kind, record.get("entry") if kind == "usage" else record.get("event")))
+            self.bodies = {}
+            self.cond.notify_all()
+            return True
+
+    def _ensure_loaded(self):
+        if self.stats is None:
+            self.refresh()
+
+    def full_stats(self):
+        return {k: v for k, v in self.stats.items() if k != "journal"}
+
+    def summary(self):
+        return {k: v for k, v in self.full_stats().items() if not isinstance(v, list)}
+
+    def stats_body(self, compressed=False):
+        """
+        (version, serialized full stats, gzipped copy or None). Both are only
+        rebuilt after a change, however many clients are polling.
+        """
+        with self.cond:
+            self._ensure_loaded()
+            if "raw" not in self.bodies:
+                self.bodies["raw"] = json.dumps(self.full_stats()).encode('utf-8')
+            if compressed and "gzip" not in self.bodies:
+                self.bodies["gzip"] = gzip.compress(self.bodies["raw"], GZIP_LEVEL)
+            return self.version(), self.bodies["raw"], self.bodies.get("gzip") if compressed else None
+
+    def delta(self, since=None):
+        """Changes after version `since`, or a full reset if that version is unknown or too old."""
+        with self.cond:
+            self._ensure_loaded()
+            instance, _, seq = (since or "").partition(":")
+            seq = int(seq) if instance == self.instance and seq.isdigit() else -1
+            oldest = self.changes[0][0] if self.changes else self.seq + 1
+            if seq < 0 or seq > self.seq or seq < oldest - 1:
+                return {"version": self.version(), "reset": True, "stats": self.full_stats()}
+
+            delta = {"version": self.version(), "reset": False, "summary": self.summary(), "history": [], "events": []}
+            for change_seq, kind, payload in self.changes:
+                if change_seq <= seq:
+                    continue
+                if kind == "usage":
+                    delta["history"].append(payload)
+                elif kind == "event":
+                    delta["events"].append(payload)
+            return delta
+
+    def prometheus(self):
+        with self.cond:
+            self._ensure_loaded()
+            return self.metrics.render(self.stats)
+
+    def wait(self, since, timeout):
+        """Blocks until the version differs from `since`. Returns False on timeout."""
+        with self.cond:
+            self._ensure_loaded()
+            return self.cond.wait_for(lambda: self.version() != since, timeout)
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[!] Stats Feed Error: {e}")
+            time.sleep(FEED_POLL_INTERVAL)
+
+FEED = StatsFeed()
+
+def queue_status():
+    """Live local-inference queue (from the admission files) plus the journaled wait and diversion totals."""
+    status = admission.snapshot()
+    with FEED.cond:
+        FEED._ensure_loaded()
+        status["totals"] = dict(FEED.stats.get("admission") or {})
+        nodes = dict(FEED.stats.get("nodes") or {})
+    status["totals"].pop("recent", None)
+    if POOL:
+        probed = (health_state.read_probe() or {}).get("nodes") or {}
+        status["nodes"] = {node.name: dict(admission.snapshot(node=node.name, capacity=node.capacity),
+                                           model=node.model, health=(nodes.get(node.name) or {}).get("health", "Healthy"),
+                                           alive=(probed.get(node.name) or {}).get("alive"))
+                           for node in POOL}
+    return status
+
+STATIC_CACHE = {} # path -> (etag, raw bytes, gzipped bytes or None)
 
 class Handler(http.server.SimpleHTTPRequestHandler):
+    # Keep-alive: every response carries a Content-Length. Headers and body are separate
+    # writes, so without TCP_NODELAY each body waits on the client's delayed ACK (~40 ms).
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
 
     def do_GET(self):
-        if self.path == '/':
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/':
             self.send_response(302)
             self.send_header('Location', '/dashboard.html')
+            self.send_header('Content-Length', '0')
             self.end_headers()
             return
-        elif self.path == '/usage_stats.json':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
+        elif url.path == '/usage_stats.json':
+            self.serve_stats()
+            return
+        elif url.path == '/api/stats':
+            self.send_json(FEED.delta(query.get('since', [None])[0]))
+            return
+        elif url.path == '/metrics':
+            self.send_body(FEED.prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+            return
+        elif url.path == '/api/metrics':
+            self.serve_metrics(query)
+            return
+        elif url.path == '/api/queue':
+            self.send_json(queue_status())
+            return
+        elif url.path == '/api/traces':
             try:
-                if os.path.exists(STATS_FILE):
-                if os.path.exists(STATS_FILE):
-                    with open(STATS_FILE, 'r') as f:
-                         # Shared lock for reading - allows other readers but blocks writers
-                        fcntl.flock(f, fcntl.LOCK_SH)
-                        try:
-                            content = f.read()
-                            self.wfile.write(content.encode('utf-8'))
-                        finally:
-                            fcntl.flock(f, fcntl.LOCK_UN)
-                else:
-                    self.wfile.write(b'{}')
-            except Exception as e:
-                 print(f"Error serving stats: {e}")
+                limit = max(1, min(TRACES_LIMIT, int(query.get('limit', [20])[0])))
+            except ValueError:
+                limit = 20
+            self.send_json({"traces": tracing.read_recent(limit)})
+            return
+        elif url.path == '/api/stream':
+            # EventSource reconnects carry the last seen version in Last-Event-ID
+            self.stream_stats(self.headers.get('Last-Event-ID') or query.get('since', [None])[0])
+            return
+        self.serve_static()
+
+    def accepts_gzip(self):
+        return 'gzip' in self.headers.get('Accept-Encoding', '')
+
+    def send_body(self, content, content_type, headers=None, gzipped=None):
+        """Sends a complete 200 response, gzipped for clients that accept it. gzipped: a cached compressed copy."""
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        if compressible(content_type, content):
+            self.send_header('Vary', 'Accept-Encoding')
+            if self.accepts_gzip():
+                content = gzipped or gzip.compress(content, GZIP_LEVEL)
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_not_modified(self, headers):
+        self.send_response(304)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def send_json(self, payload):
+        self.send_body(json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def serve_stats(self):
+        try:
+            version, content, gzipped = FEED.stats_body(compressed=self.accepts_gzip())
+        except Exception as e:
+            print(f"Error serving stats: {e}")
+            self.send_body(b'{}', 'application/json')
+            return
+        headers = {'ETag': f'"{version}"', 'Cache-Control': 'no-cache'}
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.send_not_modified(headers)
+            return
+        self.send_body(content, 'application/json', headers, gzipped)
+
+    def serve_metrics(self, query):
+        """Long-term rollups for any window, e.g. /api/metrics?window=7d&route=local"""
+        try:
+            start, end = parse_window(query)
+            resolution = int(query["resolution"][0]) if "resolution" in query else None
+            if resolution is not None and resolution not in metrics_store.RESOLUTIONS:
+                raise ValueError(f"resolution must be one of {sorted(metrics_store.RESOLUTIONS)}")
+        except (KeyError, ValueError) as e:
+            self.send_error(400, f"Bad metrics query: {e}")
+            return
+        try:
+            result = metrics_store.query_range(start, end, resolution,
+                                               query.get("route", [None])[0], query.get("model", [None])[0])
+        except Exception as e:
+            print(f"Error querying metrics: {e}")
+            self.send_error(500, "Metrics store unavailable")
             return
-        super().do_GET()
+        self.send_json(result)
+
+    def serve_static(self):
+        """Files from DIRECTORY, kept in memory (and pre-compressed) until they change on disk."""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            super().do_GET() # Directory redirects and listings
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': self.date_time_string(st.st_mtime),
+            'Cache-Control': f'public, max-age={STATIC_MAX_AGE}',
+        }
+        if self.headers.get('If-None-Match') == etag:
+            self.send_not_modified(headers)
+            return
+
+        content_type = self.guess_type(path)
+        cached = STATIC_CACHE.get(path)
+        if cached is None or cached[0] != etag:
+            try:
+                with open(path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                self.send_error(404, "File not found")
+                return
+            cached = (etag, content, gzip.compress(content, GZIP_LEVEL) if compressible(content_type, content) else None)
+            STATIC_CACHE[path] = cached
+        self.send_body(cached[1], content_type, headers, cached[2])
+
+    def stream_stats(self, since):
+        """Server-Sent Events: one "delta" event per change, comments as keep-alives."""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        stopping = getattr(self.server, "stopping", None)
+        idle = 0
+        try:
+            while not (stopping and stopping.is_set()):
+                # Short waits so server shutdown isn't held up by open streams
+                if FEED.wait(since, 1):
+                    delta = FEED.delta(since)
+                    since = delta["version"]
+                    self.wfile.write(f"id: {since}\nevent: delta\ndata: {json.dumps(delta)}\n\n".encode('utf-8'))
+                    idle = 0
+                else:
+                    idle += 1
+                    if idle < SSE_KEEPALIVE_SECONDS:
+                        continue
+                    self.wfile.write(b": keep-alive\n\n")
+                    idle = 0
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
 
     def log_message(self, format, *args):
         pass
 
-def ingest_legacy_logs(stats):
-    legacy_file = os.path.expanduser("~/gemma_savings.log")
-    if not os.path.exists(legacy_file):
+def parse_legacy_line(line):
+    """
+    Parses "Fri Jan 30 05:15:33 PM EST 2026: Saved 31 tokens (Gemma 1B) - Test Ping"
+    into (datetime, tokens, message). Returns None for lines in any other format.
+    """
+    try:
+        parts = line.split(": Saved ")
+        if len(parts) < 2:
+            return None
+
+        date_str_raw = parts[0]
+        rest = parts[1]
+
+        # Extract tokens
+        tokens = int(rest.split(" tokens")[0])
+
+        # Extract Message
+        if ") - " in rest:
+            message = rest.split(") - ")[1]
+        else:
+            message = "Legacy Log Task"
+
+        # Parse Date - Remove Timezone (EST/EDT)
+        d_tokens = date_str_raw.split()
+        if len(d_tokens) == 7: # Has Timezone
+            d_tokens.pop(5)
+        dt = datetime.datetime.strptime(" ".join(d_tokens), "%a %b %d %I:%M:%S %p %Y")
+        return dt, tokens, message
+    except ValueError:
+        return None
+
+def _line_key(line):
+    return hashlib.sha1(line.encode("utf-8")).hexdigest()[:16]
+
+def _tail_mark(f, offset):
+    """Fingerprint of the bytes just before offset. Inode numbers get reused, so a
+    rewritten file is only trusted to continue at offset if these still match."""
+    start = max(0, offset - 256)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()[:16]
+
+class LegacyLogIngester:
+    """
+    Imports ~/gemma_savings.log incrementally. It remembers the inode and byte offset it
+    has consumed, so a tick with nothing new costs a single stat(). If the file is rotated
+    or truncated it starts over from the top, and a hashed index of imported lines (plus
+    (timestamp, tokens) keys from the history) keeps duplicates out.
+    """
+    def __init__(self, log_file=None, state_file=None):
+        self.log_file = log_file or LEGACY_LOG_FILE
+        self.state_file = state_file or LEGACY_STATE_FILE
+        self.state = self._load_state()
+        self.pending = None
+
+    def _load_state(self):
+        state = {"inode": None, "mark": None, "offset": 0, "imported": []}
+        try:
+            with open(self.state_file, "r") as f:
+                saved = json.load(f)
+            if isinstance(saved, dict):
+                state.update(saved)
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def collect(self, stats):
+        """Returns usage records for lines appended since the last commit()."""
+        self.pending = None
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            return []
+        same_file = self.state["inode"] == st.st_ino and self.state["offset"] <= st.st_size
+        if same_file and self.state["offset"] == st.st_size:
+            return []
+
+        with open(self.log_file, "rb") as f:
+            offset = 0
+            if same_file and _tail_mark(f, self.state["offset"]) == self.state.get("mark"):
+                offset = self.state["offset"]
+            f.seek(offset)
+            data = f.read()
+            end = data.rfind(b"\n") + 1 # A line still being written waits for the next tick
+            if not end:
+                return []
+            mark = _tail_mark(f, offset + end)
+
+        seen_lines = set(self.state["imported"])
+        seen_times = {} # tokens -> local history times
+        for event in stats.get("history", []):
+            original = (event.get("metadata") or {}).get("original_line")
+            if original:
+                seen_lines.add(_line_key(original))
+            if event.get("route") == "local":
+                try:
+                    event_dt = datetime.datetime.fromisoformat(event.get("timestamp", ""))
+                except ValueError:
+                    continue
+                seen_times.setdefault(event.get("tokens"), []).append(event_dt)
+
+        records = []
+        new_keys = []
+        for raw in data[:end].decode("utf-8", "replace").split("\n"):
+            line = raw.strip()
+            parsed = parse_legacy_line(line) if line else None
+            if parsed is None:
+                continue
+            dt, tokens, message = parsed
+            key = _line_key(line)
+            # Legacy times have 1 s precision: same tokens less than 2 s apart (either way) is the same task
+            if key in seen_lines or any(abs((t - dt).total_seconds()) < 2 for t in seen_times.get(tokens, ())):
+                continue
+
+            print(f"[*] Importing legacy log: {message}")
+            entry = {
+                "timestamp": dt.isoformat(),
+                "route": "local",
+                "tokens": tokens,
+                "latency": 0,
+                "prompt_preview": message,
+                "metadata": {
+                    "source": "legacy_log_file",
+                    "original_line": line
+                }
+            }
+            records.append({"type": "usage", "entry": entry})
+            seen_lines.add(key)
+            seen_times.setdefault(tokens, []).append(dt)
+            new_keys.append(key)
+
+        self.pending = {
+            "inode": st.st_ino,
+            "mark": mark,
+            "offset": offset + end,
+            "imported": (self.state["imported"] + new_keys)[-LEGACY_INDEX_LIMIT:]
+        }
+        return records
+
+    def commit(self):
+        """Persists the position reached by collect(). Call once its records are in the journal."""
+        if self.pending is None:
+            return
+        self.state, self.pending = self.pending, None
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            tmp = f"{self.state_file}.tmp.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            print(f"[!] Legacy Ingest Error: {e}")
+
+def probe_ollama():
+    try:
+        resp = requests.get(HEALTH_API_URL, timeout=PROBE_TIMEOUT)
+        return resp.status_code == 200
+    except Exception:
         return False
-    
-    changed = False
+
+def probe_node(node):
+    """(alive, resident) for one pool node: its /api/tags answers 200, and its model is loaded (None: unknown)."""
     try:
-        with open(legacy_file, "r") as f:
-            lines = f.readlines()
-            
-        # Parse and merge
-        for line in lines:
-            line = line.strip()
-            if not line: continue
-            
-            # Simple dedup based on raw line content stored in metadata or recreating the line
-            # Better: Check matching timestamp + tokens
-            try:
-                # Format: Fri Jan 30 05:15:33 PM EST 2026: Saved 31 tokens (Gemma 1B) - Test Ping
-                parts = line.split(": Saved ")
-                if len(parts) < 2: continue
-                
-                date_str_raw = parts[0]
-                rest = parts[1]
-                
-                # Extract tokens
-                tokens_str = rest.split(" tokens")[0]
-                tokens = int(tokens_str)
-                
-                # Extract Message
-                if ") - " in rest:
-                    message = rest.split(") - ")[1]
-                else:
-                    message = "Legacy Log Task"
-
-                # Parse Date - Remove Timezone (EST/EDT)
-                # "Fri Jan 30 05:15:33 PM EST 2026"
-                d_tokens = date_str_raw.split()
-                if len(d_tokens) == 7: # Has Timezone
-                    d_tokens.pop(5) 
-                
-                clean_date = " ".join(d_tokens)
-                dt = datetime.datetime.strptime(clean_date, "%a %b %d %I:%M:%S %p %Y")
-                iso_time = dt.isoformat()
-                
-                # Check for duplicates in history
-                is_duplicate = False
-                for event in stats.get("history", []):
-                    # Check if source is legacy match OR if timestamp is identical
-                    # Since legacy log has 1-second precision, exact match on parsed time might fail if ISO has microseconds
-                    # We check if ISO starts with the legacy time string (up to seconds)
-                    if event.get("metadata", {}).get("original_line") == line:
-                        is_duplicate = True
-                        break
-                    
-                    # Also check fuzzy time match to avoid re-importing things that were migrated differently
-                    event_dt = datetime.datetime.fromisoformat(event["timestamp"])
-                    if abs((event_dt - dt).total_seconds()) < 2 and event["tokens"] == tokens and event["route"] == "local":
-                         is_duplicate = True
-                         break
-                
-                if not is_duplicate:
-                    print(f"[*] Importing legacy log: {message}")
-                    stats["history"].append({
-                        "timestamp": iso_time,
-                        "route": "local",
-                        "tokens": tokens,
-                        "latency": 0,
-                        "prompt_preview": message,
-                        "metadata": {
-                            "source": "legacy_log_file",
-                            "original_line": line
-                        }
-                    })
-                    stats["total_local_tokens"] += tokens
-                    changed = True
-            except Exception as e:
-                # print(f"Log Parse Error: {e}")
-                pass
-                
-    except Exception as e:
-        print(f"[!] Legacy Ingest Error: {e}")
-        
-    return changed
+        alive = requests.get(model_warmup.api_url(node.endpoint, "tags"), timeout=PROBE_TIMEOUT).status_code == 200
+    except Exception:
+        return False, False
+    if not alive:
+        return False, False
+    return True, model_warmup.is_resident(requests, node.endpoint, node.model, timeout=PROBE_TIMEOUT)
+
+def probe_pool(stats, now=None):
+    """
+    Probes every pool node in parallel. Returns ({name: {"alive", "resident"}}, journal records):
+    each node's breaker recovers like the single-service circuit, compare-and-set on its own
+    state, and a recovering node gets its model preloaded first.
+    """
+    names = [node.name for node in POOL]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(POOL)) as executor:
+        outcomes = list(executor.map(probe_node, POOL))
+    results, records = {}, []
+    for node, (alive, resident) in zip(POOL, outcomes):
+        results[node.name] = {"alive": alive, "resident": resident}
+        state = backend_pool.node_state(stats, node.name)
+        if alive and resident is False and state.get("health", "Healthy") != "Healthy":
+            preload_local_model(node)
+        records.extend(health_transition(state, alive, now, ready=resident is not False, node=node.name, pool=names))
+    return results, records
+
+def preload_local_model(node=None):
+    """Loads LOCAL_MODEL (or a pool node's model) in the background, one preload at a time, and journals the outcome."""
+    endpoint, model = (node.endpoint, node.model) if node else (LOCAL_API_URL, LOCAL_MODEL)
+    where = f" on {node.name}" if node else ""
+    def _done(load):
+        if load is None:
+            level, message = "WARNING", f"Watchdog: Preloading {model}{where} failed."
+        else:
+            level, message = "INFO", f"Watchdog: Preloaded {model}{where} in {load:.1f}s."
+        print(f"[*] {message}")
+        try:
+            stats_journal.append_record({"type": "event", "event": {
+                "timestamp": datetime.datetime.now().isoformat(), "level": level, "message": message
+            }})
+        except OSError as e:
+            print(f"[!] Watchdog Error: {e}")
+    return model_warmup.preload_async(requests, endpoint, model, KEEP_ALIVE, on_done=_done)
+
+def next_probe_interval(health, is_alive, previous):
+    """Backs off while everything is healthy; probes quickly while the circuit is open or recovering."""
+    if health != "Healthy" or not is_alive:
+        return PROBE_INTERVAL_FAST
+    return min(PROBE_INTERVAL_MAX, max(PROBE_INTERVAL_MIN, previous * 2))
+
+def health_transition(stats, is_alive, now=None, ready=True, node=None, pool=None):
+    """
+    Journal records for the circuit transition a probe result calls for (compare-and-set).
+    The circuit only closes once the model is `ready` (resident); until then a live service
+    only moves Degraded to Retrying. With `node` (and the `pool` names) `stats` is that
+    node's state and the records target its breaker.
+    """
+    current_health = stats.get("health", "Healthy")
+    cooldown_elapsed = (now or time.time()) - stats.get("last_fail_time", 0)
+    if current_health not in ["Degraded", "Retrying"] or not is_alive:
+        return []
+    scope = {"node": node, "pool": pool} if node else {}
+    service = f"Pool node {node}" if node else "Service"
+    heartbeat = f"Pool node {node}" if node else "Local service"
+
+    if cooldown_elapsed > CIRCUIT_BREAKER_COOLDOWN and ready:
+        print(f"[*] Watchdog: {service} recovered. Resetting status to Healthy.")
+        return [
+            dict(scope, type="health", expect=[current_health], set={"health": "Healthy", "fail_count": 0}),
+            {"type": "event", "event": {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "level": "SUCCESS",
+                "message": f"Watchdog: {heartbeat} heartbeat recovered. Auto-resetting circuit."
+            }}
+        ]
+    if current_health == "Degraded":
+        # If alive but still in cooldown (or loading the model), move to Half-Open/Retrying
+        print(f"[*] Watchdog: {service} alive, waiting for cooldown.")
+        return [dict(scope, type="health", expect=["Degraded"], set={"health": "Retrying"})]
+    return []
 
 def watchdog_loop():
     print("[*] Watchdog: Proactive health monitoring started.")
+    legacy = LegacyLogIngester()
+    stats, stats_token = None, None
+    last_health = None
+    interval = PROBE_INTERVAL_MIN
+    next_probe = next_compact = 0
+    pressure = None
+
     while True:
         try:
-            if os.path.exists(STATS_FILE):
-        try:
-            if os.path.exists(STATS_FILE):
-                # OPEN WITH LOCK for atomic Read-Update-Write
-                with open(STATS_FILE, "r+") as f:
-                    fcntl.flock(f, fcntl.LOCK_EX)
-                    try:
-                        f.seek(0)
-                        content = f.read()
-                        if not content.strip():
-                             stats = {}
-                        else:
-                             stats = json.loads(content)
-                        
-                        save_needed = False
-                        
-                        # 1. Legacy Log Ingestion
-                        if ingest_legacy_logs(stats):
-                            save_needed = True
-
-                        current_health = stats.get("health", "Healthy")
-                        last_fail = stats.get("last_fail_time", 0)
-                        cooldown_elapsed = time.time() - last_fail
-                        
-                        # 2. Proactive Recovery Check
-                        if current_health in ["Degraded", "Retrying"]:
-                            # We release lock briefly if we are going to do network IO? 
-                            # Ideally no, but if we do, we risk state change.
-                            # Since this is local heartbeat, it's fast (ms). 
-                            # Blocking write for 10ms is fine.
-                            try:
-                                # Heartbeat check
-                                resp = requests.get(HEALTH_API_URL, timeout=3)
-                                is_alive = resp.status_code == 200
-                            except:
-                                is_alive = False
-                            
-                            if is_alive and cooldown_elapsed > CIRCUIT_BREAKER_COOLDOWN:
-                                print(f"[*] Watchdog: Service recovered. Resetting status to Healthy.")
-                                stats["health"] = "Healthy"
-                                stats["fail_count"] = 0
-                                
-                                # Add Event
-                                stats["events"] = stats.get("events", [])
-                                stats["events"].append({
-                                    "timestamp": datetime.datetime.now().isoformat(),
-                                    "level": "SUCCESS",
-                                    "message": "Watchdog: Local service heartbeat recovered. Auto-resetting circuit."
-                                })
-                                stats["events"] = stats["events"][-50:]
-                                save_needed = True
-                                
-                            elif is_alive and current_health == "Degraded":
-                                # If alive but still in cooldown, move to Half-Open/Retrying
-                                print("[*] Watchdog: Service alive, waiting for cooldown.")
-                                stats["health"] = "Retrying"
-                                save_needed = True
-                        
-                        if save_needed:
-                            stats["history"] = sorted(stats["history"], key=lambda x: x["timestamp"]) # Sort by time
-                            f.seek(0)
-                            f.truncate()
-                            json.dump(stats, f, indent=4)
-                            f.flush()
-                            os.fsync(f.fileno())
-                            
-                    finally:
-                        fcntl.flock(f, fcntl.LOCK_UN)
-            
+            now = time.monotonic()
+
+            # 1. Periodic compaction of the usage journal into the snapshot
+            #    (the exclusive lock is only taken when there are records to fold)
+            if now >= next_compact:
+                next_compact = now + COMPACT_INTERVAL
+                if stats_journal.has_pending():
+                    stats_journal.compact(blocking=False)
+
+            # 2. Re-read the stats only when the snapshot or journal changed on disk
+            token = stats_journal.change_token()
+            if token != stats_token:
+                stats, stats_token = stats_journal.read_stats(), token
+
+            # 3. Legacy Log Ingestion (only lines appended since the last tick)
+            records = legacy.collect(stats)
+
+            # A router just changed the circuit state: check on the service right away
+            # (with a pool, the first node that isn't Healthy sets the pace)
+            health = stats.get("health", "Healthy")
+            if POOL:
+                node_health = (backend_pool.node_state(stats, node.name).get("health", "Healthy") for node in POOL)
+                health = next((h for h in node_health if h != "Healthy"), health)
+            if health != last_health:
+                next_probe, last_health = now, health
+
+            # 4. Heartbeat with no lock held, published so routers never probe on their
+            #    hot path. A router that just talked to Ollama counts as a fresh probe.
+            if now >= next_probe and POOL:
+                # Every node is probed: a pool has no single endpoint to vouch for it
+                results, node_records = probe_pool(stats)
+                is_alive = all(result["alive"] for result in results.values())
+                pressure = host_load.read_pressure(pressure)
+                health_state.write_probe(any(result["alive"] for result in results.values()), "watchdog",
+                                         nodes=results, pressure=pressure)
+                records.extend(node_records)
+                interval = next_probe_interval(health, is_alive, interval)
+                next_probe = now + interval
+            elif now >= next_probe:
+                probe = health_state.read_probe()
+                resident = None
+                if (health == "Healthy" and probe and probe.get("alive") and probe.get("source") != "watchdog"
+                        and time.time() - probe.get("checked_at", 0) < interval):
+                    is_alive = True
+                else:
+                    is_alive = probe_ollama()
+                    if is_alive:
+                        resident = model_warmup.is_resident(requests, LOCAL_API_URL, LOCAL_MODEL, timeout=PROBE_TIMEOUT)
+                    # Host pressure rides along so routers can route on it without sampling /proc
+                    pressure = host_load.read_pressure(pressure)
+                    health_state.write_probe(is_alive, "watchdog", resident=resident if is_alive else False,
+                                             pressure=pressure)
+
+                # 5. Proactive Recovery Check. A recovering service gets its model loaded
+                #    before the circuit closes (None: Ollama too old to report, assume ready).
+                if is_alive and resident is False and health != "Healthy":
+                    preload_local_model()
+                records.extend(health_transition(stats, is_alive, ready=resident is not False))
+                interval = next_probe_interval(health, is_alive, interval)
+                next_probe = now + interval
+
+            # Compare-and-set records are no-ops if a router changed the state meanwhile
+            stats_journal.append_records(records)
+            legacy.commit()
+
         except Exception as e:
             print(f"[!] Watchdog Error: {e}")
-            
-        time.sleep(5)
+
+        time.sleep(WATCHDOG_TICK)
+
+class MonitorServer(http.server.HTTPServer):
+    """
+    HTTP server that hands each connection to a bounded worker pool, so slow clients
+    and open event streams only tie up their own worker. server_close() drops the
+    open connections and waits for the workers to finish.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, workers=MAX_WORKERS):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="monitor-http")
+        self.stopping = threading.Event()
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        self.pool.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+            self.shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-response are routine, not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+    def server_close(self):
+        self.stopping.set()
+        super().server_close()
+        with self.connections_lock:
+            for request in list(self.connections):
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.pool.shutdown(wait=True)
 
 def start_server():
-    socketserver.TCPServer.allow_reuse_address = True
     try:
-        with socketserver.TCPServer(("", PORT), Handler) as httpd:
-            print(f"[*] Bridge Monitor running at http://localhost:{PORT}")
-            httpd.serve_forever()
+        httpd = MonitorServer(("", PORT), Handler)
     except OSError as e:
         print(f"[!] Error starting server: {e}")
         sys.exit(1)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    print(f"[*] Bridge Monitor running at http://localhost:{PORT}")
+    return httpd
+
+def stop_server(httpd):
+    httpd.shutdown()
+    httpd.server_close()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
 
 def main():
-    if not os.path.exists(STATS_FILE):
+    if not os.path.exists(STATS_FILE) and not os.path.exists(stats_journal.JOURNAL_FILE):
         print("[!] Warning: usage_stats.json not found.")
 
+    # Warm the local model so the first request after a boot or restart isn't a cold load
+    if probe_ollama():
+        preload_local_model()
+
     # Start Watchdog
     threading.Thread(target=watchdog_loop, daemon=True).start()
+
+    # Follow the usage journal for the dashboard API
+    threading.Thread(target=FEED.run, daemon=True).start()
     
     # Start Server
-    threading.Thread(target=start_server, daemon=True).start()
+    httpd = start_server()
 
-    time.sleep(1)
     url = f"http://localhost:{PORT}/dashboard.html"
     print(f"[*] Opening {url}...")
     # webbrowser.open(url) # Uncomment for local use
 
+    # systemd stops the service with SIGTERM; shut down the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, _interrupt)
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n[*] Stopping Bridge Monitor.")
+        stop_server(httpd)
         sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import pytest
+
+import stats_journal
+import metrics_store
+import admission
+import health_state
+import session_store
+import response_cache
+import tracing
+import mock_ollama
+
+
+@pytest.fixture
+def state_dir(monkeypatch, tmp_path):
+    """Points every module's on-disk state (journal, metrics, queues, probe, sessions, cache, traces) at tmp_path."""
+    monkeypatch.setattr(stats_journal, "GLOBAL_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(stats_journal, "STATS_FILE", str(tmp_path / "usage_stats.json"))
+    monkeypatch.setattr(stats_journal, "JOURNAL_FILE", str(tmp_path / "usage_journal.jsonl"))
+    monkeypatch.setattr(stats_journal, "FSYNC", False)
+    monkeypatch.setattr(metrics_store, "GLOBAL_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics_store, "METRICS_FILE", str(tmp_path / "metrics.sqlite3"))
+    monkeypatch.setattr(admission, "ADMISSION_DIR", str(tmp_path / "admission"))
+    monkeypatch.setattr(health_state, "GLOBAL_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(health_state, "PROBE_FILE", str(tmp_path / "ollama_health.json"))
+    monkeypatch.setattr(session_store, "SESSION_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(response_cache, "CACHE_DIR", str(tmp_path / "response_cache"))
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    return tmp_path
+
+
+@pytest.fixture
+def ollama(state_dir, monkeypatch):
+    """
+    A MockOllama the router uses as its only local backend, with load routing off and a
+    fresh circuit-breaker view. Tests reconfigure the mock (latency, tps, mode...) as needed.
+    """
+    import ag_hybrid_router as router
+    mock = mock_ollama.MockOllama(latency=0, tps=0, response_tokens=2)
+    mock.start()
+    monkeypatch.setattr(router, "LOCAL_API_URL", mock.url + "/api/generate")
+    monkeypatch.setattr(router, "HEALTH_API_URL", mock.url + "/api/tags")
+    monkeypatch.setattr(router, "LOAD_ROUTING", False)
+    router.invalidate_circuit_state()
+    yield mock
+    mock.stop()
+    router.invalidate_circuit_state()
@@ -0,0 +1,176 @@
+"""
+Fast path for `ag_hybrid_router.py --log-only`, which GEMINI.md has agents run after
+every local task.
+
+Logging a finished task needs none of the routing machinery. This module imports only
+stats_journal and a few standard modules, validates metadata with json alone, and
+appends the usage record to the journal. The bulk form commits every record of a JSONL
+file (or stdin) in one grouped write:
+
+    ag_hybrid_router.py --log-only --bulk tasks.jsonl
+    ag_hybrid_router.py --log-only --bulk - < tasks.jsonl
+
+Each line is a prompt string or an object with "prompt" and optional "route",
+"metadata", "tokens", "latency" and "timestamp". Arguments the fast path does not
+understand fall back to the full router CLI, which reports them.
+"""
+import os
+import sys
+import json
+import datetime
+
+import stats_journal
+
+CONFIG_FILE = os.path.join(stats_journal.GLOBAL_CONFIG_DIR, "antigravity_config.json")
+ROUTES = ("local", "cloud", "auto")
+DEFAULT_METADATA = {"source": "antigravity"}
+EXTERNAL_RESPONSE = "[External Process]"
+MAX_METADATA_BYTES = 4096
+VALUE_FLAGS = ("--route", "--metadata", "--bulk")
+
+def parse_args(argv):
+    """
+    {"prompt", "route", "metadata", "bulk"} from --log-only arguments, or None when there
+    is anything else (the full CLI then handles, or rejects, them).
+    """
+    options = {"route": "auto", "metadata": None, "bulk": None}
+    words = []
+    args = iter(argv)
+    for arg in args:
+        if arg in ("--log-only", "--no-daemon"):
+            continue
+        name, eq, value = arg.partition("=")
+        if name in VALUE_FLAGS:
+            if not eq:
+                value = next(args, None)
+                if value is None:
+                    return None
+            options[name[2:]] = value
+        elif arg.startswith("-") and arg != "-":
+            return None
+        else:
+            words.append(arg)
+    if options["route"] not in ROUTES:
+        return None
+    options["prompt"] = " ".join(words)
+    return options
+
+def validate_metadata(value):
+    """Metadata as a dict: a JSON object given as text (--metadata) or already parsed (bulk lines)."""
+    if isinstance(value, str):
+        if len(value.encode("utf-8")) > MAX_METADATA_BYTES:
+            raise ValueError(f"metadata is larger than {MAX_METADATA_BYTES} bytes")
+        try:
+            value = json.loads(value)
+        except ValueError as e:
+            raise ValueError(f"metadata is not valid JSON ({e})")
+    if not isinstance(value, dict):
+        raise ValueError("metadata must be a JSON object")
+    if len(json.dumps(value).encode("utf-8")) > MAX_METADATA_BYTES:
+        raise ValueError(f"metadata is larger than {MAX_METADATA_BYTES} bytes")
+    return value
+
+def make_record(prompt, route, metadata, tokens=None, latency=0, timestamp=None):
+    """The same usage record the router's log_usage() writes for an external task."""
+    # Unclassified external logs count as cloud, as they always have
+    route = "cloud" if route == "auto" else route
+    if tokens is None:
+        tokens = len(prompt + EXTERNAL_RESPONSE) // 4 # The router's estimate_tokens()
+    entry = {
+        "timestamp": timestamp or datetime.datetime.now().isoformat(),
+        "route": route,
+        "tokens": tokens,
+        "latency": round(latency, 2),
+        "prompt_preview": prompt[:50] + "..." if len(prompt) > 50 else prompt,
+        "metadata": metadata,
+    }
+    return {"type": "usage", "ok": True, "resets_circuit": route == "local", "entry": entry}
+
+def parse_bulk_line(line, route, metadata):
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"prompt": item}
+    if not isinstance(item, dict) or not isinstance(item.get("prompt"), str) or not item["prompt"]:
+        raise ValueError('expected a prompt string or an object with a "prompt"')
+    item_route = item.get("route", route)
+    if item_route not in ROUTES:
+        raise ValueError(f"unknown route {item_route!r}")
+    tokens = item.get("tokens")
+    if tokens is not None and (not isinstance(tokens, int) or isinstance(tokens, bool) or tokens < 0):
+        raise ValueError('"tokens" must be a non-negative integer')
+    latency = item.get("latency", 0)
+    if not isinstance(latency, (int, float)) or isinstance(latency, bool) or latency < 0:
+        raise ValueError('"latency" must be a non-negative number')
+    timestamp = item.get("timestamp")
+    if timestamp is not None and not isinstance(timestamp, str):
+        raise ValueError('"timestamp" must be an ISO 8601 string')
+    item_metadata = validate_metadata(item["metadata"]) if "metadata" in item else metadata
+    return make_record(item["prompt"], item_route, item_metadata, tokens, latency, timestamp)
+
+def read_bulk(lines, route, metadata):
+    """(records, [(line number, error)]) from JSONL lines; blank lines are skipped."""
+    records, errors = [], []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            records.append(parse_bulk_line(line, route, metadata))
+        except ValueError as e:
+            errors.append((number, str(e)))
+    return records, errors
+
+def apply_config():
+    """The journal settings of the "stats" config section (the only part logging needs)."""
+    try:
+        with open(CONFIG_FILE, "r") as f:
+            stats = json.load(f).get("stats", {})
+    except (OSError, ValueError, AttributeError):
+        return
+    stats_journal.FSYNC = stats.get("journal_fsync", stats_journal.FSYNC)
+    stats_journal.COMPACT_THRESHOLD_BYTES = stats.get("compact_threshold_bytes", stats_journal.COMPACT_THRESHOLD_BYTES)
+    stats_journal.METRICS = stats.get("long_term_metrics", stats_journal.METRICS)
+
+def log(prompt, route="auto", metadata=None, bulk=None, stdin=None, cwd=None):
+    """Records one external task, or every line of `bulk` ('-' for stdin). Returns the exit code."""
+    try:
+        metadata = validate_metadata(metadata) if metadata is not None else dict(DEFAULT_METADATA)
+    except ValueError as e:
+        print(f"[!] Invalid --metadata: {e}", file=sys.stderr)
+        return 2
+
+    errors = []
+    if bulk:
+        try:
+            if bulk == "-":
+                records, errors = read_bulk(stdin or sys.stdin, route, metadata)
+            else:
+                with open(os.path.join(cwd, bulk) if cwd else bulk, "r") as f:
+                    records, errors = read_bulk(f, route, metadata)
+        except OSError as e:
+            print(f"[!] Cannot read {bulk}: {e}", file=sys.stderr)
+            return 2
+        for number, error in errors:
+            print(f"[!] Line {number} skipped: {error}", file=sys.stderr)
+    elif prompt:
+        records = [make_record(prompt, route, metadata)]
+        print(f"[*] Unified Logging: Recording {records[0]['entry']['route']}-only event...")
+    else:
+        return 0
+
+    try:
+        stats_journal.append_records(records)
+    except OSError as e:
+        print(f"[!] Error updating stats file: {e}", file=sys.stderr)
+        return 1
+    if bulk:
+        print(f"[*] Unified Logging: Recorded {len(records)} events" +
+              (f" ({len(errors)} invalid lines skipped)." if errors else "."))
+    return 1 if errors else 0
+
+def main(argv):
+    """Exit code, or None when the arguments need the full router CLI."""
+    options = parse_args(argv)
+    if options is None:
+        return None
+    apply_config()
+    return log(options["prompt"], options["route"], options["metadata"], options["bulk"])
@@ -0,0 +1,62 @@
+"""
+Shared, cached Ollama liveness state.
+
+The watchdog (bridge_monitor.py) probes the health endpoint in the background and
+publishes the result with a timestamp. Routers read it instead of making a blocking
+probe before every generation, and only probe themselves when the cached state is stale.
+"""
+import os
+import json
+import time
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+PROBE_FILE = os.path.join(GLOBAL_CONFIG_DIR, "ollama_health.json")
+
+MAX_AGE_SECONDS = 15
+
+def read_probe():
+    """Returns the last published probe {"alive", "checked_at", "source"} or None."""
+    try:
+        with open(PROBE_FILE, "r") as f:
+            probe = json.load(f)
+        return probe if isinstance(probe, dict) else None
+    except (OSError, ValueError):
+        return None
+
+def write_probe(alive, source, **fields):
+    probe = dict(fields, alive=bool(alive), checked_at=time.time(), source=source)
+    os.makedirs(GLOBAL_CONFIG_DIR, exist_ok=True)
+    tmp = f"{PROBE_FILE}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(probe, f)
+    os.replace(tmp, PROBE_FILE)
+    return probe
+
+def cached_probe(max_age=None):
+    """The published probe if it is younger than max_age, else None."""
+    max_age = MAX_AGE_SECONDS if max_age is None else max_age
+    probe = read_probe()
+    if probe is None or time.time() - probe.get("checked_at", 0) > max_age:
+        return None
+    return probe
+
+def cached_alive(max_age=None):
+    """True/False from a fresh probe, or None if there is no probe younger than max_age."""
+    probe = cached_probe(max_age)
+    return None if probe is None else probe.get("alive", False)
+
+def note_result(alive, source):
+    """
+    Records what a real request just observed. Only rewrites the file when it changes
+    the published state or the state is getting stale, so the hot path stays cheap.
+    """
+    probe = read_probe()
+    if (probe is None or probe.get("alive") != bool(alive)
+            or time.time() - probe.get("checked_at", 0) > MAX_AGE_SECONDS / 2):
+        # Host pressure published by the watchdog stays valid whatever the request saw
+        fields = {"pressure": probe["pressure"]} if probe and "pressure" in probe else {}
+        try:
+            write_probe(alive, source, **fields)
+        except OSError:
+            pass
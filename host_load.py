@@ -0,0 +1,94 @@
+"""
+Host pressure and local latency prediction for load-aware routing.
+
+On a 4-core / 8 GB box the router used to find out it was overloaded only when
+LOCAL_TIMEOUT expired. predict() estimates how long a local generation of a prompt
+would take from the latency EWMA that stats_journal folds into the stats
+("local_perf"), scaled by the current CPU contention. The router uses it to send
+work to the cloud up front and to size the local timeout.
+"""
+import os
+import time
+
+PROC_LOADAVG = "/proc/loadavg"
+PROC_MEMINFO = "/proc/meminfo"
+PROC_VMSTAT = "/proc/vmstat"
+
+# Thrashing limits: below this share of MemAvailable, or above this swap rate, skip local
+MIN_MEM_AVAILABLE_RATIO = 0.10
+MAX_SWAP_PAGES_PER_SECOND = 256
+
+MIN_SAMPLES = 3 # EWMA samples needed before predictions are trusted
+TIMEOUT_MARGIN = 3 # Local timeout = predicted latency x margin ...
+MIN_TIMEOUT_SECONDS = 10 # ... but never below this
+
+def _read_fields(path):
+    fields = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.replace(":", " ").split()
+                if len(parts) >= 2:
+                    fields[parts[0]] = int(parts[1])
+    except (OSError, ValueError):
+        pass
+    return fields
+
+def read_pressure(previous=None):
+    """
+    Snapshot of host pressure. With a `previous` snapshot the swap counters are turned
+    into swap_pages_per_second; fields that can't be read (non-Linux) are None.
+    """
+    pressure = {"sampled_at": time.time(), "load_per_cpu": None, "mem_available_ratio": None,
+                "swap_pages": None, "swap_pages_per_second": None}
+    try:
+        with open(PROC_LOADAVG, "r") as f:
+            pressure["load_per_cpu"] = round(float(f.read().split()[0]) / (os.cpu_count() or 1), 3)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    meminfo = _read_fields(PROC_MEMINFO)
+    if meminfo.get("MemTotal") and "MemAvailable" in meminfo:
+        pressure["mem_available_ratio"] = round(meminfo["MemAvailable"] / meminfo["MemTotal"], 4)
+
+    vmstat = _read_fields(PROC_VMSTAT)
+    if "pswpin" in vmstat and "pswpout" in vmstat:
+        pressure["swap_pages"] = vmstat["pswpin"] + vmstat["pswpout"]
+        if previous and previous.get("swap_pages") is not None:
+            elapsed = pressure["sampled_at"] - previous["sampled_at"]
+            if elapsed > 0:
+                rate = (pressure["swap_pages"] - previous["swap_pages"]) / elapsed
+                pressure["swap_pages_per_second"] = round(max(0, rate), 1)
+    return pressure
+
+def load_factor(pressure):
+    """How much slower than on an idle host a CPU-bound generation runs (>= 1)."""
+    load = (pressure or {}).get("load_per_cpu")
+    return max(1.0, load) if load is not None else 1.0
+
+def thrashing(pressure):
+    """A reason string when memory pressure would make local generation crawl, else None."""
+    pressure = pressure or {}
+    mem = pressure.get("mem_available_ratio")
+    if mem is not None and mem < MIN_MEM_AVAILABLE_RATIO:
+        return f"only {mem:.0%} memory available"
+    swap = pressure.get("swap_pages_per_second")
+    if swap is not None and swap > MAX_SWAP_PAGES_PER_SECOND:
+        return f"swapping {swap:.0f} pages/s"
+    return None
+
+def predict(perf, prompt_tokens, pressure=None):
+    """
+    Predicted local latency in seconds for a prompt of prompt_tokens, or None until
+    MIN_SAMPLES generations have been measured. perf is stats["local_perf"].
+    """
+    if not perf or perf.get("samples", 0) < MIN_SAMPLES:
+        return None
+    tokens = prompt_tokens + perf.get("response_tokens", 0)
+    return round(perf["seconds_per_token"] * tokens * load_factor(pressure), 2)
+
+def timeout_for(predicted, ceiling):
+    """Local timeout that follows the prediction, bounded by [MIN_TIMEOUT_SECONDS, ceiling]."""
+    if predicted is None:
+        return ceiling
+    return min(ceiling, max(MIN_TIMEOUT_SECONDS, predicted * TIMEOUT_MARGIN))
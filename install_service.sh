@@ -2,6 +2,7 @@
 set -e
 
 SERVICE_FILE="gemma-bridge.service"
+ROUTER_SERVICE_FILE="gemma-router.service"
 USER_SYSTEMD_DIR="$HOME/.config/systemd/user"
 
 echo "[*] Creating systemd user directory..."
@@ -9,6 +10,7 @@ mkdir -p "$USER_SYSTEMD_DIR"
 
 echo "[*] Copying service file..."
 cp "$SERVICE_FILE" "$USER_SYSTEMD_DIR/"
+cp "$ROUTER_SERVICE_FILE" "$USER_SYSTEMD_DIR/"
 
 echo "[*] Initializing global configuration directory..."
 GLOBAL_CONFIG_DIR="$HOME/.config/gemma-bridge"
@@ -24,6 +26,8 @@ systemctl --user daemon-reload
 
 echo "[*] Enabling and starting service..."
 systemctl --user enable --now gemma-bridge.service
+systemctl --user enable --now gemma-router.service
 
 echo "[*] Checking status..."
 systemctl --user status gemma-bridge.service --no-pager
+systemctl --user status gemma-router.service --no-pager
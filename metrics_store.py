@@ -0,0 +1,244 @@
+"""
+Long-term metrics for the Gemma bridge.
+
+usage_stats.json only keeps the last 100 requests. This store keeps every request in
+SQLite: raw rows for RAW_RETENTION_SECONDS, plus per-minute, per-hour and per-day
+rollups per route and model. Each rollup carries a log-bucketed latency histogram, so
+percentiles for any window come from merging bucket counts, not from raw rows.
+
+Records arrive through stats_journal compaction. The store saves how far into each
+journal epoch it has ingested in the same transaction as the data, so a compaction
+that crashes and is retried never counts a record twice.
+"""
+import os
+import json
+import math
+import time
+import sqlite3
+import datetime
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+METRICS_FILE = os.path.join(GLOBAL_CONFIG_DIR, "metrics.sqlite3")
+
+# Rollup width in seconds -> retention in seconds (None keeps forever)
+RESOLUTIONS = {60: 2 * 86400, 3600: 90 * 86400, 86400: None}
+RAW_RETENTION_SECONDS = 30 * 86400
+MAX_POINTS = 500
+
+# Histogram bucket i covers latencies up to MIN * GROWTH**i: percentiles are within ~10%
+HISTOGRAM_MIN_SECONDS = 0.001
+HISTOGRAM_GROWTH = 2 ** 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    ts REAL NOT NULL, route TEXT NOT NULL, model TEXT NOT NULL, tokens INTEGER NOT NULL,
+    latency REAL, ttft REAL, tps REAL, ok INTEGER NOT NULL, source TEXT
+);
+CREATE INDEX IF NOT EXISTS requests_ts ON requests (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL, bucket INTEGER NOT NULL, route TEXT NOT NULL, model TEXT NOT NULL,
+    requests INTEGER NOT NULL, errors INTEGER NOT NULL, tokens INTEGER NOT NULL,
+    latency_count INTEGER NOT NULL, latency_sum REAL NOT NULL, histogram TEXT NOT NULL,
+    PRIMARY KEY (resolution, bucket, route, model)
+);
+CREATE TABLE IF NOT EXISTS journal_position (
+    id INTEGER PRIMARY KEY CHECK (id = 0), epoch TEXT, offset INTEGER NOT NULL
+);
+"""
+
+def histogram_index(seconds):
+    if seconds <= HISTOGRAM_MIN_SECONDS:
+        return 0
+    return math.ceil(math.log(seconds / HISTOGRAM_MIN_SECONDS, HISTOGRAM_GROWTH))
+
+def histogram_bound(index):
+    return HISTOGRAM_MIN_SECONDS * HISTOGRAM_GROWTH ** index
+
+def merge_histograms(into, other):
+    for index, count in other.items():
+        into[index] = into.get(index, 0) + count
+    return into
+
+def quantile(histogram, q):
+    """Upper bound of the bucket holding the q-quantile, or None for an empty histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = q * total
+    running = 0
+    for index in sorted(histogram):
+        running += histogram[index]
+        if running >= rank:
+            return round(histogram_bound(index), 4)
+    return round(histogram_bound(max(histogram)), 4)
+
+def _load_histogram(text):
+    return {int(k): v for k, v in json.loads(text).items()}
+
+def connect(path=None):
+    os.makedirs(GLOBAL_CONFIG_DIR, exist_ok=True)
+    conn = sqlite3.connect(path or METRICS_FILE, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL") # Dashboard queries never block compaction
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _to_epoch(timestamp):
+    try:
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def request_rows(records):
+    """(ts, route, model, tokens, latency, ttft, tps, ok, source) for each usage or failure record."""
+    rows = []
+    for record in records:
+        kind = record.get("type")
+        if kind == "usage":
+            entry = record.get("entry") or {}
+            ts = _to_epoch(entry.get("timestamp"))
+            if ts is None:
+                continue
+            rows.append((
+                ts, entry.get("route", ""), entry.get("model", ""), entry.get("tokens", 0),
+                entry.get("latency"), entry.get("ttft"), entry.get("tps"),
+                1 if record.get("ok", True) else 0, (entry.get("metadata") or {}).get("source")
+            ))
+        elif kind == "failure" and record.get("time"):
+            # Failed local generations only show up as circuit-breaker records
+            rows.append((record["time"], "local", record.get("model", ""), 0, None, None, None, 0, None))
+    return rows
+
+def _rollup(rows):
+    rollups = {}
+    for ts, route, model, tokens, latency, _ttft, _tps, ok, _source in rows:
+        for resolution in RESOLUTIONS:
+            key = (resolution, int(ts // resolution) * resolution, route, model)
+            agg = rollups.setdefault(key, {"requests": 0, "errors": 0, "tokens": 0,
+                                           "latency_count": 0, "latency_sum": 0.0, "histogram": {}})
+            agg["requests"] += 1
+            agg["errors"] += 0 if ok else 1
+            agg["tokens"] += tokens or 0
+            # Log-only records carry no measured latency and stay out of the percentiles
+            if ok and latency:
+                agg["latency_count"] += 1
+                agg["latency_sum"] += latency
+                index = histogram_index(latency)
+                agg["histogram"][index] = agg["histogram"].get(index, 0) + 1
+    return rollups
+
+def _merge_rollups(conn, rollups):
+    for (resolution, bucket, route, model), agg in rollups.items():
+        row = conn.execute(
+            "SELECT requests, errors, tokens, latency_count, latency_sum, histogram FROM rollups "
+            "WHERE resolution = ? AND bucket = ? AND route = ? AND model = ?",
+            (resolution, bucket, route, model)).fetchone()
+        if row:
+            agg["requests"] += row[0]
+            agg["errors"] += row[1]
+            agg["tokens"] += row[2]
+            agg["latency_count"] += row[3]
+            agg["latency_sum"] += row[4]
+            merge_histograms(agg["histogram"], _load_histogram(row[5]))
+        conn.execute(
+            "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (resolution, bucket, route, model, agg["requests"], agg["errors"], agg["tokens"],
+             agg["latency_count"], agg["latency_sum"], json.dumps(agg["histogram"])))
+
+def _prune(conn, now):
+    conn.execute("DELETE FROM requests WHERE ts < ?", (now - RAW_RETENTION_SECONDS,))
+    for resolution, retention in RESOLUTIONS.items():
+        if retention is not None:
+            conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (resolution, now - retention))
+
+def ingest_journal(epoch, end_offset, records_from, path=None):
+    """
+    Ingests the records of journal `epoch` up to end_offset that the store hasn't seen yet.
+    records_from(offset) returns the parsed journal records from that byte offset on.
+    Returns the number of requests added.
+    """
+    conn = connect(path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT epoch, offset FROM journal_position WHERE id = 0").fetchone()
+            offset = row[1] if row and row[0] == epoch else 0
+            rows = request_rows(records_from(offset)) if offset < end_offset else []
+            conn.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            _merge_rollups(conn, _rollup(rows))
+            conn.execute("INSERT OR REPLACE INTO journal_position VALUES (0, ?, ?)", (epoch, end_offset))
+            _prune(conn, time.time())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+    finally:
+        conn.close()
+
+def pick_resolution(start, end, now=None):
+    """Finest rollup that still covers `start` and fits the window into MAX_POINTS buckets."""
+    now = time.time() if now is None else now
+    for resolution in sorted(RESOLUTIONS):
+        retention = RESOLUTIONS[resolution]
+        if retention is not None and start < now - retention:
+            continue
+        if (end - start) / resolution <= MAX_POINTS:
+            return resolution
+    return max(RESOLUTIONS)
+
+def _point(agg):
+    hist = agg["histogram"]
+    return {
+        "requests": agg["requests"],
+        "errors": agg["errors"],
+        "tokens": agg["tokens"],
+        "latency_avg": round(agg["latency_sum"] / agg["latency_count"], 4) if agg["latency_count"] else None,
+        "p50": quantile(hist, 0.50),
+        "p95": quantile(hist, 0.95),
+        "p99": quantile(hist, 0.99),
+    }
+
+def query_range(start, end, resolution=None, route=None, model=None, path=None):
+    """
+    Rollups for [start, end) as one series per (route, model), plus a summary per
+    (route, model) for the whole window with percentiles from the merged histograms.
+    """
+    resolution = resolution or pick_resolution(start, end)
+    sql = ("SELECT bucket, route, model, requests, errors, tokens, latency_count, latency_sum, histogram "
+           "FROM rollups WHERE resolution = ? AND bucket >= ? AND bucket < ?")
+    params = [resolution, int(start // resolution) * resolution, end]
+    if route:
+        sql += " AND route = ?"
+        params.append(route)
+    if model:
+        sql += " AND model = ?"
+        params.append(model)
+
+    conn = connect(path)
+    try:
+        rows = conn.execute(sql + " ORDER BY bucket", params).fetchall()
+    finally:
+        conn.close()
+
+    series = {}
+    totals = {}
+    for bucket, r, m, requests, errors, tokens, latency_count, latency_sum, histogram in rows:
+        agg = {"requests": requests, "errors": errors, "tokens": tokens, "latency_count": latency_count,
+               "latency_sum": latency_sum, "histogram": _load_histogram(histogram)}
+        series.setdefault((r, m), []).append(dict(_point(agg), t=bucket))
+
+        total = totals.setdefault((r, m), {"requests": 0, "errors": 0, "tokens": 0,
+                                           "latency_count": 0, "latency_sum": 0.0, "histogram": {}})
+        for k in ("requests", "errors", "tokens", "latency_count", "latency_sum"):
+            total[k] += agg[k]
+        merge_histograms(total["histogram"], agg["histogram"])
+
+    return {
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "series": [{"route": r, "model": m, "points": points} for (r, m), points in sorted(series.items())],
+        "summary": [dict(_point(total), route=r, model=m) for (r, m), total in sorted(totals.items())],
+    }
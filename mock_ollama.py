@@ -0,0 +1,206 @@
+"""
+Mock Ollama server for benchmarks and tests (no model, no GPU).
+
+Serves /api/generate (streamed or not), /api/tags and /api/ps with Ollama's response
+fields. Latency, decode speed and failures are configurable and can be changed while
+it runs, which is how bench_router.py trips and recovers the circuit breaker:
+
+    python3 mock_ollama.py --port 11434 --latency 0.2 --tps 40 --fail-rate 0.1
+"""
+import json
+import time
+import random
+import select
+import socket
+import argparse
+import threading
+import http.server
+
+class MockOllama:
+    """
+    latency: seconds before the first token (prefill); tps: tokens per second after it.
+    fail_rate: share of generations answered with HTTP 500; hang_rate: share that never
+    answer (until hang_seconds). mode "fail"/"hang" forces every generation to do so.
+    stall_after: a streamed generation stops for hang_seconds after that many tokens.
+    fail_requests: generation numbers (1-based, counted in `requests`) answered with HTTP 500.
+    `loaded` is what /api/ps lists (all of `models` unless loaded=False). A generation for a
+    model that isn't loaded loads it and reports load_seconds as Ollama's load_duration.
+    `received` keeps every /api/generate body; `aborted` is set once a client hangs up
+    on a streamed generation before it is done.
+    """
+    def __init__(self, latency=0.0, tps=50.0, response_tokens=20, fail_rate=0.0, hang_rate=0.0,
+                 hang_seconds=3600, models=("gemma3:1b",), seed=None, stall_after=None, loaded=True,
+                 load_seconds=0.0):
+        self.latency = latency
+        self.tps = tps
+        self.response_tokens = response_tokens
+        self.fail_rate = fail_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.stall_after = stall_after
+        self.fail_requests = set()
+        self.models = list(models)
+        self.loaded = list(models) if loaded else []
+        self.load_seconds = load_seconds
+        self.mode = "ok"
+        self.requests = 0
+        self.received = []
+        self.aborted = threading.Event()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serves in a background thread. Returns the base URL."""
+        handler = type("Handler", (_Handler,), {"mock": self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._stop.set() # Releases hung requests
+        self.server.shutdown()
+        self.server.server_close()
+
+    def outcome(self):
+        """What the next generation does: 'ok', 'fail' or 'hang'."""
+        with self._lock:
+            self.requests += 1
+            if self.requests in self.fail_requests:
+                return "fail"
+            if self.mode != "ok":
+                return self.mode
+            roll = self._random.random()
+        if roll < self.fail_rate:
+            return "fail"
+        if roll < self.fail_rate + self.hang_rate:
+            return "hang"
+        return "ok"
+
+    def sleep(self, seconds):
+        """Interruptible by stop()."""
+        return not self._stop.wait(seconds)
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._json(200, {"models": [{"name": m, "model": m} for m in self.mock.models]})
+        elif self.path.startswith("/api/ps"):
+            self._json(200, {"models": [{"name": m, "model": m} for m in self.mock.loaded]})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def _chunk(self, body):
+        line = json.dumps(body).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _pause(self, seconds):
+        """Waits `seconds` before the next token. False if the client hung up meanwhile."""
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            if not self.mock.sleep(min(0.05, deadline - time.time())):
+                return False
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                self.mock.aborted.set()
+                return False
+        return True
+
+    def do_POST(self):
+        if not self.path.startswith("/api/generate"):
+            self._json(404, {"error": "not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        mock = self.mock
+        mock.received.append(body)
+        outcome = mock.outcome()
+        if outcome == "hang":
+            mock.sleep(mock.hang_seconds)
+            self.close_connection = True
+            return
+        if outcome == "fail":
+            self._json(500, {"error": "injected failure"})
+            return
+
+        load = 0
+        with mock._lock:
+            if body.get("model") not in mock.loaded:
+                mock.loaded.append(body.get("model"))
+                load = mock.load_seconds
+        prompt_tokens = max(1, len(body.get("prompt", "")) // 4)
+        tokens = mock.response_tokens if body.get("prompt") else 0 # An empty prompt is a preload
+        per_token = 1 / mock.tps if mock.tps else 0
+        final = {
+            "model": body.get("model"), "done": True,
+            "context": body.get("context", []) + list(range(prompt_tokens + tokens)),
+            "prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(mock.latency * 1e9),
+            "eval_count": tokens, "eval_duration": int(tokens * per_token * 1e9), "load_duration": int(load * 1e9),
+        }
+        if body.get("stream", True):
+            self.send_response(200)
+            # Chunked like Ollama's own stream, so clients see each token as it is written
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            if not self._pause(mock.latency):
+                return
+            try:
+                for i in range(tokens):
+                    if i == mock.stall_after and not self._pause(mock.hang_seconds):
+                        return
+                    self._chunk({"response": f"t{i} ", "done": False})
+                    mock.sleep(per_token)
+                self._chunk(dict(final, response=""))
+                self.wfile.write(b"0\r\n\r\n")
+            except OSError:
+                mock.aborted.set() # Client went away (aborted hedge, stall timeout)
+        else:
+            mock.sleep(mock.latency + tokens * per_token)
+            self._json(200, dict(final, response=" ".join(f"t{i}" for i in range(tokens))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token")
+    parser.add_argument("--tps", type=float, default=50.0, help="Tokens per second after the first")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of generations answered with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of generations that never answer")
+    parser.add_argument("--model", action="append", help="Model names to report (repeatable)")
+    args = parser.parse_args()
+    mock = MockOllama(args.latency, args.tps, args.tokens, args.fail_rate, args.hang_rate,
+                      models=args.model or ("gemma3:1b",))
+    print(f"[*] Mock Ollama on {mock.start(args.host, args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Keeps the local model resident in Ollama.
+
+A cold model load can take longer than the generation timeout, so the first request
+after a restart (or after Ollama unloaded an idle model) would trip the circuit
+breaker again. preload() asks Ollama to load the model without generating anything,
+and is_resident() checks /api/ps so the circuit only closes once the model is loaded.
+
+Functions take the HTTP client as an argument (a requests.Session or the requests
+module), so the router can reuse its pooled session.
+"""
+import time
+import threading
+
+KEEP_ALIVE = "30m"
+PRELOAD_TIMEOUT = 120
+COLD_LOAD_SECONDS = 0.5 # A load_duration above this means the request paid for a model load
+
+def api_url(endpoint, path):
+    """http://localhost:11434/api/generate -> http://localhost:11434/api/<path>"""
+    return endpoint.split("/api/")[0] + "/api/" + path
+
+def _same_model(name, model):
+    # Untagged model names mean ":latest"
+    def norm(n):
+        return n if ":" in n else n + ":latest"
+    return bool(name) and norm(name) == norm(model)
+
+def is_resident(http, endpoint, model, timeout=2):
+    """True/False from Ollama's list of loaded models, or None if it can't be asked."""
+    try:
+        resp = http.get(api_url(endpoint, "ps"), timeout=timeout)
+        resp.raise_for_status()
+        models = resp.json().get("models", [])
+    except Exception:
+        return None
+    return any(_same_model(m.get("name") or m.get("model"), model) for m in models)
+
+def load_seconds(body):
+    """Ollama's load_duration (nanoseconds) in seconds, or None if the response has none."""
+    duration = body.get("load_duration")
+    return round(duration / 1e9, 3) if duration is not None else None
+
+def preload(http, endpoint, model, keep_alive=None, timeout=None):
+    """
+    Loads the model without generating (an empty generate request). Connection errors
+    are retried until the timeout, since this usually runs right after a restart.
+    Returns the load time in seconds, or None if the model could not be loaded.
+    """
+    timeout = timeout or PRELOAD_TIMEOUT
+    payload = {"model": model, "keep_alive": KEEP_ALIVE if keep_alive is None else keep_alive}
+    deadline = time.time() + timeout
+    while True:
+        try:
+            resp = http.post(api_url(endpoint, "generate"), json=payload, timeout=max(1, deadline - time.time()))
+            resp.raise_for_status()
+            return load_seconds(resp.json()) or 0.0
+        except Exception as e:
+            retryable = "Connection" in type(e).__name__
+            if not retryable or time.time() + 1 >= deadline:
+                return None
+            time.sleep(1)
+
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+def preload_async(http, endpoint, model, keep_alive=None, on_done=None):
+    """
+    Runs preload() in a background thread unless one for this model is already running
+    in this process. on_done(load_seconds_or_None) is called when it finishes.
+    """
+    key = (endpoint, model)
+    with _inflight_lock:
+        if key in _inflight:
+            return False
+        _inflight.add(key)
+
+    def _run():
+        try:
+            result = preload(http, endpoint, model, keep_alive)
+            if on_done:
+                on_done(result)
+        finally:
+            with _inflight_lock:
+                _inflight.discard(key)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return True
@@ -0,0 +1,104 @@
+"""
+Chunking helpers for the map-reduce pipeline (ag_hybrid_router.py --pipeline).
+
+Large inputs are memory-mapped, never read whole, and cut into token-budgeted chunks
+on line boundaries. Within the last part of a full chunk the cut prefers a line that
+starts a new definition or section (or a blank line), so chunks stay self-contained.
+Only the chunk being summarized is decoded.
+"""
+import os
+import re
+import mmap
+import hashlib
+
+CHARS_PER_TOKEN = 4 # Same estimate as the router's estimate_tokens()
+CHUNK_TOKENS = 2048
+LOOKBACK_FRACTION = 0.25 # How far back from a full chunk's end to look for a structural boundary
+BOUNDARY_RE = re.compile(
+    rb"\s*$|(?:async\s+)?def\s|class\s|function\s|func\s|fn\s|(?:export|public|private|protected|static)\s|#{1,3}\s|@\w"
+)
+
+class ChunkedFile:
+    """Chunk offsets of a memory-mapped file; text(i) decodes one chunk on demand."""
+    def __init__(self, path, chunk_tokens=None):
+        self.path = path
+        self.budget = max(1, (chunk_tokens or CHUNK_TOKENS) * CHARS_PER_TOKEN)
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.spans = list(chunk_spans(self.map, self.budget))
+
+    def __len__(self):
+        return len(self.spans)
+
+    def text(self, index):
+        start, end = self.spans[index]
+        return self.map[start:end].decode("utf-8", "replace")
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _boundary_cut(buf, cut, lowest):
+    """End of the chunk: before the last definition line in [lowest, cut), after a blank line there, or cut."""
+    line_end = cut - 1 # the newline that ends the chunk
+    while line_end > lowest:
+        nl = buf.rfind(b"\n", lowest, line_end)
+        if nl < 0:
+            break
+        line_start = nl + 1
+        line = buf[line_start:min(line_end, line_start + 64)]
+        if BOUNDARY_RE.match(line):
+            # Definitions start the next chunk; a blank line ends this one
+            return line_end + 1 if not line.strip() else line_start
+        line_end = nl
+    return cut
+
+def chunk_spans(buf, budget):
+    """(start, end) byte offsets of consecutive chunks of at most `budget` bytes."""
+    size = len(buf)
+    start = 0
+    while start < size:
+        end = min(size, start + budget)
+        if end < size:
+            nl = buf.rfind(b"\n", start, end)
+            if nl >= start:
+                end = _boundary_cut(buf, nl + 1, start + int(budget * (1 - LOOKBACK_FRACTION)))
+            else:
+                # A single line longer than the budget: split it, but not inside a UTF-8 sequence
+                while end > start + 1 and buf[end] & 0xC0 == 0x80:
+                    end -= 1
+        yield start, end
+        start = end
+
+def summary_key(model, instruction, text):
+    """Cache key of a chunk (or group) summary: the text's content hash, the instruction and the model that wrote it."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"pipeline\0{model}\0{instruction}\0{digest}".encode("utf-8")).hexdigest()
+
+def reduce_groups(summaries, budget):
+    """
+    Consecutive summaries grouped to fit `budget` characters per group. Groups hold at
+    least two summaries, so every reduce round shrinks the list.
+    """
+    groups = []
+    current, size = [], 0
+    for summary in summaries:
+        if len(current) >= 2 and size + len(summary) > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += len(summary)
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
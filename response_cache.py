@@ -0,0 +1,119 @@
+"""
+Content-addressed on-disk response cache for the hybrid router.
+
+Entries are keyed by a hash of (route, model, options, prompt) and stored one
+JSON file per key. The file mtime doubles as the LRU clock: hits touch it,
+and eviction removes the least recently used files once the cache exceeds
+MAX_BYTES. Entries older than TTL_SECONDS are treated as misses.
+
+Eviction scans the whole cache, so put() doesn't run it every time: only on about
+one put in EVICT_EVERY (sampled, so short-lived CLI processes share the work), or once
+this process has written EVICT_BYTES since its last scan. The cache can therefore
+overshoot MAX_BYTES by a few entries between scans.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+CACHE_DIR = os.path.join(GLOBAL_CONFIG_DIR, "response_cache")
+
+# Overridable from the "cache" config section. Off unless enabled: a cached answer
+# can be up to TTL_SECONDS old.
+ENABLED = False
+TTL_SECONDS = 24 * 3600
+MAX_BYTES = 32 * 1024 * 1024
+
+# How often put() runs the eviction scan (see above)
+EVICT_EVERY = 32
+EVICT_BYTES = 1024 * 1024
+
+_written = {"bytes": 0} # Bytes this process stored since its last eviction scan
+_written_lock = threading.Lock()
+
+def cache_key(route, model, options, prompt):
+    material = json.dumps([route, model, options or {}, prompt], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".json")
+
+def get(key, ttl_seconds=None):
+    """Returns the cached entry dict, or None on a miss/expired entry. ttl_seconds=0 never expires."""
+    ttl_seconds = TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    path = _path(key)
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if ttl_seconds and time.time() - entry.get("created", 0) > ttl_seconds:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return None
+
+    try:
+        os.utime(path) # Bump LRU position
+    except OSError:
+        pass
+    return entry
+
+def put(key, response, **fields):
+    """Stores a response (plus metadata such as the original latency); now and then enforces the size bound."""
+    path = _path(key)
+    entry = dict(fields, response=response, created=time.time())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+        size = f.tell()
+    os.replace(tmp, path)
+    with _written_lock:
+        _written["bytes"] += size
+        due = _written["bytes"] >= min(EVICT_BYTES, MAX_BYTES) or random.random() * EVICT_EVERY < 1
+        if due:
+            _written["bytes"] = 0
+    if due:
+        evict()
+    return entry
+
+def evict(max_bytes=None):
+    """Removes least recently used entries until the cache fits in max_bytes. Returns bytes freed."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    try:
+        buckets = list(os.scandir(CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+    for bucket in buckets:
+        if not bucket.is_dir():
+            continue
+        for item in os.scandir(bucket.path):
+            try:
+                st = item.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, item.path))
+            total += st.st_size
+
+    freed = 0
+    if total <= max_bytes:
+        return freed
+    files.sort()
+    for _, size, path in files:
+        if total - freed <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
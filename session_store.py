@@ -0,0 +1,114 @@
+"""
+Ollama context reuse for multi-turn sessions (ag_hybrid_router.py --session ID).
+
+/api/generate returns the token `context` of a finished generation. Passing it back
+with the next prompt continues from there without evaluating the earlier turns again,
+which saves the prefill that dominates CPU latency for long preambles. Each session is
+one JSON file in SESSION_DIR holding the context and the node/model it belongs to.
+The file mtime is the LRU clock: sessions idle for IDLE_SECONDS expire, and the least
+recently used are evicted beyond MAX_SESSIONS or MAX_BYTES.
+"""
+import os
+import json
+import time
+import hashlib
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+SESSION_DIR = os.path.join(GLOBAL_CONFIG_DIR, "sessions")
+
+# Overridable from the "sessions" config section
+IDLE_SECONDS = 3600
+MAX_SESSIONS = 32
+MAX_BYTES = 16 * 1024 * 1024
+MIN_SHARED_CHARS = 64 # Shorter common prefixes are not worth treating as a re-sent preamble
+
+def _path(session_id):
+    return os.path.join(SESSION_DIR, hashlib.sha256(session_id.encode("utf-8")).hexdigest() + ".json")
+
+def load(session_id):
+    """The session dict, or None if it doesn't exist or has been idle too long."""
+    path = _path(session_id)
+    try:
+        if time.time() - os.stat(path).st_mtime > IDLE_SECONDS:
+            os.unlink(path)
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save(session_id, model, node, context, first_prompt=None, previous=None):
+    """
+    Stores the context after a turn. The first turn's prompt is kept as the session
+    preamble, so later turns that send the same leading text again don't evaluate it twice.
+    """
+    previous = previous or {}
+    session = {
+        "model": model,
+        "node": node,
+        "context": context,
+        "turns": previous.get("turns", 0) + 1,
+        "preamble": first_prompt if first_prompt is not None else previous.get("preamble"),
+        "updated": time.time(),
+    }
+    path = _path(session_id)
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(session, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    evict()
+    return session
+
+def new_text(session, prompt):
+    """
+    The part of `prompt` the session's context doesn't hold yet: whole lines it shares
+    with the start of the first turn (a re-sent file or instructions) are dropped.
+    """
+    shared = os.path.commonprefix([session.get("preamble") or "", prompt])
+    cut = shared.rfind("\n") + 1
+    if cut < MIN_SHARED_CHARS or cut >= len(prompt):
+        return prompt
+    return prompt[cut:]
+
+def prefill_saved(reused_tokens, body):
+    """Seconds of prompt evaluation the reused context saved, at this call's prefill rate."""
+    count = body.get("prompt_eval_count")
+    duration = body.get("prompt_eval_duration")
+    if not (reused_tokens and count and duration):
+        return 0
+    return round(reused_tokens * duration / 1e9 / count, 3)
+
+def evict(max_sessions=None, max_bytes=None):
+    """Removes expired sessions, then the least recently used beyond the count and size bounds."""
+    max_sessions = MAX_SESSIONS if max_sessions is None else max_sessions
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    files = []
+    try:
+        items = list(os.scandir(SESSION_DIR))
+    except FileNotFoundError:
+        return 0
+    for item in items:
+        if not item.name.endswith(".json"):
+            continue
+        try:
+            st = item.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, item.path))
+
+    files.sort(reverse=True) # Most recent first
+    kept = removed = total = 0
+    for mtime, size, path in files:
+        if now - mtime <= IDLE_SECONDS and kept < max_sessions and total + size <= max_bytes:
+            kept += 1
+            total += size
+            continue
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
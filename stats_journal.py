@@ -0,0 +1,458 @@
+"""
+Append-only usage journal for the Gemma bridge.
+
+Writers append one JSON record per line to usage_journal.jsonl with a single
+O_APPEND write under a *shared* lock, so concurrent routers never serialize on
+each other. Compaction (run periodically by the watchdog, or inline by a router
+once the journal grows large) takes the exclusive lock, folds the journal into
+the usage_stats.json snapshot and starts a new journal epoch.
+
+Readers get the current view by loading the snapshot and replaying the journal
+records that the snapshot hasn't absorbed yet.
+"""
+import os
+import sys
+import json
+import fcntl
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+STATS_FILE = os.path.join(GLOBAL_CONFIG_DIR, "usage_stats.json")
+JOURNAL_FILE = os.path.join(GLOBAL_CONFIG_DIR, "usage_journal.jsonl")
+
+HISTORY_LIMIT = 100
+EVENTS_LIMIT = 50
+
+# Durability / compaction knobs (overridable from the "stats" config section)
+FSYNC = True
+COMPACT_THRESHOLD_BYTES = 256 * 1024
+METRICS = True # Feed compacted records into the long-term metrics store (metrics_store.py)
+PERF_ALPHA = 0.2 # Weight of the newest local generation in the local_perf EWMAs
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+def default_stats():
+    return {
+        "total_local_tokens": 0,
+        "total_cloud_tokens": 0,
+        "total_cache_tokens": 0,
+        "total_cache_saved_seconds": 0,
+        "history": [],
+        "health": "Healthy",
+        "fail_count": 0,
+        "last_fail_time": 0,
+        "events": []
+    }
+
+def _ewma(old, sample):
+    return sample if old is None else round(old + PERF_ALPHA * (sample - old), 6)
+
+def update_local_perf(stats, entry):
+    """
+    Folds a successful local generation into stats["local_perf"]: EWMAs of seconds per
+    token (model load time excluded, normalized by the host load factor at request
+    time), response length and decode speed, used by host_load.predict().
+    """
+    tokens = entry.get("tokens") or 0
+    latency = (entry.get("latency") or 0) - (entry.get("load_duration") or 0)
+    if latency <= 0 or not tokens or entry.get("session_reused_tokens"):
+        # Session turns skip the prefill of their reused context, which would skew the per-token cost
+        return
+    perf = stats.setdefault("local_perf", {"samples": 0})
+    perf["samples"] += 1
+    perf["seconds_per_token"] = _ewma(perf.get("seconds_per_token"), latency / tokens / entry.get("load_factor", 1))
+    if entry.get("prompt_tokens") is not None:
+        perf["response_tokens"] = _ewma(perf.get("response_tokens"), max(0, tokens - entry["prompt_tokens"]))
+    if entry.get("tps"):
+        perf["tps"] = _ewma(perf.get("tps"), entry["tps"])
+
+def _default_admission():
+    return {"admitted": 0, "wait_seconds": 0, "max_wait": 0, "diverted": 0, "recent": []}
+
+def _circuit(stats, record):
+    """Where a record's circuit-breaker fields live: a pool node's entry, or the stats themselves."""
+    node = record.get("node")
+    if not node:
+        return stats
+    return stats.setdefault("nodes", {}).setdefault(node, {"health": "Healthy", "fail_count": 0, "last_fail_time": 0})
+
+def _pool_health(stats, record):
+    """
+    Aggregate circuit of a backend pool: Healthy while any node is, Degraded only once
+    every node is. Pool members without a state yet (record["pool"]) count as Healthy.
+    """
+    if not record.get("node"):
+        return
+    nodes = stats["nodes"]
+    states = [nodes.get(name, {}).get("health", "Healthy") for name in record.get("pool") or nodes]
+    if "Healthy" in states:
+        stats["health"], stats["fail_count"] = "Healthy", 0
+    elif "Retrying" in states:
+        stats["health"] = "Retrying"
+    else:
+        stats["health"] = "Degraded"
+        stats["fail_count"] = min(n.get("fail_count", 0) for n in nodes.values())
+        stats["last_fail_time"] = max(n.get("last_fail_time", 0) for n in nodes.values())
+
+def apply_record(stats, record):
+    """Folds a single journal record into a stats dict (in-place). Must stay deterministic."""
+    kind = record.get("type")
+
+    if kind == "usage":
+        entry = record["entry"]
+        route = entry.get("route")
+        if route == "local" and record.get("ok", True):
+            stats["total_local_tokens"] = stats.get("total_local_tokens", 0) + entry.get("tokens", 0)
+            update_local_perf(stats, entry)
+            if entry.get("queue_wait") is not None:
+                queue = stats.setdefault("admission", _default_admission())
+                queue["admitted"] += 1
+                queue["wait_seconds"] = round(queue["wait_seconds"] + entry["queue_wait"], 3)
+                queue["max_wait"] = max(queue["max_wait"], entry["queue_wait"])
+            if entry.get("session_turn") is not None:
+                sessions = stats.setdefault("sessions", {"turns": 0, "reused_tokens": 0, "prefill_saved_seconds": 0})
+                sessions["turns"] += 1
+                sessions["reused_tokens"] += entry.get("session_reused_tokens", 0)
+                sessions["prefill_saved_seconds"] = round(sessions["prefill_saved_seconds"] + entry.get("prefill_saved", 0), 3)
+            if record.get("node") and entry.get("latency") is not None:
+                target = _circuit(stats, record)
+                target["latency_ewma"] = _ewma(target.get("latency_ewma"), entry["latency"])
+            if record.get("resets_circuit"):
+                target = _circuit(stats, record)
+                target["health"] = "Healthy"
+                target["fail_count"] = 0
+                _pool_health(stats, record)
+        elif route == "cloud":
+            stats["total_cloud_tokens"] = stats.get("total_cloud_tokens", 0) + entry.get("tokens", 0)
+        elif route == "cache":
+            stats["total_cache_tokens"] = stats.get("total_cache_tokens", 0) + entry.get("tokens", 0)
+            stats["total_cache_saved_seconds"] = round(
+                stats.get("total_cache_saved_seconds", 0) + entry.get("saved_latency", 0), 2)
+
+        history = stats.setdefault("history", [])
+        history.append(entry)
+        if len(history) > 1 and history[-2].get("timestamp", "") > entry.get("timestamp", ""):
+            # Back-dated entries (e.g. imported legacy logs) keep the history in time order
+            history.sort(key=lambda x: x.get("timestamp", ""))
+        stats["history"] = history[-HISTORY_LIMIT:]
+
+    elif kind == "admission":
+        # A local request diverted to the cloud because the local queue was too long
+        queue = stats.setdefault("admission", _default_admission())
+        queue["diverted"] += 1
+        queue["recent"] = (queue["recent"] + [record["entry"]])[-EVENTS_LIMIT:]
+
+    elif kind == "hedge":
+        # Both legs of a hedged request, kept to tune hedging.percentile
+        entry = record["entry"]
+        hedging = stats.setdefault("hedging", {"requests": 0, "hedged": 0, "wins": {}, "recent": []})
+        hedging["requests"] += 1
+        hedging["hedged"] += 1 if entry.get("hedged") else 0
+        winner = entry.get("winner") or "none"
+        hedging["wins"][winner] = hedging["wins"].get(winner, 0) + 1
+        hedging["recent"] = (hedging["recent"] + [entry])[-EVENTS_LIMIT:]
+
+    elif kind == "event":
+        events = stats.setdefault("events", [])
+        events.append(record["event"])
+        stats["events"] = events[-EVENTS_LIMIT:]
+
+    elif kind == "failure":
+        target = _circuit(stats, record)
+        target["fail_count"] = target.get("fail_count", 0) + 1
+        target["last_fail_time"] = record.get("time", 0)
+        if record.get("hard_crash") or target["fail_count"] >= record.get("threshold", 2):
+            target["health"] = "Degraded"
+        else:
+            target["health"] = "Retrying"
+        _pool_health(stats, record)
+
+    elif kind == "health":
+        # Compare-and-set: only applies if the state is still what the writer observed
+        target = _circuit(stats, record)
+        expect = record.get("expect")
+        if expect is None or target.get("health", "Healthy") in expect:
+            target.update(record.get("set", {}))
+            _pool_health(stats, record)
+
+    return stats
+
+def _parse_records(data):
+    """Parses complete JSONL lines. Torn or corrupt lines (crash mid-write) are skipped."""
+    records = []
+    for line in data.split(b"\n")[:-1]:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get("type") != "epoch":
+            records.append(record)
+    return records
+
+def _read_header(f):
+    """Returns (epoch, header_length) of an open journal. Journals without a header have epoch None."""
+    f.seek(0)
+    first = f.readline()
+    if first.endswith(b"\n"):
+        try:
+            header = json.loads(first)
+            if isinstance(header, dict) and header.get("type") == "epoch":
+                return header.get("epoch"), len(first)
+        except ValueError:
+            pass
+    return None, 0
+
+def _replay_offset(stats, epoch, header_len):
+    """Where replay should start: past what the snapshot already absorbed from this epoch."""
+    meta = stats.get("journal") or {}
+    if "epoch" in meta and meta["epoch"] == epoch:
+        return max(meta.get("offset", header_len), header_len)
+    return header_len
+
+def load_snapshot():
+    """Loads the compacted snapshot (atomically replaced, so no lock is needed)."""
+    stats = default_stats()
+    try:
+        with open(STATS_FILE, "r") as f:
+            content = f.read()
+        if content.strip():
+            file_stats = json.loads(content)
+            if isinstance(file_stats, dict):
+                for k, v in stats.items():
+                    file_stats.setdefault(k, v)
+                stats = file_stats
+    except (OSError, ValueError):
+        # Missing or corrupt snapshot: start from defaults
+        pass
+    return stats
+
+def _write_snapshot(stats):
+    tmp = f"{STATS_FILE}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(stats, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATS_FILE)
+
+def _open_journal_for_append():
+    """Opens the live journal with a shared lock held, re-opening if compaction swapped it out."""
+    while True:
+        try:
+            fd = os.open(JOURNAL_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            os.makedirs(GLOBAL_CONFIG_DIR, exist_ok=True)
+            continue
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            if os.fstat(fd).st_ino == os.stat(JOURNAL_FILE).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def append_records(records):
+    """Appends records to the journal in one write. O(1) regardless of journal size."""
+    if not records:
+        return
+    data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+
+    fd = _open_journal_for_append()
+    try:
+        try:
+            os.write(fd, data)
+            if FSYNC:
+                _fdatasync(fd)
+            size = os.fstat(fd).st_size
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+    if COMPACT_THRESHOLD_BYTES and size > COMPACT_THRESHOLD_BYTES:
+        # Never wait on another compactor from the hot path
+        compact(blocking=False)
+
+def append_record(record):
+    append_records([record])
+
+def read_stats():
+    """Current stats view: snapshot plus any journal records not yet compacted."""
+    # Open the journal before loading the snapshot: if a compaction swaps both in
+    # between, we replay the old journal against the new snapshot, which is still exact.
+    try:
+        f = open(JOURNAL_FILE, "rb")
+    except FileNotFoundError:
+        return load_snapshot()
+    with f:
+        stats = load_snapshot()
+        epoch, header_len = _read_header(f)
+        f.seek(_replay_offset(stats, epoch, header_len))
+        data = f.read()
+
+    for record in _parse_records(data):
+        apply_record(stats, record)
+    return stats
+
+def change_token():
+    """Cheap fingerprint of the snapshot and journal files; it changes whenever either is written."""
+    token = []
+    for path in (STATS_FILE, JOURNAL_FILE):
+        try:
+            st = os.stat(path)
+            token.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            token.append(None)
+    return tuple(token)
+
+def _record_metrics(epoch, data, header_len):
+    """The store tracks its own position in each epoch, so retried compactions don't double count."""
+    try:
+        import metrics_store
+        metrics_store.ingest_journal(epoch, len(data), lambda offset: _parse_records(data[max(offset, header_len):]))
+    except Exception as e:
+        # Long-term metrics must never block compaction
+        print(f"[!] Metrics store error: {e}", file=sys.stderr)
+
+def has_pending():
+    """Lock-free check for records past the journal header, i.e. whether compaction has anything to do."""
+    try:
+        with open(JOURNAL_FILE, "rb") as f:
+            return os.fstat(f.fileno()).st_size > _read_header(f)[1]
+    except FileNotFoundError:
+        return False
+
+def compact(blocking=True, modifier=None):
+    """
+    Folds the journal into the snapshot and starts a new journal epoch.
+    modifier: optional function applied to the folded stats before they are written.
+    Returns the number of records folded, or None if blocking=False and another compaction is running.
+    """
+    os.makedirs(GLOBAL_CONFIG_DIR, exist_ok=True)
+    fd = os.open(JOURNAL_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return None
+        try:
+            if os.fstat(fd).st_ino != os.stat(JOURNAL_FILE).st_ino:
+                # Someone else compacted while we waited for the lock
+                return compact(blocking, modifier) if blocking else None
+
+            with os.fdopen(os.dup(fd), "rb") as f:
+                epoch, header_len = _read_header(f)
+                f.seek(0)
+                data = f.read()
+
+            stats = load_snapshot()
+            records = _parse_records(data[_replay_offset(stats, epoch, header_len):])
+            if not records and modifier is None:
+                return 0
+
+            if records and METRICS:
+                _record_metrics(epoch, data, header_len)
+
+            for record in records:
+                apply_record(stats, record)
+            if modifier:
+                modifier(stats)
+
+            # 1. Snapshot first: a crash after this point is safe because the
+            #    snapshot remembers how much of this epoch it already contains.
+            stats["journal"] = {"epoch": epoch, "offset": len(data)}
+            _write_snapshot(stats)
+
+            # 2. Swap in a fresh journal. Blocked writers notice the inode change and re-open.
+            new_epoch = os.urandom(8).hex()
+            tmp = f"{JOURNAL_FILE}.tmp.{os.getpid()}"
+            with open(tmp, "wb") as f:
+                f.write((json.dumps({"type": "epoch", "epoch": new_epoch}) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, JOURNAL_FILE)
+            return len(records)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+class JournalTail:
+    """
+    Follows the journal across compactions and returns each record exactly once.
+    Once compaction has swapped a journal out, no writer can reach it any more, so
+    the old file is drained to its end before the tail moves on to the new one.
+    """
+    def __init__(self):
+        self.f = None
+        self.epoch = None
+        self.offset = 0
+        self.missing_since = None # Snapshot journal metadata seen when start() found no journal
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def _open(self):
+        self.f = open(JOURNAL_FILE, "rb")
+        self.epoch, header_len = _read_header(self.f)
+        return header_len
+
+    def _read(self):
+        self.f.seek(self.offset)
+        data = self.f.read()
+        end = data.rfind(b"\n") + 1 # A line still being written is picked up next time
+        self.offset += end
+        return _parse_records(data[:end])
+
+    def start(self):
+        """Returns the current stats view (same as read_stats) and positions the tail right after it."""
+        self.close()
+        try:
+            header_len = self._open()
+        except FileNotFoundError:
+            stats = load_snapshot()
+            self.missing_since = stats.get("journal")
+            return stats
+        stats = load_snapshot()
+        self.offset = _replay_offset(stats, self.epoch, header_len)
+        for record in self._read():
+            apply_record(stats, record)
+        return stats
+
+    def poll(self):
+        """Records appended since the last call, or None if the tail lost track and start() is needed."""
+        if self.f is None:
+            try:
+                header_len = self._open()
+            except FileNotFoundError:
+                return []
+            # Nothing can have been compacted since start() if the snapshot is unchanged
+            if load_snapshot().get("journal") != self.missing_since:
+                return None
+            self.offset = header_len
+        records = []
+        while True:
+            records.extend(self._read())
+            try:
+                swapped = os.stat(JOURNAL_FILE).st_ino != os.fstat(self.f.fileno()).st_ino
+            except FileNotFoundError:
+                swapped = True
+            if not swapped:
+                return records
+
+            records.extend(self._read())
+            old_epoch = self.epoch
+            self.close()
+            try:
+                header_len = self._open()
+            except FileNotFoundError:
+                return None
+            # The new journal only continues where we stopped if the latest snapshot
+            # is the one that folded the journal we just drained
+            if (load_snapshot().get("journal") or {}).get("epoch") != old_epoch:
+                return None
+            self.offset = header_len
@@ -0,0 +1,224 @@
+"""
+Task classification strategies for the hybrid router.
+
+Every strategy exposes classify(prompt) -> (route, reason), where route is "local" or
+"cloud" (or None when a strategy abstains). The router picks one via
+routing_rules.classifier; benchmark() runs several side by side on the same prompts.
+"""
+import re
+import sys
+import abc
+import math
+import time
+
+DEFAULT_LOCAL_KEYWORDS = ["summariz", "format", "check", "lint"]
+DEFAULT_CLOUD_KEYWORDS = ["reason", "plan", "design"]
+
+# Long prompts (whole log files) are only scanned at the head and tail
+SCAN_HEAD_CHARS = 8192
+SCAN_TAIL_CHARS = 2048
+
+class Classifier(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def classify(self, prompt):
+        """(route, reason); route is "local", "cloud" or None (abstain)."""
+
+class KeywordClassifier(Classifier):
+    """
+    The routing_rules keyword lists compiled once into combined matchers.
+    Cloud keywords win over local ones anywhere in the scanned text, and prompts
+    with no match default to local, same as the original per-keyword loop.
+    """
+    name = "keyword"
+
+    def __init__(self, local_keywords=None, cloud_keywords=None, head_chars=SCAN_HEAD_CHARS, tail_chars=SCAN_TAIL_CHARS):
+        local_keywords = DEFAULT_LOCAL_KEYWORDS if local_keywords is None else local_keywords
+        cloud_keywords = DEFAULT_CLOUD_KEYWORDS if cloud_keywords is None else cloud_keywords
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.cloud_keywords = list(cloud_keywords)
+        self.local_keywords = list(local_keywords)
+
+        # One alternation per route, compiled once. Matching runs on the lowercased
+        # window (much cheaper than re.IGNORECASE), like the original prompt.lower().
+        self.cloud_re = self._compile(cloud_keywords)
+        self.local_re = self._compile(local_keywords)
+
+    @staticmethod
+    def _compile(keywords):
+        if not keywords:
+            return None
+        return re.compile("|".join(f"(?:{kw})" for kw in keywords))
+
+    def scan_window(self, prompt):
+        if len(prompt) <= self.head_chars + self.tail_chars:
+            return prompt
+        return prompt[:self.head_chars] + "\n" + prompt[-self.tail_chars:]
+
+    def classify(self, prompt):
+        text = self.scan_window(prompt).lower()
+        match = self.cloud_re.search(text) if self.cloud_re else None
+        if match:
+            return "cloud", f"keyword:{match.group(0)}"
+        match = self.local_re.search(text) if self.local_re else None
+        if match:
+            return "local", f"keyword:{match.group(0)}"
+        return "local", "default"
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9_]+")
+
+def _features(text):
+    return set(_TOKEN_RE.findall(text[:SCAN_HEAD_CHARS].lower()))
+
+class NaiveBayesClassifier(Classifier):
+    """
+    Lightweight learned scorer trained from stats history (prompt_preview plus the
+    metadata source/task_type). Abstains (returns None) below min_confidence.
+
+    Limitation: the labels are the routes history recorded, and most of those were
+    picked by the keyword rules themselves (from 50-character previews, at most
+    HISTORY_LIMIT entries). The scorer mostly learns to agree with the rules; only
+    routes forced with --route or logged with --log-only teach it anything new.
+    """
+    name = "learned"
+
+    def __init__(self, min_confidence=0.8, min_samples=20):
+        self.min_confidence = min_confidence
+        self.min_samples = min_samples
+        self.class_counts = {"local": 0, "cloud": 0}
+        self.feature_counts = {"local": {}, "cloud": {}}
+        self.vocabulary = set()
+
+    @staticmethod
+    def sample_text(entry):
+        meta = entry.get("metadata") or {}
+        extra = " ".join(str(meta.get(k, "")) for k in ("source", "task_type"))
+        return f"{entry.get('prompt_preview', '')} {extra}"
+
+    def train(self, history):
+        """history: stats["history"] entries. Cache hits and unknown routes are ignored."""
+        for entry in history:
+            route = entry.get("route")
+            if route not in self.class_counts:
+                continue
+            self.class_counts[route] += 1
+            counts = self.feature_counts[route]
+            for token in _features(self.sample_text(entry)):
+                counts[token] = counts.get(token, 0) + 1
+                self.vocabulary.add(token)
+        return self
+
+    def scores(self, prompt):
+        """Log-probabilities per route (Bernoulli-style, Laplace smoothed, present features only)."""
+        total = sum(self.class_counts.values())
+        features = _features(prompt) & self.vocabulary
+        result = {}
+        for route, n in self.class_counts.items():
+            score = math.log((n + 1) / (total + 2))
+            counts = self.feature_counts[route]
+            for token in features:
+                score += math.log((counts.get(token, 0) + 1) / (n + 2))
+            result[route] = score
+        return result
+
+    def classify(self, prompt):
+        if sum(self.class_counts.values()) < self.min_samples:
+            return None, "untrained"
+        scores = self.scores(prompt)
+        best = max(scores, key=scores.get)
+        # Softmax over the two log scores
+        top = scores[best]
+        confidence = 1 / sum(math.exp(s - top) for s in scores.values())
+        if confidence < self.min_confidence:
+            return None, f"low-confidence:{confidence:.2f}"
+        return best, f"learned:{confidence:.2f}"
+
+class HybridClassifier(Classifier):
+    """Learned scorer when it is confident, keyword rules otherwise."""
+    name = "hybrid"
+
+    def __init__(self, learned, keyword):
+        self.learned = learned
+        self.keyword = keyword
+
+    def classify(self, prompt):
+        route, reason = self.learned.classify(prompt)
+        if route is not None:
+            return route, reason
+        return self.keyword.classify(prompt)
+
+# Strategies selectable as routing_rules.classifier. The bare learned scorer abstains,
+# so it is only used behind the hybrid fallback (or on its own in benchmark()).
+STRATEGIES = ("keyword", "hybrid")
+
+def build_classifier(rules, history=None):
+    """Builds the strategy named by rules["classifier"] (default "keyword") from routing_rules."""
+    keyword = KeywordClassifier(
+        rules.get("local_keywords", DEFAULT_LOCAL_KEYWORDS),
+        rules.get("cloud_keywords", DEFAULT_CLOUD_KEYWORDS),
+        head_chars=rules.get("scan_head_chars", SCAN_HEAD_CHARS),
+        tail_chars=rules.get("scan_tail_chars", SCAN_TAIL_CHARS),
+    )
+    strategy = rules.get("classifier", "keyword")
+    if strategy == "keyword":
+        return keyword
+    if strategy == "hybrid":
+        learned = NaiveBayesClassifier(min_confidence=rules.get("learned_min_confidence", 0.8)).train(history or [])
+        return HybridClassifier(learned, keyword)
+    # A typo in the config must not break routing
+    print(f"[!] Unknown routing_rules.classifier {strategy!r} (expected one of {', '.join(STRATEGIES)}); "
+          "using the keyword rules.", file=sys.stderr)
+    return keyword
+
+def benchmark(classifiers, prompts, labels=None, repeat=1):
+    """
+    Runs each classifier over the same prompts. Returns per-strategy timing and
+    agreement with `labels` (or with the first classifier when no labels are given).
+    """
+    results = {}
+    baseline = labels
+    for clf in classifiers:
+        routes = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            routes = [clf.classify(p)[0] for p in prompts]
+        elapsed = time.perf_counter() - start
+        if baseline is None:
+            baseline = routes
+        agree = sum(1 for a, b in zip(routes, baseline) if a == b)
+        results[clf.name] = {
+            "prompts": len(prompts),
+            "us_per_prompt": round(elapsed / max(1, len(prompts) * repeat) * 1e6, 2),
+            "agreement": round(agree / max(1, len(prompts)), 4),
+            "abstained": sum(1 for r in routes if r is None),
+        }
+    return results
+
+def main():
+    """Benchmarks the strategies on the recorded history, labelled with the routes actually taken."""
+    import json
+    import os
+    import stats_journal
+
+    config_file = os.path.join(stats_journal.GLOBAL_CONFIG_DIR, "antigravity_config.json")
+    try:
+        with open(config_file, "r") as f:
+            rules = json.load(f).get("routing_rules", {})
+    except (OSError, ValueError):
+        rules = {}
+
+    history = [h for h in stats_journal.read_stats().get("history", []) if h.get("route") in ("local", "cloud")]
+    prompts = [h.get("prompt_preview", "") for h in history]
+    labels = [h["route"] for h in history]
+    keyword = build_classifier(dict(rules, classifier="keyword"))
+    hybrid = build_classifier(dict(rules, classifier="hybrid"), history)
+    report = benchmark([keyword, hybrid.learned, hybrid], prompts, labels, repeat=10)
+
+    long_prompt = ("INFO worker heartbeat ok\n" * 4096) + "please summarize"
+    report["keyword_100kb"] = benchmark([keyword], [long_prompt], repeat=20)["keyword"]
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import time
+import signal
+import threading
+import multiprocessing
+
+import admission
+
+
+def _hold_slot(admission_dir, ready):
+    admission.ADMISSION_DIR = admission_dir
+    admission.MAX_CONCURRENCY = 1
+    slot, _, _ = admission.acquire()
+    ready.set()
+    time.sleep(60)
+
+
+def test_priority_order_and_deadlines(state_dir, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_CONCURRENCY", 1)
+    held, _, _ = admission.acquire()
+    assert held.waited == 0
+
+    # Nothing frees up within the deadline, or the estimate alone rules it out
+    slot, waited, reason = admission.acquire(max_wait=0.2)
+    assert slot is None and waited >= 0.2 and "waited" in reason
+    slot, waited, reason = admission.acquire(max_wait=5, service_time=10)
+    assert slot is None and waited == 0 and "expected" in reason
+
+    # A batch request queued first is still served after a later interactive one
+    order = []
+    def wait_for_slot(priority):
+        slot, _, _ = admission.acquire(priority, max_wait=10)
+        order.append(priority)
+        time.sleep(0.1)
+        slot.release()
+    batch = threading.Thread(target=wait_for_slot, args=("batch",))
+    batch.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=wait_for_slot, args=("interactive",))
+    interactive.start()
+    time.sleep(0.1)
+    status = admission.snapshot()
+    assert status["busy"] == 1 and status["waiting"] == {"interactive": 1, "batch": 1}
+    held.release()
+    batch.join()
+    interactive.join()
+    assert order == ["interactive", "batch"]
+    assert admission.snapshot()["busy"] == 0
+
+
+def test_slots_are_shared_across_processes_and_freed_on_crash(state_dir, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_CONCURRENCY", 1)
+    os.makedirs(admission.ADMISSION_DIR, exist_ok=True)
+    ready = multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold_slot, args=(admission.ADMISSION_DIR, ready))
+    holder.start()
+    try:
+        assert ready.wait(10)
+        assert admission.acquire(max_wait=0.2)[0] is None
+        assert admission.snapshot()["busy"] == 1
+    finally:
+        os.kill(holder.pid, signal.SIGKILL)
+        holder.join()
+    slot, _, _ = admission.acquire(max_wait=2)
+    assert slot is not None
+    slot.release()
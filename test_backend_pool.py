@@ -0,0 +1,81 @@
+import pytest
+
+import stats_journal
+import backend_pool
+import mock_ollama
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def pool(state_dir, monkeypatch):
+    monkeypatch.setattr(router, "LOAD_ROUTING", False)
+    healed = []
+    monkeypatch.setattr(router, "attempt_self_healing", lambda: healed.append(True))
+    mocks = {name: mock_ollama.MockOllama(tps=0, response_tokens=2) for name in ("broken", "small", "big")}
+    mocks["broken"].mode = "fail"
+    url = lambda name: mocks[name].start() + "/api/generate"
+    monkeypatch.setattr(router, "POOL", backend_pool.load_pool({"pool": [
+        # Listed first, so it wins the tie with "small" until its breaker opens
+        {"name": "broken", "endpoint": url("broken"), "model": "gemma3:1b", "max_prompt_tokens": 50},
+        {"name": "small", "endpoint": url("small"), "model": "gemma3:1b", "max_prompt_tokens": 50},
+        {"name": "big", "endpoint": url("big"), "model": "gemma3:4b", "capacity": 2},
+    ]}, router.LOCAL_API_URL, router.LOCAL_MODEL))
+    router.invalidate_circuit_state()
+    yield healed, mocks
+    for mock in mocks.values():
+        mock.stop()
+    router.invalidate_circuit_state()
+
+
+def test_failing_node_trips_only_its_own_breaker(pool):
+    assert router.call_local_ollama("fix indent", use_cache=False) is None
+    assert router.call_local_ollama("fix indent", use_cache=False) is None
+    stats = stats_journal.read_stats()
+    assert stats["nodes"]["broken"]["health"] == "Degraded"
+    healed, mocks = pool
+    assert stats["health"] == "Healthy" and not healed # the pool still serves, nothing restarted
+
+    assert router.call_local_ollama("fix indent", use_cache=False) == "t0 t1"
+    assert mocks["small"].received[-1]["model"] == "gemma3:1b"
+    stats = stats_journal.read_stats()
+    assert stats["history"][-1]["node"] == "small"
+    assert stats["nodes"]["small"]["latency_ewma"] is not None
+
+
+def test_long_prompts_go_to_the_bigger_model(pool):
+    _, mocks = pool
+    assert router.call_local_ollama("x" * 400, use_cache=False) == "t0 t1"
+    assert mocks["big"].received[-1]["model"] == "gemma3:4b"
+    assert stats_journal.read_stats()["history"][-1]["node"] == "big"
+
+
+def test_select_balances_by_outstanding_requests_per_slot():
+    nodes = [backend_pool.Node("a", "http://a", "m"), backend_pool.Node("b", "http://b", "m", capacity=4),
+             backend_pool.Node("tiny", "http://t", "m", max_prompt_tokens=10)]
+    busy = {"a": 1, "b": 2, "tiny": 0}
+    ranked = backend_pool.select(nodes, 100, {}, lambda n: busy[n.name], cooldown=300)
+    assert [n.name for n in ranked] == ["b", "a"] # "tiny" can't take 100 tokens
+
+    stats = {"nodes": {"b": {"health": "Degraded", "last_fail_time": 1000}}}
+    assert [n.name for n in backend_pool.select(nodes, 100, stats, lambda n: busy[n.name], 300, now=1100)] == ["a"]
+    assert [n.name for n in backend_pool.select(nodes, 100, stats, lambda n: busy[n.name], 300, now=1400)] == ["b", "a"]
+
+
+def test_saturated_small_tier_yields_to_an_idle_bigger_node():
+    nodes = [backend_pool.Node("small", "http://s", "1b", max_prompt_tokens=50), backend_pool.Node("big", "http://b", "4b", capacity=2)]
+    rank = lambda busy: [n.name for n in backend_pool.select(nodes, 10, {}, lambda n: busy[n.name], 300)]
+    assert rank({"small": 0, "big": 0}) == ["small", "big"]
+    assert rank({"small": 1, "big": 1}) == ["big", "small"] # small has no free slot, big has one
+    assert rank({"small": 1, "big": 4}) == ["small", "big"] # both saturated: the shorter queue per slot
+
+
+def test_pool_is_degraded_only_when_every_node_is():
+    stats = stats_journal.default_stats()
+    fail = lambda node: {"type": "failure", "time": 1, "hard_crash": True, "node": node, "pool": ["a", "b"]}
+    stats_journal.apply_record(stats, fail("a"))
+    assert stats["health"] == "Healthy"
+    stats_journal.apply_record(stats, fail("b"))
+    assert stats["health"] == "Degraded"
+    stats_journal.apply_record(stats, {"type": "usage", "resets_circuit": True, "node": "a", "pool": ["a", "b"],
+                                       "entry": {"route": "local", "tokens": 5, "latency": 1.0}})
+    assert stats["health"] == "Healthy" and stats["nodes"]["a"]["health"] == "Healthy"
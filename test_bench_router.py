@@ -0,0 +1,62 @@
+import json
+import urllib.request
+import urllib.error
+
+import pytest
+
+import mock_ollama
+import bench_router
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def mock():
+    server = mock_ollama.MockOllama(latency=0, tps=0, response_tokens=3, seed=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def _generate(url, stream):
+    req = urllib.request.Request(url + "/api/generate", json.dumps({"model": "m", "prompt": "hi", "stream": stream}).encode())
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return [json.loads(line) for line in resp.read().splitlines() if line]
+
+
+def test_mock_streams_tokens_and_injects_failures(mock):
+    chunks = _generate(mock.url, stream=True)
+    assert [c["response"] for c in chunks] == ["t0 ", "t1 ", "t2 ", ""]
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] == 3
+    assert _generate(mock.url, stream=False)[0]["response"] == "t0 t1 t2"
+
+    mock.mode = "fail"
+    with pytest.raises(urllib.error.HTTPError):
+        _generate(mock.url, stream=False)
+
+
+def test_breaker_benchmark_trips_and_recovers(state_dir, monkeypatch, mock):
+    monkeypatch.setattr(router, "LOCAL_API_URL", mock.url + "/api/generate")
+    monkeypatch.setattr(router, "check_ollama_alive", lambda: True)
+    monkeypatch.setattr(router, "attempt_self_healing", lambda: None)
+    monkeypatch.setattr(router, "LOAD_ROUTING", False)
+    monkeypatch.setattr(router, "CIRCUIT_BREAKER_COOLDOWN", 0.2)
+    router.invalidate_circuit_state()
+
+    results = bench_router.bench_breaker(router, mock)
+    for mode in ("fail", "hang"):
+        assert results[mode]["trip_ms"] > 0
+        assert results[mode]["recovery_ms"] >= 200 # the cooldown is part of recovery
+    assert results["hang"]["trip_ms"] >= 2 * 250 # two timed-out requests
+    assert router.get_circuit_state()["health"] == "Healthy"
+
+
+def test_dashboard_benchmark_reports_latency_and_flags_stalls(state_dir):
+    import stats_journal
+    import bridge_monitor
+    results = bench_router.bench_dashboard(bridge_monitor, stats_journal, 0.3, 2)
+    assert "stalled" not in results
+    for path in bench_router.DASHBOARD_ENDPOINTS:
+        assert results[path]["requests"] > 0 and results[path]["errors"] == 0
+        assert results[path]["p50_ms"] <= results[path]["p95_ms"]
+    assert bench_router.delayed_ack_stall({"p50_ms": 40.8, "p95_ms": 42.1})
+    assert not bench_router.delayed_ack_stall({"p50_ms": 40.8, "p95_ms": 160.0}) # slow for real, not a fixed stall
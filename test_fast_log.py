@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+import json
+import subprocess
+
+import stats_journal
+import fast_log
+
+
+def test_single_log_matches_the_router_record(state_dir):
+    assert fast_log.main(["Summarize logs", "--log-only", "--route", "local", "--metadata", '{"task_type": "local_inference"}']) == 0
+    entry = stats_journal.read_stats()["history"][-1]
+    assert entry["route"] == "local" and entry["metadata"] == {"task_type": "local_inference"}
+    assert entry["tokens"] == len("Summarize logs[External Process]") // 4
+
+    assert fast_log.main(["x", "--log-only", "--metadata", "[1, 2]"]) == 2
+    assert fast_log.main(["x", "--log-only", "--stream"]) is None # left to the full CLI
+    assert len(stats_journal.read_stats()["history"]) == 1
+
+
+def test_bulk_records_are_committed_in_one_write(state_dir, monkeypatch):
+    writes = []
+    append = stats_journal.append_records
+    monkeypatch.setattr(stats_journal, "append_records", lambda records: writes.append(len(records)) or append(records))
+    lines = io.StringIO('"plain prompt"\n\n{"prompt": "typed", "route": "local", "tokens": 9, "metadata": {"a": 1}}\n'
+                        '{"prompt": "bad", "tokens": -1}\nnot json\n')
+    assert fast_log.log("", "auto", None, bulk="-", stdin=lines) == 1 # some lines were invalid
+    assert writes == [2]
+    history = stats_journal.read_stats()["history"]
+    assert [(h["route"], h["metadata"]) for h in history] == [("cloud", {"source": "antigravity"}), ("local", {"a": 1})]
+    assert history[1]["tokens"] == 9
+
+
+def test_script_fast_path_skips_the_router_imports(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ag_hybrid_router.py")
+    result = subprocess.run([sys.executable, "-X", "importtime", script, "--log-only", "done", "--route", "local"],
+                            capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    assert "stats_journal" in imported
+    assert not imported & {"requests", "task_classifier", "argparse", "socket"}
+    with open(tmp_path / ".config" / "gemma-bridge" / "usage_journal.jsonl") as f:
+        assert json.loads(f.readline())["entry"]["route"] == "local"
@@ -0,0 +1,75 @@
+import io
+import json
+import time
+
+import stats_journal
+import health_state
+import ag_hybrid_router as router
+
+
+def test_published_probe_is_trusted_only_while_fresh(state_dir, monkeypatch):
+    assert health_state.cached_alive() is None
+    health_state.write_probe(True, "watchdog", resident=True)
+    assert health_state.cached_alive() is True
+    assert health_state.cached_probe()["resident"] is True
+
+    now = time.time()
+    monkeypatch.setattr(health_state.time, "time", lambda: now + health_state.MAX_AGE_SECONDS + 1)
+    assert health_state.cached_alive() is None
+    assert health_state.cached_alive(max_age=health_state.MAX_AGE_SECONDS + 5) is True
+
+
+def test_request_results_update_the_published_state(state_dir, monkeypatch):
+    health_state.write_probe(True, "watchdog", pressure={"load_factor": 1.5})
+    checked_at = health_state.read_probe()["checked_at"]
+    health_state.note_result(True, "router") # same state and still fresh: no rewrite
+    assert health_state.read_probe()["checked_at"] == checked_at
+
+    health_state.note_result(False, "router")
+    probe = health_state.read_probe()
+    assert probe["alive"] is False and probe["source"] == "router"
+    assert probe["pressure"] == {"load_factor": 1.5} # the watchdog's pressure sample is kept
+
+
+def test_router_probes_only_when_the_cache_is_stale(ollama, monkeypatch):
+    health_state.write_probe(False, "watchdog")
+    assert router.check_ollama_alive() is False # the cached verdict, no request made
+    assert ollama.requests == 0
+
+    monkeypatch.setattr(health_state, "MAX_AGE_SECONDS", -1)
+    assert router.check_ollama_alive() is True
+    monkeypatch.setattr(router, "HEALTH_API_URL", ollama.url + "/api/missing")
+    assert router.check_ollama_alive() is False # a 404 is not a live service
+    assert health_state.read_probe()["source"] == "router"
+
+
+def test_circuit_state_is_read_once_then_followed(state_dir, monkeypatch):
+    router.invalidate_circuit_state()
+    stats_journal.append_record({"type": "event", "event": {"level": "INFO", "message": "start"}})
+    loads = []
+    load_snapshot = stats_journal.load_snapshot
+    monkeypatch.setattr(stats_journal, "load_snapshot", lambda: loads.append(True) or load_snapshot())
+    assert router.get_circuit_state()["health"] == "Healthy"
+    assert router.get_circuit_state()["health"] == "Healthy"
+    assert len(loads) == 1
+
+    # Another router's failures reach this one without a reload
+    stats_journal.append_records([{"type": "failure", "time": 1, "threshold": 2}] * 2)
+    assert router.get_circuit_state()["health"] == "Degraded"
+    assert len(loads) == 1
+    router.invalidate_circuit_state()
+
+
+def test_successes_inside_a_batch_reset_the_breaker(ollama, monkeypatch, capsys):
+    healed = []
+    monkeypatch.setattr(router, "attempt_self_healing", lambda: healed.append(True))
+    ollama.fail_requests = {1, 7} # fail, ok x5, fail, ok x5
+    lines = "".join(f'{{"prompt": "summarize log {i}", "route": "local"}}\n' for i in range(12))
+    assert router.run_cli(["--batch", "-", "--no-cache", "--local-concurrency", "1"], stdin=io.StringIO(lines)) == 0
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [r["route"] for r in results].count("cloud") == 2
+    # Each failure follows a success that cleared the count: the breaker never trips
+    assert not healed
+    stats = stats_journal.read_stats()
+    assert stats["health"] == "Healthy" and stats["fail_count"] == 0
+    assert stats["total_local_tokens"] > 0 # the buffered usage was still committed
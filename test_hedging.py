@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import stats_journal
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def backends(ollama, monkeypatch):
+    ollama.tps = 20 # two tokens in 0.1 s once the first one is out
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY", 0.3)
+    # Stand-in cloud backend that answers in 0.2 s
+    monkeypatch.setattr(router, "cloud_generate", lambda prompt: time.sleep(0.2) or "cloud answer")
+    return ollama
+
+
+def test_cloud_wins_when_local_first_token_is_late(backends):
+    backends.latency = 5
+    start = time.time()
+    assert router.call_hedged("summarize this", use_cache=False) == "cloud answer"
+    assert time.time() - start < 2
+    assert backends.aborted.wait(5) # the losing local generation is torn down
+
+    stats = stats_journal.read_stats()
+    hedge = stats["hedging"]["recent"][-1]
+    assert hedge["hedged"] and hedge["winner"] == "cloud" and hedge["delay"] == 0.3
+    assert hedge["legs"]["cloud"]["state"] == "answered"
+    assert hedge["legs"]["local"]["state"] == "cancelled"
+    assert stats["history"][-1]["route"] == "cloud" and stats["history"][-1]["metadata"] == {"hedged": True}
+    assert stats["fail_count"] == 0 # a cancelled local leg is not a failure
+
+
+def test_fast_local_answer_is_not_hedged(backends):
+    assert router.call_hedged("summarize this", use_cache=False) == "t0 t1 "
+    stats = stats_journal.read_stats()
+    assert stats["hedging"] == {"requests": 1, "hedged": 0, "wins": {"local": 1}, "recent": stats["hedging"]["recent"]}
+    assert stats["history"][-1]["route"] == "local" and stats["history"][-1]["tps"] == 20.0
+
+
+def test_hedge_delay_tracks_recent_first_tokens():
+    history = [{"route": "local", "ttft": t / 10} for t in range(1, 11)]
+    assert router.hedge_delay(history[:2]) == router.HEDGE_DEFAULT_DELAY
+    assert router.hedge_delay(history) == 1.0 # 90th percentile of 0.1 .. 1.0
+    assert router.hedge_delay([{"route": "local", "ttft": 0.01}] * 10) == router.HEDGE_MIN_DELAY
@@ -0,0 +1,49 @@
+import host_load
+import stats_journal
+
+
+def _fake_proc(monkeypatch, tmp_path, load, mem_available, swap_pages):
+    (tmp_path / "loadavg").write_text(f"{load} 1.00 1.00 2/300 4242\n")
+    (tmp_path / "meminfo").write_text(f"MemTotal:  8000000 kB\nMemAvailable:  {mem_available} kB\n")
+    (tmp_path / "vmstat").write_text(f"pswpin {swap_pages}\npswpout 0\n")
+    monkeypatch.setattr(host_load, "PROC_LOADAVG", str(tmp_path / "loadavg"))
+    monkeypatch.setattr(host_load, "PROC_MEMINFO", str(tmp_path / "meminfo"))
+    monkeypatch.setattr(host_load, "PROC_VMSTAT", str(tmp_path / "vmstat"))
+    monkeypatch.setattr(host_load.os, "cpu_count", lambda: 4)
+
+
+def test_pressure_and_thrashing(monkeypatch, tmp_path):
+    _fake_proc(monkeypatch, tmp_path, 8.0, 4000000, 1000)
+    first = host_load.read_pressure()
+    assert first["load_per_cpu"] == 2.0 and first["mem_available_ratio"] == 0.5
+    assert first["swap_pages_per_second"] is None
+    assert host_load.thrashing(first) is None
+    assert host_load.load_factor(first) == 2.0
+
+    _fake_proc(monkeypatch, tmp_path, 1.0, 400000, 6000)
+    second = host_load.read_pressure(dict(first, sampled_at=first["sampled_at"] - 10))
+    assert 400 < second["swap_pages_per_second"] <= 500
+    assert "memory available" in host_load.thrashing(second)
+    assert "swapping" in host_load.thrashing(dict(second, mem_available_ratio=0.5))
+    # Without /proc (non-Linux) nothing is known and nothing is blocked
+    monkeypatch.setattr(host_load, "PROC_LOADAVG", str(tmp_path / "missing"))
+    assert host_load.load_factor(host_load.read_pressure()) == 1.0
+
+
+def test_prediction_follows_local_perf_ewma():
+    stats = stats_journal.default_stats()
+    for _ in range(2):
+        # 10 s for 200 tokens (150 of them prompt), 2 s of it loading the model, on a 2x loaded host
+        stats_journal.apply_record(stats, {"type": "usage", "entry": {
+            "route": "local", "tokens": 200, "prompt_tokens": 150, "latency": 10.0,
+            "load_duration": 2.0, "load_factor": 2.0, "tps": 12.5}})
+    perf = stats["local_perf"]
+    assert perf["samples"] == 2 and perf["seconds_per_token"] == 0.02 and perf["response_tokens"] == 50
+    assert host_load.predict(perf, 1000) is None # Not enough samples yet
+
+    perf["samples"] = host_load.MIN_SAMPLES
+    assert host_load.predict(perf, 950) == 20.0
+    assert host_load.predict(perf, 950, {"load_per_cpu": 3.0}) == 60.0
+    assert host_load.timeout_for(None, 25) == 25
+    assert host_load.timeout_for(1.0, 25) == host_load.MIN_TIMEOUT_SECONDS
+    assert host_load.timeout_for(60.0, 25) == 25
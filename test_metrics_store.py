@@ -0,0 +1,74 @@
+import datetime
+
+import metrics_store
+
+
+def _use_tmp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics_store, "GLOBAL_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics_store, "METRICS_FILE", str(tmp_path / "metrics.sqlite3"))
+
+
+def _usage(ts, route, latency, tokens=10, ok=True, model="gemma3:1b"):
+    return {"type": "usage", "ok": ok, "entry": {
+        "timestamp": datetime.datetime.fromtimestamp(ts).isoformat(),
+        "route": route, "model": model, "tokens": tokens, "latency": latency
+    }}
+
+
+def test_histogram_percentiles_are_within_bucket_resolution():
+    hist = {}
+    for ms in range(1, 1001):
+        index = metrics_store.histogram_index(ms / 1000)
+        hist[index] = hist.get(index, 0) + 1
+    for q, exact in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+        assert exact <= metrics_store.quantile(hist, q) <= exact * metrics_store.HISTOGRAM_GROWTH
+    # Merging two halves gives the same histogram as recording everything in one
+    a, b = {}, {}
+    for ms in range(1, 1001):
+        target = a if ms % 2 else b
+        index = metrics_store.histogram_index(ms / 1000)
+        target[index] = target.get(index, 0) + 1
+    assert metrics_store.merge_histograms(a, b) == hist
+
+
+def test_ingest_is_exactly_once_per_journal_position(monkeypatch, tmp_path):
+    _use_tmp_db(monkeypatch, tmp_path)
+    records = [_usage(1_700_000_000 + i, "local", 1.0) for i in range(5)]
+    offsets = [0, 100, 200, 300, 400, 500] # Pretend each record is 100 bytes
+
+    def records_from(offset):
+        return records[offset // 100:]
+
+    assert metrics_store.ingest_journal("e1", offsets[3], lambda o: records_from(o)[:3 - o // 100]) == 3
+    # A retried compaction of the same epoch only adds what is past the saved position
+    assert metrics_store.ingest_journal("e1", offsets[5], records_from) == 2
+    assert metrics_store.ingest_journal("e1", offsets[5], records_from) == 0
+    summary = metrics_store.query_range(1_699_999_000, 1_700_001_000)["summary"]
+    assert summary[0]["requests"] == 5
+
+
+def test_range_queries_pick_resolution_and_report_percentiles(monkeypatch, tmp_path):
+    _use_tmp_db(monkeypatch, tmp_path)
+    now = 1_700_000_000
+    monkeypatch.setattr(metrics_store.time, "time", lambda: now)
+    records = [_usage(now - 7200 + i * 60, "local", 0.1 * (1 + i % 10)) for i in range(120)]
+    records += [_usage(now - 60, "cloud", 2.0, tokens=100), _usage(now - 30, "local", 0, ok=False)]
+    records += [{"type": "failure", "time": now - 10, "model": "gemma3:1b"}]
+    metrics_store.ingest_journal("e1", 1, lambda o: records)
+
+    assert metrics_store.pick_resolution(now - 3600, now) == 60
+    assert metrics_store.pick_resolution(now - 7 * 86400, now) == 3600
+    assert metrics_store.pick_resolution(now - 365 * 86400, now) == 86400
+
+    result = metrics_store.query_range(now - 7200, now)
+    assert result["resolution"] == 60
+    by_route = {s["route"]: s for s in result["summary"]}
+    assert by_route["cloud"]["tokens"] == 100
+    assert by_route["local"]["requests"] == 122 and by_route["local"]["errors"] == 2
+    assert 0.9 <= by_route["local"]["p95"] <= 1.0 * metrics_store.HISTOGRAM_GROWTH
+    local_points = [s for s in result["series"] if s["route"] == "local"][0]["points"]
+    assert sum(p["requests"] for p in local_points) == 122 and local_points[0]["t"] % 60 == 0
+
+    hourly = metrics_store.query_range(now - 7200, now, resolution=3600, route="local")
+    assert sum(p["requests"] for p in hourly["series"][0]["points"]) == 122
+    assert hourly["summary"][0]["p95"] == by_route["local"]["p95"]
@@ -0,0 +1,70 @@
+import socket
+import threading
+
+import pytest
+import requests
+
+import model_warmup
+import health_state
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def cold(ollama):
+    """The shared mock with nothing loaded yet (a cold load reports 1.25 s). Returns its generate endpoint."""
+    ollama.loaded, ollama.load_seconds = [], 1.25
+    return ollama.url + "/api/generate"
+
+
+def test_preload_loads_model_and_reports_residency(cold, ollama):
+    assert model_warmup.is_resident(requests, cold, "gemma3:1b") is False
+    assert model_warmup.preload(requests, cold, "gemma3:1b", keep_alive=-1) == 1.25
+    assert ollama.received == [{"model": "gemma3:1b", "keep_alive": -1}]
+    assert model_warmup.is_resident(requests, cold, "gemma3:1b") is True
+    # Already resident: the reload is cheap and doesn't count as a cold start
+    assert model_warmup.preload(requests, cold, "gemma3:1b") < model_warmup.COLD_LOAD_SECONDS
+
+
+def test_untagged_names_mean_latest(cold):
+    model_warmup.preload(requests, cold, "gemma3")
+    assert model_warmup.is_resident(requests, cold, "gemma3:latest") is True
+    assert model_warmup.is_resident(requests, cold, "gemma3:1b") is False
+
+
+def test_unreachable_service(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        endpoint = f"http://127.0.0.1:{s.getsockname()[1]}/api/generate"
+    assert model_warmup.is_resident(requests, endpoint, "gemma3:1b") is None
+    # Connection refused is retried until the timeout, then reported as a failed preload
+    assert model_warmup.preload(requests, endpoint, "gemma3:1b", timeout=1.5) is None
+
+    monkeypatch.setattr(model_warmup, "PRELOAD_TIMEOUT", 1)
+    done = threading.Event()
+    assert model_warmup.preload_async(requests, endpoint, "gemma3:1b", on_done=lambda load: done.set())
+    assert not model_warmup.preload_async(requests, endpoint, "gemma3:1b") # already in flight
+    assert done.wait(10)
+
+
+def test_cli_preload_is_not_left_to_a_dying_thread(state_dir, monkeypatch):
+    started = []
+    def preload_async(http, endpoint, model, keep_alive=None, on_done=None, load=0.5):
+        started.append(model)
+        if load is not None:
+            threading.Thread(target=on_done, args=(load,)).start()
+        return True
+    monkeypatch.setattr(model_warmup, "preload_async", preload_async)
+    assert router.SERVED_BY == "cli"
+
+    # A probing watchdog takes over: nothing is started in a process about to exit
+    health_state.write_probe(True, "watchdog")
+    assert "watchdog" in router.preload_local_model(cli_wait=5) and started == []
+
+    health_state.write_probe(True, "router")
+    assert router.preload_local_model(cli_wait=5) == "Model preload finished."
+    monkeypatch.setattr(model_warmup, "preload_async", lambda *args, **kwargs: preload_async(*args, load=None, **kwargs))
+    assert "did not finish within 0.1s" in router.preload_local_model(cli_wait=0.1)
+
+    monkeypatch.setattr(router, "SERVED_BY", "daemon")
+    assert router.preload_local_model() == "Preloading the model in the background."
+    assert len(started) == 3
@@ -0,0 +1,353 @@
+import os
+import sys
+import gzip
+import json
+import time
+import socket
+import subprocess
+import datetime
+import threading
+import http.client
+import urllib.request
+import urllib.error
+
+import pytest
+
+import stats_journal
+import health_state
+import backend_pool
+import mock_ollama
+import bridge_monitor
+from test_stats_journal import _usage
+
+
+@pytest.fixture
+def monitor(state_dir, monkeypatch):
+    feed = bridge_monitor.StatsFeed(max_changes=4)
+    monkeypatch.setattr(bridge_monitor, "FEED", feed)
+    server = bridge_monitor.MonitorServer(("127.0.0.1", 0), bridge_monitor.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield feed, f"http://127.0.0.1:{server.server_address[1]}"
+    bridge_monitor.stop_server(server)
+
+
+def _get(url, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b""
+
+
+def test_feed_deltas_follow_the_journal(monitor):
+    feed, _ = monitor
+    stats_journal.append_records([_usage("local", 10, 0)])
+    first = feed.delta()
+    assert first["reset"] and first["stats"]["total_local_tokens"] == 10
+
+    stats_journal.append_records([_usage("cloud", 5, 1), {"type": "event", "event": {"level": "INFO", "message": "hi"}}])
+    stats_journal.compact()
+    stats_journal.append_records([_usage("local", 1, 2)])
+    assert feed.refresh()
+    delta = feed.delta(first["version"])
+    assert not delta["reset"]
+    assert [h["prompt_preview"] for h in delta["history"]] == ["p1", "p2"]
+    assert [e["message"] for e in delta["events"]] == ["hi"]
+    assert delta["summary"]["total_local_tokens"] == 11
+    assert "history" not in delta["summary"]
+    assert feed.delta(delta["version"])["history"] == []
+
+    # Versions that fell out of the change window, or from another instance, get a full reset
+    stats_journal.append_records([_usage("local", 1, i) for i in range(3, 8)])
+    feed.refresh()
+    assert feed.delta(delta["version"])["reset"]
+    assert feed.delta("other:1")["reset"]
+
+
+def test_stats_etag_and_delta_endpoint(monitor):
+    feed, base = monitor
+    stats_journal.append_records([_usage("local", 3, 0)])
+    status, headers, body = _get(base + "/usage_stats.json")
+    assert status == 200 and json.loads(body)["total_local_tokens"] == 3
+    etag = headers["ETag"]
+    assert _get(base + "/usage_stats.json", {"If-None-Match": etag})[0] == 304
+
+    stats_journal.append_records([_usage("local", 4, 1)])
+    feed.refresh()
+    assert _get(base + "/usage_stats.json", {"If-None-Match": etag})[0] == 200
+
+    version = etag.strip('"')
+    status, _, body = _get(base + "/api/stats?since=" + version)
+    delta = json.loads(body)
+    assert [h["tokens"] for h in delta["history"]] == [4]
+
+
+def test_event_stream_pushes_changes(monitor):
+    feed, base = monitor
+    feed.refresh()
+    with urllib.request.urlopen(base + "/api/stream", timeout=5) as resp:
+        assert resp.headers["Content-type"] == "text/event-stream"
+        first = [resp.readline() for _ in range(4)]
+        assert first[1] == b"event: delta\n" and json.loads(first[2][6:])["reset"]
+
+        stats_journal.append_records([_usage("cloud", 2, 1)])
+        feed.refresh()
+        lines = [resp.readline() for _ in range(4)]
+        delta = json.loads(lines[2][6:])
+        assert lines[0] == f"id: {delta['version']}\n".encode()
+        assert [h["tokens"] for h in delta["history"]] == [2]
+
+
+def test_gzip_and_static_cache_headers(monitor):
+    _, base = monitor
+    status, headers, body = _get(base + "/dashboard.html", {"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    with open(os.path.join(bridge_monitor.DIRECTORY, "dashboard.html"), "rb") as f:
+        assert gzip.decompress(body) == f.read()
+    assert "max-age" in headers["Cache-Control"] and headers["Last-Modified"]
+    assert _get(base + "/dashboard.html", {"If-None-Match": headers["ETag"]})[0] == 304
+
+    stats_journal.append_records([_usage("local", 1, i) for i in range(20)])
+    status, headers, body = _get(base + "/usage_stats.json", {"Accept-Encoding": "gzip"})
+    assert headers["Content-Encoding"] == "gzip" and len(json.loads(gzip.decompress(body))["history"]) == 20
+
+
+def test_load_many_concurrent_pollers(monitor):
+    """Sustained polling over keep-alive connections while a stream and a stalled client hold workers."""
+    feed, base = monitor
+    stats_journal.append_records([_usage("local", 1, i) for i in range(100)])
+    feed.refresh()
+    host, port = base[len("http://"):].split(":")
+    pollers, duration = 40, 2.0
+
+    stalled = socket.create_connection((host, int(port))) # Connected but never sends a request
+    stream = urllib.request.urlopen(base + "/api/stream", timeout=5)
+
+    counts, errors = [], []
+    deadline = time.monotonic() + duration
+
+    def poll(i):
+        conn = http.client.HTTPConnection(host, int(port), timeout=5)
+        version, n, sock = None, 0, None
+        try:
+            while time.monotonic() < deadline:
+                # Every request gets a body: a 304 would never show a per-response stall
+                if i % 2:
+                    conn.request("GET", "/usage_stats.json", headers={"Accept-Encoding": "gzip"})
+                else:
+                    conn.request("GET", "/api/stats" + (f"?since={version}" if version else ""))
+                resp = conn.getresponse()
+                body = resp.read()
+                assert resp.status == 200 and body, resp.status
+                if not i % 2:
+                    version = json.loads(body)["version"]
+                # Every request after the first must reuse the same connection
+                assert sock is None or conn.sock is sock, "connection was not kept alive"
+                sock = conn.sock
+                n += 1
+            counts.append(n)
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=poll, args=(i,)) for i in range(pollers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stalled.close()
+    stream.close()
+
+    rps = sum(counts) / duration
+    typical = sorted(counts)[len(counts) // 2] / duration if counts else 0
+    print(f"\n[*] {pollers} concurrent pollers: {rps:.0f} requests/sec, {typical:.0f}/sec on the median connection")
+    assert not errors, errors[:3]
+    assert len(counts) == pollers and min(counts) > 10
+    # A delayed-ACK stall (~40 ms per response with a body) would cap every connection at 25/sec
+    assert typical > 50
+
+
+def test_legacy_ingestion_is_incremental_and_deduplicated(monkeypatch, tmp_path):
+    log = tmp_path / "gemma_savings.log"
+    state = tmp_path / "legacy_ingest.json"
+    lines = [f"Fri Jan 30 05:15:{i:02d} PM EST 2026: Saved {10 + i} tokens (Gemma 1B) - task {i}\n" for i in range(3)]
+    log.write_text("".join(lines) + "garbage line\n")
+
+    parsed = []
+    real_parse = bridge_monitor.parse_legacy_line
+    monkeypatch.setattr(bridge_monitor, "parse_legacy_line", lambda line: parsed.append(line) or real_parse(line))
+
+    ingester = bridge_monitor.LegacyLogIngester(str(log), str(state))
+    records = ingester.collect({"history": []})
+    assert [r["entry"]["prompt_preview"] for r in records] == ["task 0", "task 1", "task 2"]
+    ingester.commit()
+
+    # Nothing appended: no parsing at all; a half-written line waits for its newline
+    parsed.clear()
+    assert ingester.collect({"history": []}) == [] and parsed == []
+    with open(log, "a") as f:
+        f.write("Fri Jan 30 05:16:00 PM EST 2026: Saved 7 tokens (Gemma 1B) - late")
+    assert ingester.collect({"history": []}) == []
+    with open(log, "a") as f:
+        f.write("\n")
+    assert [r["entry"]["tokens"] for r in ingester.collect({"history": []})] == [7]
+    assert len(parsed) == 1
+    ingester.commit()
+
+    # Rotation re-reads from the top; the index (persisted across restarts) skips old lines,
+    # and a history entry within a second of a new line counts as the same task
+    log.unlink()
+    log.write_text("".join(lines) + "Fri Jan 30 05:17:00 PM EST 2026: Saved 5 tokens (Gemma 1B) - routed\n"
+                   + "Fri Jan 30 05:18:00 PM EST 2026: Saved 6 tokens (Gemma 1B) - new\n")
+    history = [{"timestamp": "2026-01-30T17:17:00.812345", "route": "local", "tokens": 5}]
+    restarted = bridge_monitor.LegacyLogIngester(str(log), str(state))
+    assert [r["entry"]["prompt_preview"] for r in restarted.collect({"history": history})] == ["new"]
+
+    # The window is symmetric: a router entry up to 2 s either side of a legacy line matches it
+    log.write_text("Fri Jan 30 05:20:02 PM EST 2026: Saved 8 tokens (Gemma 1B) - after\n"
+                   "Fri Jan 30 05:21:00 PM EST 2026: Saved 9 tokens (Gemma 1B) - before\n"
+                   "Fri Jan 30 05:22:00 PM EST 2026: Saved 4 tokens (Gemma 1B) - apart\n"
+                   "Fri Jan 30 05:23:00 PM EST 2026: Saved 3 tokens (Gemma 1B) - earlier\n")
+    history = [{"timestamp": "2026-01-30T17:20:00.300000", "route": "local", "tokens": 8},
+               {"timestamp": "2026-01-30T17:21:01.700000", "route": "local", "tokens": 9},
+               {"timestamp": "2026-01-30T17:22:02.000000", "route": "local", "tokens": 4},
+               {"timestamp": "2026-01-30T17:22:58.000000", "route": "local", "tokens": 3}]
+    symmetric = bridge_monitor.LegacyLogIngester(str(log), str(tmp_path / "fresh_ingest.json"))
+    assert [r["entry"]["prompt_preview"] for r in symmetric.collect({"history": history})] == ["apart", "earlier"]
+
+
+def test_probe_interval_adapts_to_health():
+    interval = bridge_monitor.PROBE_INTERVAL_MIN
+    for _ in range(10):
+        interval = bridge_monitor.next_probe_interval("Healthy", True, interval)
+    assert interval == bridge_monitor.PROBE_INTERVAL_MAX
+    assert bridge_monitor.next_probe_interval("Healthy", False, interval) == bridge_monitor.PROBE_INTERVAL_FAST
+    assert bridge_monitor.next_probe_interval("Degraded", True, interval) == bridge_monitor.PROBE_INTERVAL_FAST
+    # Back to healthy: restart the back-off from the minimum
+    assert bridge_monitor.next_probe_interval("Healthy", True, bridge_monitor.PROBE_INTERVAL_FAST) == bridge_monitor.PROBE_INTERVAL_MIN
+
+
+def test_health_transitions_are_compare_and_set():
+    now = 10000
+    cooling = {"health": "Degraded", "last_fail_time": now - 10}
+    assert bridge_monitor.health_transition(cooling, False, now) == []
+    assert bridge_monitor.health_transition(cooling, True, now) == [
+        {"type": "health", "expect": ["Degraded"], "set": {"health": "Retrying"}}]
+
+    cooled = {"health": "Retrying", "last_fail_time": now - bridge_monitor.CIRCUIT_BREAKER_COOLDOWN - 1}
+    records = bridge_monitor.health_transition(cooled, True, now)
+    assert records[0] == {"type": "health", "expect": ["Retrying"], "set": {"health": "Healthy", "fail_count": 0}}
+    assert records[1]["event"]["level"] == "SUCCESS"
+    # Alive but the model isn't loaded yet: the circuit stays open
+    assert bridge_monitor.health_transition(cooled, True, now, ready=False) == []
+    assert bridge_monitor.health_transition(dict(cooled, health="Degraded"), True, now, ready=False) == [
+        {"type": "health", "expect": ["Degraded"], "set": {"health": "Retrying"}}]
+    assert bridge_monitor.health_transition({"health": "Healthy"}, True, now) == []
+
+
+def test_watchdog_probes_every_pool_node(state_dir, monkeypatch):
+    live, cold = mock_ollama.MockOllama(), mock_ollama.MockOllama(models=("gemma3:1b",))
+    pool = [backend_pool.Node("live", live.start() + "/api/generate", "gemma3:1b"),
+            backend_pool.Node("cold", cold.start() + "/api/generate", "gemma3:4b"), # up, model not loaded
+            backend_pool.Node("dead", "http://127.0.0.1:9/api/generate", "gemma3:1b")]
+    monkeypatch.setattr(bridge_monitor, "POOL", pool)
+    preloaded = []
+    monkeypatch.setattr(bridge_monitor, "preload_local_model", lambda node=None: preloaded.append(node.name))
+    stats = stats_journal.default_stats()
+    for node in pool:
+        stats_journal.apply_record(stats, {"type": "failure", "time": 1, "hard_crash": True, "node": node.name,
+                                           "pool": [n.name for n in pool]})
+    assert stats["health"] == "Degraded"
+    try:
+        results, records = bridge_monitor.probe_pool(stats)
+    finally:
+        live.stop()
+        cold.stop()
+
+    assert results == {"live": {"alive": True, "resident": True}, "cold": {"alive": True, "resident": False},
+                       "dead": {"alive": False, "resident": False}}
+    assert preloaded == ["cold"]
+    for record in records:
+        stats_journal.apply_record(stats, record)
+    assert {name: state["health"] for name, state in stats["nodes"].items()} == {
+        "live": "Healthy", "cold": "Retrying", "dead": "Degraded"}
+    assert stats["health"] == "Healthy"
+
+    health_state.write_probe(True, "watchdog", nodes=results)
+    lines = set(bridge_monitor.PromMetrics().render(stats).splitlines())
+    assert {'gemma_bridge_node_up{node="live"} 1', 'gemma_bridge_node_up{node="dead"} 0',
+            'gemma_bridge_node_model_resident{node="cold"} 0'} <= lines
+
+
+def test_cooldown_comes_from_the_router_config(tmp_path):
+    config_dir = tmp_path / ".config" / "gemma-bridge"
+    config_dir.mkdir(parents=True)
+    (config_dir / "antigravity_config.json").write_text(json.dumps({"reliability": {"circuit_breaker_cooldown": 45}}))
+    code = ("import bridge_monitor as m; now = 10000; stats = {'health': 'Degraded', 'last_fail_time': now - 50}; "
+            "print(m.CIRCUIT_BREAKER_COOLDOWN, m.health_transition(stats, True, now)[0]['set']['health'])")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ, HOME=str(tmp_path)))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-2:] == ["45", "Healthy"]
+
+
+def test_change_token_follows_writes(state_dir):
+    token = stats_journal.change_token()
+    assert token == stats_journal.change_token()
+    stats_journal.append_records([_usage("local", 1)])
+    assert stats_journal.change_token() != token
+    token = stats_journal.change_token()
+    stats_journal.compact()
+    assert stats_journal.change_token() != token
+
+
+def test_metrics_range_endpoint(monitor):
+    _, base = monitor
+    stats_journal.append_records([_usage("local", 5, i) for i in range(3)])
+    stats_journal.compact()
+    start = datetime.datetime(2026, 1, 1).timestamp()
+    status, _, body = _get(base + f"/api/metrics?start={start}&end={start + 600}")
+    result = json.loads(body)
+    # Minute and hour rollups this old are past retention, so the daily ones answer
+    assert status == 200 and result["resolution"] == 86400
+    assert result["summary"][0]["tokens"] == 15
+    assert _get(base + "/api/metrics?window=1y")[0] == 400
+    assert _get(base + "/api/metrics?window=1h&resolution=5")[0] == 400
+
+
+def test_prometheus_metrics_update_incrementally(monitor):
+    feed, base = monitor
+    feed.refresh()
+    local = _usage("local", 10, 1)
+    local["entry"]["latency"] = 0.3
+    local["entry"]["load_duration"] = 2.5
+    stats_journal.append_records([
+        local, _usage("cloud", 4, 2), dict(_usage("local", 2, 3), ok=False),
+        {"type": "failure", "time": time.time(), "hard_crash": True, "threshold": 2},
+        {"type": "event", "event": {"level": "SUCCESS", "message": "restarted", "kind": "self_healing"}},
+    ])
+    feed.refresh()
+
+    status, headers, body = _get(base + "/metrics")
+    assert status == 200 and headers["Content-type"].startswith("text/plain; version=0.0.4")
+    lines = set(body.decode().splitlines())
+    for expected in (
+        'gemma_bridge_tokens_total{route="local"} 10',
+        'gemma_bridge_tokens_total{route="cloud"} 4',
+        'gemma_bridge_requests_total{route="local",outcome="ok"} 1',
+        'gemma_bridge_requests_total{route="local",outcome="error"} 2',
+        'gemma_bridge_requests_total{route="cloud",outcome="ok"} 1',
+        'gemma_bridge_circuit_breaker_trips_total 1',
+        'gemma_bridge_self_healing_restarts_total{result="restarted"} 1',
+        'gemma_bridge_health_state{state="Degraded"} 1',
+        'gemma_bridge_fail_count 1',
+        'gemma_bridge_local_latency_seconds_bucket{le="0.25"} 0',
+        'gemma_bridge_local_latency_seconds_bucket{le="0.5"} 1',
+        'gemma_bridge_local_latency_seconds_count 1',
+        'gemma_bridge_local_cold_starts_total 1',
+        'gemma_bridge_local_load_seconds_total 2.5',
+    ):
+        assert expected in lines, expected
+    cooldown = [l for l in lines if l.startswith("gemma_bridge_cooldown_remaining_seconds ")][0]
+    assert 0 < float(cooldown.split()[1]) <= bridge_monitor.CIRCUIT_BREAKER_COOLDOWN
@@ -0,0 +1,72 @@
+import io
+import sys
+import argparse
+
+import pipeline
+import ag_hybrid_router as router
+
+
+SOURCE = "".join(f"def func_{i}():\n    x = {i}\n    return x * 2\n\n" for i in range(200))
+
+
+def test_chunks_cover_the_file_and_cut_at_definitions(tmp_path):
+    path = tmp_path / "big.py"
+    path.write_text(SOURCE + "é" * 300) # ends with one long multi-byte line
+    with pipeline.ChunkedFile(str(path), chunk_tokens=64) as chunked:
+        texts = [chunked.text(i) for i in range(len(chunked))]
+        assert all(end - start <= chunked.budget for start, end in chunked.spans)
+    assert "".join(texts) == path.read_text() # no bytes lost, no UTF-8 sequence split
+    code_chunks = [t for t in texts if "def" in t]
+    assert all(t.startswith("def ") for t in code_chunks)
+
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    with pipeline.ChunkedFile(str(empty)) as chunked:
+        assert len(chunked) == 0
+
+
+def test_reduce_groups_always_shrink():
+    assert pipeline.reduce_groups(["a" * 10] * 5, 25) == [["a" * 10] * 2, ["a" * 10] * 3]
+    assert pipeline.reduce_groups(["a" * 100] * 3, 10) == [["a" * 100] * 3]
+
+
+def test_pipeline_summarizes_chunks_once(state_dir, monkeypatch, tmp_path):
+    calls = []
+    def fake_local(prompt, node=None, **kwargs):
+        calls.append((prompt, node.model))
+        return f"summary{len(calls)}"
+    monkeypatch.setattr(router, "call_local_ollama", fake_local)
+    path = tmp_path / "big.py"
+    path.write_text(SOURCE)
+    args = argparse.Namespace(prompt=["find", "bugs"], no_cache=False, priority=None, escalate=False, chunk_tokens=256)
+
+    out = io.StringIO()
+    stdout = sys.stdout
+    assert router.run_pipeline(args, [str(path)], out) == 0
+    assert sys.stdout is stdout # the caller's stream is back, not stderr
+    with pipeline.ChunkedFile(str(path), 256) as chunked:
+        chunks = len(chunked)
+    assert chunks > 2 and len(calls) > chunks # map calls plus at least one reduce
+    # Only the reduce steps carry the task
+    assert [("find bugs" in prompt) for prompt, _ in calls] == [False] * chunks + [True] * (len(calls) - chunks)
+    final = out.getvalue().strip()
+    assert final == f"summary{len(calls)}"
+
+    # Unchanged file: every chunk and reduce step comes from the cache
+    calls.clear()
+    out = io.StringIO()
+    router.run_pipeline(args, [str(path)], out)
+    assert calls == [] and out.getvalue().strip() == final
+
+    # Another question over the same file reuses the chunk summaries; only the reduce runs again
+    args.prompt = ["list", "functions"]
+    router.run_pipeline(args, [str(path)], io.StringIO())
+    assert calls and all("list functions" in prompt for prompt, _ in calls)
+
+    # A summary is keyed on the model that wrote it: another model summarizes afresh
+    calls.clear()
+    big = router.backend_pool.Node("big", "http://127.0.0.1:9/api/generate", "gemma3:12b")
+    monkeypatch.setattr(router, "select_node", lambda prompt: big)
+    router.run_pipeline(args, [str(path)], io.StringIO())
+    assert len(calls) > chunks and {model for _, model in calls} == {"gemma3:12b"}
+
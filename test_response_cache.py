@@ -0,0 +1,47 @@
+import os
+import time
+
+import response_cache
+
+
+def test_key_covers_route_model_options_and_prompt():
+    base = response_cache.cache_key("local", "gemma3:1b", {"num_thread": 2}, "lint this")
+    assert base == response_cache.cache_key("local", "gemma3:1b", {"num_thread": 2}, "lint this")
+    assert base != response_cache.cache_key("cloud", "gemma3:1b", {"num_thread": 2}, "lint this")
+    assert base != response_cache.cache_key("local", "gemma3:4b", {"num_thread": 2}, "lint this")
+    assert base != response_cache.cache_key("local", "gemma3:1b", {"num_thread": 4}, "lint this")
+    assert base != response_cache.cache_key("local", "gemma3:1b", {"num_thread": 2}, "lint that")
+
+
+def test_ttl_expires_entries(state_dir, monkeypatch):
+    response_cache.put("ab" * 32, "cached", latency=1.5)
+    assert response_cache.get("ab" * 32)["latency"] == 1.5
+    monkeypatch.setattr(response_cache, "TTL_SECONDS", 1)
+    monkeypatch.setattr(response_cache.time, "time", lambda: time.monotonic() + 10 ** 10)
+    assert response_cache.get("ab" * 32) is None
+
+
+def test_lru_eviction_keeps_recently_used(state_dir, monkeypatch):
+    monkeypatch.setattr(response_cache, "MAX_BYTES", 10 ** 9)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        response_cache.put(key, "x" * 1000)
+        os.utime(response_cache._path(key), (i, i))
+    response_cache.get(keys[0])  # touch the oldest entry
+    response_cache.evict(max_bytes=2500)
+    assert response_cache.get(keys[0]) is not None
+    assert response_cache.get(keys[1]) is None
+    assert response_cache.get(keys[2]) is not None
+
+
+def test_put_scans_for_eviction_only_now_and_then(state_dir, monkeypatch):
+    scans = []
+    monkeypatch.setattr(response_cache, "evict", lambda: scans.append(True))
+    monkeypatch.setattr(response_cache, "EVICT_BYTES", 10 ** 4)
+    monkeypatch.setitem(response_cache._written, "bytes", 0)
+    monkeypatch.setattr(response_cache.random, "random", lambda: 0.5) # never sampled
+    for i in range(20):
+        response_cache.put(f"{i:02d}" * 32, "x" * 100)
+    assert scans == []
+    response_cache.put("ff" * 32, "x" * 10 ** 4) # crosses EVICT_BYTES
+    assert scans == [True]
@@ -1,5 +1,9 @@
 import subprocess
 import time
+import os
+import json
+import select
+import tempfile
 
 def test_router_local():
     print("TEST: Routing 'Summarize this' to LOCAL...")
@@ -32,9 +36,87 @@ def test_router_cloud():
         print(f"FAIL: Expected CLOUD, got:\n{result.stdout}")
         return False
 
+def test_router_daemon():
+    print("\nTEST: CLI forwards to a running router daemon...")
+    home = tempfile.mkdtemp(prefix="gemma-test-home-")
+    env = dict(os.environ, HOME=home)
+    sock = os.path.join(home, ".config", "gemma-bridge", "router.sock")
+    daemon = subprocess.Popen(
+        ["python3", "ag_hybrid_router.py", "--daemon"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(50):
+            if os.path.exists(sock): break
+            time.sleep(0.1)
+        assert os.path.exists(sock), "daemon never started listening"
+        result = subprocess.run(
+            ["python3", "ag_hybrid_router.py", "Plan a complex microservices architecture."],
+            capture_output=True, text=True, env=env
+        )
+
+        # A batch on stdin is streamed through: the first result arrives before stdin is closed
+        batch = subprocess.Popen(
+            ["python3", "ag_hybrid_router.py", "--batch", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env
+        )
+        batch.stdin.write('"Plan a migration strategy."\n')
+        batch.stdin.flush()
+        ready, _, _ = select.select([batch.stdout], [], [], 10)
+        first = json.loads(batch.stdout.readline()) if ready else None
+        batch.stdin.write('"Design a schema."\n')
+        batch.stdin.close()
+        rest = [json.loads(line) for line in batch.stdout]
+        batch.wait(timeout=10)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    assert os.path.exists(os.path.join(home, ".config", "gemma-bridge")), "config dir not created"
+    assert result.returncode == 0, result.stderr
+    assert "Routing to CLOUD" in result.stdout, result.stdout
+    # The in-process fallback prints the same output; only the trace tells who served it
+    with open(os.path.join(home, ".config", "gemma-bridge", "traces.jsonl")) as f:
+        traces = [json.loads(line) for line in f]
+    assert [t["served_by"] for t in traces] == ["daemon"], traces
+
+    assert first is not None and first["index"] == 0, "batch result waited for the end of stdin"
+    assert [r["index"] for r in rest] == [1] and batch.returncode == 0
+    print("PASS: Daemon handled the forwarded request.")
+
+def test_router_batch():
+    print("\nTEST: Batch mode writes one result per input line, in input order...")
+    home = tempfile.mkdtemp(prefix="gemma-test-home-")
+    env = dict(os.environ, HOME=home)
+    lines = [
+        '{"id": "a", "prompt": "Plan a migration strategy."}',
+        '"Design a schema."',
+        '{"prompt": "Compare two designs.", "route": "cloud"}',
+    ]
+    result = subprocess.run(
+        ["python3", "ag_hybrid_router.py", "--no-daemon", "--batch", "-"],
+        input="\n".join(lines) + "\n", capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+    results = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [r["index"] for r in results] == [0, 1, 2], result.stdout
+    assert results[0]["id"] == "a"
+    assert all(r["route"] == "cloud" for r in results)
+    assert "Batch complete: 3 items" in result.stderr
+    print("PASS: Batch results are ordered JSONL.")
+
+def _passes(test):
+    """Runs an assert-based test for the script mode below."""
+    try:
+        test()
+        return True
+    except AssertionError as e:
+        print(f"FAIL: {e}")
+        return False
+
 if __name__ == "__main__":
     print("=== Hybrid Router Verification ===")
-    if test_router_local() and test_router_cloud():
+    if test_router_local() and test_router_cloud() and _passes(test_router_daemon) and _passes(test_router_batch):
         print("\n[SUCCESS] Bridge is ACTIVE and routing correctly.")
     else:
         print("\n[FAILURE] Verification failed.")
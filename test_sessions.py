@@ -0,0 +1,38 @@
+import stats_journal
+import session_store
+import ag_hybrid_router as router
+
+
+def test_later_turns_reuse_the_context_and_skip_a_resent_preamble(ollama):
+    ollama.latency = 0.01 # reported as the prefill time of every call
+    preamble = "GEMINI.md: keep functions short.\n" * 5
+    router.call_local_ollama(preamble + "format a.py", session="agent-1")
+    router.call_local_ollama(preamble + "format b.py", session="agent-1")
+
+    first, second = ollama.received
+    assert "context" not in first
+    assert second["prompt"] == "format b.py" # the preamble is already in the context
+    reused = len(first["prompt"]) // 4 + ollama.response_tokens # the first turn's returned context
+    assert len(second["context"]) == reused
+
+    stats = stats_journal.read_stats()
+    assert stats["sessions"] == {"turns": 2, "reused_tokens": reused,
+                                 "prefill_saved_seconds": round(reused * 0.01 / (len("format b.py") // 4), 3)}
+    assert stats["history"][-1]["session_turn"] == 2
+
+
+def test_session_turns_bypass_the_response_cache(ollama):
+    router.call_local_ollama("same prompt", session="s")
+    router.call_local_ollama("same prompt", session="s")
+    assert len(ollama.received) == 2 and "context" in ollama.received[1]
+
+
+def test_idle_and_least_recently_used_sessions_are_evicted(state_dir, monkeypatch):
+    monkeypatch.setattr(session_store, "MAX_SESSIONS", 2)
+    for name in ("a", "b", "c"):
+        session_store.save(name, "m", "local", [1, 2, 3])
+    assert session_store.load("a") is None
+    assert session_store.load("c")["context"] == [1, 2, 3]
+
+    monkeypatch.setattr(session_store, "IDLE_SECONDS", -1)
+    assert session_store.load("c") is None
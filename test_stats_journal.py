@@ -0,0 +1,120 @@
+import os
+import multiprocessing
+
+import stats_journal
+import metrics_store
+
+
+def _usage(route, tokens, i=0):
+    return {"type": "usage", "entry": {
+        "timestamp": f"2026-01-01T00:00:{i % 60:02d}", "route": route, "tokens": tokens,
+        "latency": 0, "prompt_preview": f"p{i}"
+    }}
+
+
+def _writer(paths, n):
+    stats_file, journal_file, metrics_file = paths
+    stats_journal.STATS_FILE = stats_file
+    stats_journal.JOURNAL_FILE = journal_file
+    metrics_store.METRICS_FILE = metrics_file
+    stats_journal.FSYNC = False
+    stats_journal.COMPACT_THRESHOLD_BYTES = 4096  # force inline compactions under contention
+    for i in range(n):
+        stats_journal.append_record(_usage("local", 1, i))
+
+
+def test_read_stats_replays_uncompacted_records(state_dir):
+    stats_journal.append_records([_usage("local", 10), _usage("cloud", 5)])
+    stats = stats_journal.read_stats()
+    assert stats["total_local_tokens"] == 10
+    assert stats["total_cloud_tokens"] == 5
+    assert len(stats["history"]) == 2
+
+
+def test_compaction_is_idempotent_and_starts_new_epoch(state_dir):
+    stats_journal.append_record(_usage("local", 10))
+    assert stats_journal.compact() == 1
+    assert stats_journal.compact() == 0
+    stats_journal.append_record(_usage("local", 7))
+    assert stats_journal.read_stats()["total_local_tokens"] == 17
+    stats_journal.compact()
+    assert stats_journal.load_snapshot()["total_local_tokens"] == 17
+
+
+def test_crash_between_snapshot_and_journal_swap_does_not_double_count(state_dir, monkeypatch):
+    stats_journal.append_record(_usage("local", 10))
+    # Simulate a crash right after the snapshot write: the journal is never replaced
+    with monkeypatch.context() as m:
+        m.setattr(stats_journal.os, "replace", _replace_only_snapshot(stats_journal.os.replace))
+        stats_journal.compact()
+    assert stats_journal.read_stats()["total_local_tokens"] == 10
+    stats_journal.compact()
+    assert stats_journal.read_stats()["total_local_tokens"] == 10
+
+
+def _replace_only_snapshot(real_replace):
+    def _replace(src, dst):
+        if dst.endswith(".jsonl"):
+            os.unlink(src)
+            return
+        real_replace(src, dst)
+    return _replace
+
+
+def test_failure_records_trip_circuit_breaker(state_dir):
+    stats_journal.append_record({"type": "failure", "time": 1, "threshold": 2})
+    assert stats_journal.read_stats()["health"] == "Retrying"
+    stats_journal.append_record({"type": "failure", "time": 2, "threshold": 2})
+    assert stats_journal.read_stats()["health"] == "Degraded"
+    # Compare-and-set only applies while the expected state holds
+    stats_journal.append_record({"type": "health", "expect": ["Retrying"], "set": {"health": "Healthy"}})
+    assert stats_journal.read_stats()["health"] == "Degraded"
+
+
+def test_concurrent_writers_lose_no_records(state_dir):
+    paths = (stats_journal.STATS_FILE, stats_journal.JOURNAL_FILE, metrics_store.METRICS_FILE)
+    procs = [multiprocessing.Process(target=_writer, args=(paths, 200)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert stats_journal.read_stats()["total_local_tokens"] == 800
+
+    # Every compacted record reached the long-term store exactly once
+    stats_journal.compact()
+    summary = metrics_store.query_range(0, 2 ** 32, resolution=86400)["summary"]
+    assert [(s["route"], s["requests"]) for s in summary] == [("local", 800)]
+
+
+def test_tail_sees_every_record_once_across_compactions(state_dir):
+    stats_journal.append_records([_usage("local", 1, 0)])
+    stats_journal.compact()
+    stats_journal.append_records([_usage("local", 1, 1)])
+
+    tail = stats_journal.JournalTail()
+    stats = tail.start()
+    assert stats["total_local_tokens"] == 2
+
+    seen = []
+    for i in range(2, 8):
+        stats_journal.append_records([_usage("local", 1, i)])
+        if i % 2:
+            stats_journal.compact()
+        seen.extend(tail.poll())
+    assert [r["entry"]["prompt_preview"] for r in seen] == [f"p{i}" for i in range(2, 8)]
+
+    # Two compactions between polls: the tail can't prove continuity and asks for a restart
+    stats_journal.append_records([_usage("local", 1, 8)])
+    stats_journal.compact()
+    stats_journal.append_records([_usage("local", 1, 9)])
+    stats_journal.compact()
+    assert tail.poll() is None
+    assert tail.start()["total_local_tokens"] == stats_journal.read_stats()["total_local_tokens"] == 10
+
+
+def test_has_pending_tracks_uncompacted_records(state_dir):
+    assert not stats_journal.has_pending()
+    stats_journal.append_records([_usage("local", 1)])
+    assert stats_journal.has_pending()
+    stats_journal.compact()
+    assert not stats_journal.has_pending()
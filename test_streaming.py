@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+import stats_journal
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def stream(ollama, monkeypatch):
+    monkeypatch.setattr(router, "FIRST_TOKEN_TIMEOUT", 0.3)
+    monkeypatch.setattr(router, "STALL_TIMEOUT", 0.3)
+    monkeypatch.setattr(router, "attempt_self_healing", lambda: None)
+    ollama.hang_seconds = 5
+    return ollama
+
+
+def test_ttft_and_decode_speed_are_recorded(stream):
+    stream.latency, stream.tps, stream.response_tokens = 0.2, 20, 4
+    tokens = []
+    assert router.call_local_ollama("summarize", stream=True, on_token=tokens.append, use_cache=False) == "t0 t1 t2 t3 "
+    assert tokens == ["t0 ", "t1 ", "t2 ", "t3 "]
+    entry = stats_journal.read_stats()["history"][-1]
+    assert 0.2 <= entry["ttft"] < 0.3
+    assert entry["tps"] == 20.0 # Ollama's eval_count / eval_duration
+
+
+def test_no_first_token_in_time_fails_over(stream):
+    stream.latency = 5
+    start = time.time()
+    assert router.call_local_ollama("summarize", stream=True, use_cache=False) is None
+    assert time.time() - start < 1.5
+    assert stream.aborted.wait(2) # the generation is torn down, not left running
+    assert stats_journal.read_stats()["fail_count"] == 1
+
+
+def test_stall_mid_stream_abandons_the_partial_answer(stream, capsys):
+    stream.response_tokens, stream.stall_after = 4, 2
+    assert router.run_cli(["--route", "local", "--stream", "--no-cache", "summarize this"]) == 0
+    out = capsys.readouterr().out
+    # The partial local text is marked before the cloud answer is printed after it
+    partial = out.index("t0 t1 ")
+    abandoned = out.index("[LOCAL RESPONSE ABANDONED after 2 tokens")
+    assert partial < abandoned < out.index("Routing to CLOUD")
+    assert "t2" not in out
+    assert stream.aborted.wait(2)
+    assert stats_journal.read_stats()["fail_count"] == 1
@@ -0,0 +1,34 @@
+import task_classifier
+
+
+def test_keyword_matches_original_loop_order():
+    clf = task_classifier.KeywordClassifier()
+    assert clf.classify("Summarize this log file")[0] == "local"
+    # Cloud keywords win even when a local keyword appears first
+    assert clf.classify("Check the logs and then plan a migration") == ("cloud", "keyword:plan")
+    assert clf.classify("HELLO THERE") == ("local", "default")
+
+
+def test_long_prompts_scan_head_and_tail_only():
+    clf = task_classifier.KeywordClassifier(head_chars=100, tail_chars=50)
+    filler = "x" * 10000
+    assert clf.classify(filler + " design it")[0] == "cloud"
+    assert clf.classify("Design it " + filler)[0] == "cloud"
+    assert clf.classify(filler[:5000] + " design " + filler[:5000]) == ("local", "default")
+
+
+def test_hybrid_falls_back_to_keywords_until_confident():
+    history = [{"route": "cloud", "prompt_preview": "migrate the billing schema"} for _ in range(15)]
+    history += [{"route": "local", "prompt_preview": "tidy up whitespace"} for _ in range(15)]
+    clf = task_classifier.build_classifier({"classifier": "hybrid"}, history)
+    route, reason = clf.classify("migrate the billing schema please")
+    assert route == "cloud" and reason.startswith("learned:")
+    # Untrained scorer abstains, so keywords decide
+    untrained = task_classifier.build_classifier({"classifier": "hybrid"}, history[:5])
+    assert untrained.classify("plan the schema") == ("cloud", "keyword:plan")
+
+
+def test_unknown_strategy_falls_back_to_keywords(capsys):
+    clf = task_classifier.build_classifier({"classifier": "neural"})
+    assert clf.classify("plan the schema") == ("cloud", "keyword:plan")
+    assert "Unknown routing_rules.classifier 'neural'" in capsys.readouterr().err
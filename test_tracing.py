@@ -0,0 +1,44 @@
+import pytest
+
+import tracing
+import stats_journal
+import ag_hybrid_router as router
+
+
+@pytest.fixture
+def trace_file(state_dir, monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    return state_dir / "traces.jsonl"
+
+
+def test_ollama_phases_end_with_the_http_span(trace_file):
+    trace = tracing.Trace(t0=0)
+    trace.add("http", 1.0, 3.0)
+    trace.add_ollama({"load_duration": 5 * 10 ** 8, "prompt_eval_duration": 10 ** 9, "eval_duration": 5 * 10 ** 8,
+                      "prompt_eval_count": 12, "eval_count": 7}, http_end=3.0)
+    spans = {s["name"]: s for s in trace.finish()["spans"]}
+    assert spans["ollama_load"]["start_ms"] == 1000 and spans["prompt_eval"]["start_ms"] == 1500
+    assert spans["eval"]["start_ms"] + spans["eval"]["ms"] == 3000
+    assert tracing.read_recent()[-1]["eval_count"] == 7
+
+
+def test_trace_log_is_bounded(trace_file, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_BYTES", 2000)
+    for i in range(100):
+        tracing.Trace().finish(n=i)
+    assert trace_file.stat().st_size <= 2000
+    recent = tracing.read_recent(30)
+    assert [t["n"] for t in recent] == list(range(70, 100)) # spans the rotated file too
+
+
+def test_routed_request_is_traced_with_real_token_counts(trace_file, ollama):
+    ollama.latency, ollama.response_tokens = 0.05, 4
+    router.run_cli(["--route", "local", "--no-cache", "Summarize this log file for me."])
+
+    trace = tracing.read_recent(1)[0]
+    names = [s["name"] for s in trace["spans"]]
+    for name in ("classify", "health_check", "queue_wait", "http", "prompt_eval", "stats_commit"):
+        assert name in names
+    assert trace["route"] == "local" and trace["prompt_eval_count"] == 7 and trace["eval_count"] == 4
+    entry = stats_journal.read_stats()["history"][-1]
+    assert entry["trace"] == trace["id"] and entry["tokens"] == 11
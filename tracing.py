@@ -0,0 +1,133 @@
+"""
+Per-request phase tracing for the router (trace log + dashboard waterfall).
+
+A Trace collects spans for one routed request: config load, classify, health check,
+queue wait, HTTP, stats commit. add_ollama() places the phases Ollama reports (model
+load, prompt eval, eval) at the end of the HTTP span, which also gives real token
+counts. Code deeper in the call chain adds spans to the thread's active trace through
+span(), which does nothing when no trace is active. finish() appends one JSON line to
+TRACE_FILE; beyond MAX_BYTES the file is rotated to TRACE_FILE + ".1", so the log holds
+at most twice that.
+"""
+import os
+import json
+import time
+import uuid
+import datetime
+import threading
+import contextlib
+
+HOME_DIR = os.path.expanduser("~")
+GLOBAL_CONFIG_DIR = os.path.join(HOME_DIR, ".config", "gemma-bridge")
+TRACE_FILE = os.path.join(GLOBAL_CONFIG_DIR, "traces.jsonl")
+
+# Overridable from the "tracing" config section
+ENABLED = True
+MAX_BYTES = 1024 * 1024
+
+OLLAMA_PHASES = (("load_duration", "ollama_load"), ("prompt_eval_duration", "prompt_eval"), ("eval_duration", "eval"))
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+class Trace:
+    def __init__(self, t0=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.t0 = time.perf_counter() if t0 is None else t0 # perf_counter() origin of the span offsets
+        self.timestamp = datetime.datetime.now().isoformat()
+        self.spans = []
+        self.fields = {}
+
+    def add(self, name, start, end, **fields):
+        """A span from perf_counter() readings."""
+        span = {"name": name, "start_ms": round((start - self.t0) * 1000, 3), "ms": round((end - start) * 1000, 3)}
+        span.update(fields)
+        self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), **fields)
+
+    def add_ollama(self, body, http_end=None):
+        """
+        Ollama's own phase durations (nanoseconds), laid out back to back so that eval ends
+        where the HTTP span ended. Token counts become trace fields.
+        """
+        end = time.perf_counter() if http_end is None else http_end
+        phases = [(name, body[key] / 1e9) for key, name in OLLAMA_PHASES if body.get(key)]
+        start = end - sum(seconds for _, seconds in phases)
+        for name, seconds in phases:
+            self.add(name, start, start + seconds, source="ollama")
+            start += seconds
+        for key in ("prompt_eval_count", "eval_count"):
+            if body.get(key) is not None:
+                self.fields[key] = body[key]
+
+    def record(self):
+        end = max((s["start_ms"] + s["ms"] for s in self.spans), default=0)
+        return dict(self.fields, id=self.id, timestamp=self.timestamp, total_ms=round(end, 3),
+                    spans=sorted(self.spans, key=lambda s: s["start_ms"]))
+
+    def finish(self, **fields):
+        """Writes the trace to the log (when tracing is enabled) and deactivates it."""
+        self.fields.update(fields)
+        if getattr(_local, "trace", None) is self:
+            _local.trace = None
+        if not ENABLED:
+            return None
+        record = self.record()
+        try:
+            write(record)
+        except OSError as e:
+            print(f"[!] Error writing trace: {e}")
+        return record
+
+def start(t0=None):
+    """Starts a trace and makes it the thread's active one."""
+    trace = Trace(t0)
+    _local.trace = trace
+    return trace
+
+def current():
+    return getattr(_local, "trace", None)
+
+def span(name, **fields):
+    """A span on the active trace, or a no-op."""
+    trace = current()
+    return trace.span(name, **fields) if trace is not None else contextlib.nullcontext()
+
+def write(record):
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _write_lock:
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_FILE) + len(line) > MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+        except FileNotFoundError:
+            pass
+        # O_APPEND keeps concurrent router processes' lines whole
+        with open(TRACE_FILE, "a") as f:
+            f.write(line)
+
+def read_recent(limit=20):
+    """The newest `limit` traces, oldest first (from the rotated file too when needed)."""
+    records = []
+    for path in (TRACE_FILE, TRACE_FILE + ".1"):
+        try:
+            with open(path, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue # A line cut short by a crash
+            if len(records) >= limit:
+                return records[::-1]
+    return records[::-1]